@@ -3,11 +3,47 @@ A series of utilities used across several pub-oapi-tools programs.
 These are mainly for connecting to various 3rd-party systems,
 (e.g.) the UCPMS reporting DB, eSchol DB, various APIs, etc.
 
-3rd-party packages required for each module are imported within the modules,
-Running 'import pub_oapi_tools_common' will import all 3rd-party packages.
+Importing the package is cheap: modules are loaded on first access
+(e.g. pub_oapi_tools_common.ror_api), and the 3rd-party packages each
+module needs (boto3, pyodbc, pymysql, requests, requests_toolbelt)
+are only imported when a function that uses them is first called.
 """
 
-# from pub_oapi_tools_common import aws_lambda
-# from pub_oapi_tools_common import pub_oapi_tools_db
-# from pub_oapi_tools_common import ucpms_db
-# from pub_oapi_tools_common import misc
+__all__ = [
+    'aws_cloudwatch_logs',
+    'aws_cloudwatch_metrics',
+    'aws_lambda',
+    'eschol_analytics_db',
+    'eschol_api',
+    'eschol_db',
+    'http_transport',
+    'janeway_db',
+    'misc',
+    'osti_elink_api',
+    'osti_elink_bulk',
+    'osti_gov_api',
+    'osti_gov_mirror',
+    'pdf_cache',
+    'pub_oapi_tools_db',
+    'pub_oapi_tools_db_class',
+    'rate_limit',
+    'ror_api',
+    'ror_offline',
+    'single_flight',
+    'sqlite_store',
+    'ucpms_db',
+]
+
+
+def __getattr__(name: str):
+    """
+    Imports submodules on first attribute access.
+    """
+    if name in __all__:
+        import importlib
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
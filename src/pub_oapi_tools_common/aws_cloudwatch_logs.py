@@ -1,5 +1,10 @@
+from __future__ import annotations
+
 from pub_oapi_tools_common.misc import log
-import boto3
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import boto3
 
 
 def get_logs_client(quiet: bool = False
@@ -9,6 +14,7 @@ def get_logs_client(quiet: bool = False
     :param quiet: Suppresses non-error logging output
     :return: A boto3 cloudwatch logs client
     """
+    import boto3
 
     if not quiet:
         log("INFO", __name__, "Retrieving the cloudwatch logs client from AWS.")
@@ -1,5 +1,10 @@
+from __future__ import annotations
+
 from pub_oapi_tools_common.misc import log
-import boto3
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import boto3
 
 
 def get_logs_client(quiet: bool = False,
@@ -12,6 +17,7 @@ def get_logs_client(quiet: bool = False,
     :param verbose: Prints extra debug info.
     :return: A boto3 cloudwatch client
     """
+    import boto3
 
     if not quiet:
         log("INFO", __name__, "Retrieving the cloudwatch client from AWS.")
@@ -26,7 +32,7 @@ def get_logs_client(quiet: bool = False,
 
 def put_metrics(namespace: str,
                 metrics_data: list,
-                client: boto3.client = get_logs_client(),
+                client: boto3.client = None,
                 quiet: bool = False
                 ):
     """
@@ -44,6 +50,9 @@ def put_metrics(namespace: str,
     :return: A response object
     """
 
+    if client is None:
+        client = get_logs_client(quiet=quiet)
+
     response = client.put_metric_data(
         MetricData=metrics_data,
         Namespace=namespace)
@@ -1,5 +1,4 @@
 from pub_oapi_tools_common.misc import log
-import boto3
 import json
 
 
@@ -41,6 +40,7 @@ def get_parameters(param_req: dict,
     :return: A dict formatted like
         {name_of_thing_1: [{name_A: val_A, name_B: val_B}], ...}
     """
+    import boto3
 
     if not quiet:
         log("INFO", __name__, "Retrieving parameters from AWS.")
@@ -4,8 +4,13 @@ MySQL DB. Note that the host of this DB will change
 every time a new analytics replica is spun up.
 """
 
-import pymysql
+from __future__ import annotations
+
 from pub_oapi_tools_common.misc import log
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pymysql
 
 
 def get_connection(creds: dict = None,
@@ -30,6 +35,7 @@ def get_connection(creds: dict = None,
     :param quiet: Suppresses non-error logging output
     :return: An open PyMySQL connection.
     """
+    import pymysql
 
     if not quiet:
         log("INFO", __name__,
@@ -1,5 +1,58 @@
+from __future__ import annotations
+
 from pub_oapi_tools_common.misc import log
-import requests
+from pub_oapi_tools_common.misc import validate_creds
+from pub_oapi_tools_common import http_transport
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import requests
+
+
+def get_creds(env: str, quiet: bool = False) -> dict:
+    """
+    Retrieves the eSchol API creds for an env from Lambda.
+
+    :param env: specify 'prod' or 'qa'
+    :param quiet: Suppresses non-error logging output.
+    :return: A dict with endpoint, priv-key, and cookie
+    """
+    from pub_oapi_tools_common import aws_lambda
+    param_req = {
+        'eschol_api': {
+            'folder': 'pub-oapi-tools/eschol-api',
+            'env': env,
+            'names': ['endpoint', 'priv-key', 'cookie']}}
+    creds = aws_lambda.get_parameters(param_req=param_req, quiet=quiet)
+    return creds['eschol_api']
+
+
+def check_query(query: str, variables: dict):
+    """
+    Halts if the query is missing, and warns if
+    it uses variables that weren't supplied.
+    """
+    if not query:
+        log("ERROR", __name__, "Must supply a query.")
+
+    if '$' in query and not variables:
+        log("WARN", __name__,
+            ("Looks like you're sending a query that uses a $, "
+             "but you haven't supplied a 'variables' parameter. "
+             "Please ensure your variables are encoded correctly "
+             "in the query itself."))
+
+
+def build_payload(query: str, variables: dict = None) -> dict:
+    """
+    Packages the query and vars for the request body.
+    Variables are sent as the GraphQL variable $input.
+    """
+    if variables:
+        return {'query': query,
+                'variables': {'input': variables}}
+    else:
+        return {'query': query}
 
 
 def send_query(creds: dict = None,
@@ -37,43 +90,22 @@ def send_query(creds: dict = None,
             ("Must provide either 'creds', or 'env'. "
              "Otherwise, we don't know what you want to connect to."))
 
-    if not query:
-        log("ERROR", __name__, "Must supply a query.")
-
-    if '$' in query and not variables:
-        log("WARN", __name__,
-            ("Looks like you're sending a query that uses a $, "
-             "but you haven't supplied a 'variables' parameter. "
-             "Please ensure your variables are encoded correctly "
-             "in the query itself."))
+    check_query(query, variables)
 
     # If user supplies only the env, get the creds from Lambda.
     if not creds:
-        from pub_oapi_tools_common import aws_lambda
-        param_req = {
-            'eschol_api': {
-                'folder': 'pub-oapi-tools/eschol-api',
-                'env': env,
-                'names': ['endpoint', 'priv-key', 'cookie']}}
-        creds = aws_lambda.get_parameters(param_req=param_req)
-        creds = creds['eschol_api']
-
-    # Set headers and cookies
-    headers = dict(PRIVILEGED=creds['priv-key'])
-    cookies = dict(ACCESS_COOKIE=creds['cookie'])
+        creds = get_creds(env)
 
     # Package the query and vars
-    if variables:
-        json = {'query': query,
-                'variables': {'input': variables}}
-    else:
-        json = {'query': query}
+    json = build_payload(query, variables)
 
-    # Send the request
-    response = requests.post(
-        url=creds['endpoint'],
-        headers=headers,
-        cookies=cookies,
+    # Send the request, with the creds' header and cookie.
+    # Queries are retried, mutations aren't.
+    response = _get_transport().request(
+        'POST', creds['endpoint'],
+        endpoint='graphql',
+        idempotent=not _has_mutation(query),
+        **_auth_kwargs(creds),
         json=json)
 
     if verbose:
@@ -81,3 +113,727 @@ def send_query(creds: dict = None,
         log("DEBUG", __name__, f"eSchol API response reason: {response.reason}")
 
     return response
+
+
+def _auth_kwargs(creds: dict) -> dict:
+    """
+    :return: The PRIVILEGED header and ACCESS_COOKIE for a request.
+        They're sent per request, not set on a (possibly shared) session.
+    """
+    return {'headers': {'PRIVILEGED': creds['priv-key']},
+            'cookies': {'ACCESS_COOKIE': creds['cookie']}}
+
+
+def _has_mutation(query: str) -> bool:
+    """
+    Whether a GraphQL document contains a mutation. Only documents
+    without one are retried, as a retried mutation could run twice.
+    """
+    import re
+
+    top_level = ''.join(char if depth == 0 else ' '
+                        for _, char, depth in _scan_graphql(query))
+    return re.search(r"(?<![\w$])mutation\b", top_level) is not None
+
+
+_transport = None
+
+
+def _get_transport() -> http_transport.HttpTransport:
+    """
+    :return: The HttpTransport shared by send_query() calls,
+        created on first use.
+    """
+    global _transport
+    if _transport is None:
+        _transport = http_transport.HttpTransport.for_upstream('eschol', quiet=True)
+    return _transport
+
+
+# ----------------------------------------
+# Batching helpers
+# Several single-operation GraphQL documents are merged into one,
+# with each top-level field aliased "op<n>__<field>" and each
+# variable renamed "$<var>__op<n>", so results can be split back out.
+
+def _scan_graphql(text: str):
+    """
+    A generator over a GraphQL document yielding
+    (position, char, depth) for every character outside of
+    strings and comments. Depth counts open braces and parens.
+    """
+    depth = 0
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if text.startswith('"""', i):
+            end = text.find('"""', i + 3)
+            i = len(text) if end == -1 else end + 3
+            continue
+        elif char == '"':
+            i += 1
+            while i < len(text) and text[i] != '"':
+                i += 2 if text[i] == '\\' else 1
+            i += 1
+            continue
+        elif char == '#':
+            end = text.find('\n', i)
+            i = len(text) if end == -1 else end + 1
+            continue
+        elif char in '{(':
+            yield i, char, depth
+            depth += 1
+        elif char in '})':
+            depth -= 1
+            yield i, char, depth
+        else:
+            yield i, char, depth
+        i += 1
+
+
+def _rename_variables(text: str, suffix: str) -> str:
+    """
+    Renames every $variable outside of strings to $variable<suffix>.
+    """
+    import re
+
+    insert_at = []
+    for pos, char, depth in _scan_graphql(text):
+        if char == '$':
+            name = re.match(r"[A-Za-z_]\w*", text[pos + 1:])
+            if name:
+                insert_at.append(pos + 1 + name.end())
+
+    for pos in reversed(insert_at):
+        text = text[:pos] + suffix + text[pos:]
+    return text
+
+
+def _split_operation(query: str) -> tuple:
+    """
+    Splits a single-operation GraphQL document into its
+    operation type, variable definitions and selection set.
+
+    :return: (operation type, variable definitions without parens,
+        selection set without braces)
+    """
+    import re
+
+    # Top-level text before the variables or selection set,
+    # without comments, e.g. "mutation Update"
+    header = []
+    last_pos = -1
+
+    var_defs = ''
+    selection_start = None
+    paren_start = None
+    for pos, char, depth in _scan_graphql(query):
+        if paren_start is None and selection_start is None and char not in '({':
+            header.append(char if pos == last_pos + 1 else f" {char}")
+            last_pos = pos
+        elif depth == 0 and char == '(' and selection_start is None:
+            paren_start = pos
+        elif depth == 0 and char == ')' and selection_start is None:
+            var_defs = query[paren_start + 1:pos]
+        elif depth == 0 and char == '{' and selection_start is None:
+            selection_start = pos
+        elif depth == 0 and char == '}' and selection_start is not None:
+            remainder = query[pos + 1:].strip()
+            if remainder:
+                log("ERROR", __name__,
+                    "Batched queries must contain a single operation "
+                    f"without fragments. Found: {remainder[:50]}")
+
+            keyword = re.match(r"\s*([A-Za-z_]\w*)", ''.join(header))
+            op_type = keyword.group(1) if keyword else 'query'
+            if op_type not in ('query', 'mutation'):
+                log("ERROR", __name__,
+                    f"Only queries and mutations can be batched. Found: {op_type}")
+            return op_type, var_defs, query[selection_start + 1:pos]
+
+    log("ERROR", __name__, f"Couldn't parse the query for batching: {query[:50]}")
+
+
+def _alias_top_level_fields(selection: str, prefix: str) -> str:
+    """
+    Prefixes the alias of every top-level field in a selection set,
+    adding an alias for fields that don't have one.
+    """
+    import re
+
+    edits = []
+    skip_until = -1
+    awaiting_field = False
+    for pos, char, depth in _scan_graphql(selection):
+        if pos < skip_until or depth != 0:
+            continue
+        if char == '.':
+            log("ERROR", __name__,
+                "Batched queries can't use fragments at the top level.")
+        elif char == '@':
+            # Skip directive names, e.g. @include
+            name = re.match(r"[A-Za-z_]\w*", selection[pos + 1:])
+            skip_until = pos + 1 + (name.end() if name else 0)
+        elif re.match(r"[A-Za-z_]", char):
+            name = re.match(r"[A-Za-z_]\w*", selection[pos:]).group(0)
+            skip_until = pos + len(name)
+            if awaiting_field:
+                # The field name following an existing alias
+                awaiting_field = False
+            elif re.match(r"\s*:", selection[skip_until:]):
+                edits.append((pos, prefix))
+                awaiting_field = True
+            else:
+                edits.append((pos, f"{prefix}{name}: "))
+
+    for pos, text in reversed(edits):
+        selection = selection[:pos] + text + selection[pos:]
+    return selection
+
+
+def _split_batch_result(body: dict, num_ops: int) -> list:
+    """
+    Splits a merged response body back into one
+    {'data': ..., 'errors': [...]} dict per operation.
+    """
+    import re
+
+    results = [{'data': {}, 'errors': []} for _ in range(num_ops)]
+
+    for key, value in (body.get('data') or {}).items():
+        match = re.match(r"op(\d+)__(.*)", key)
+        if match:
+            results[int(match.group(1))]['data'][match.group(2)] = value
+
+    for error in body.get('errors') or []:
+        path = error.get('path') or []
+        match = re.match(r"op(\d+)__(.*)", str(path[0])) if path else None
+        if match:
+            op_error = dict(error)
+            op_error['path'] = [match.group(2)] + list(path[1:])
+            results[int(match.group(1))]['errors'].append(op_error)
+        else:
+            # Document-level errors apply to every operation
+            for result in results:
+                result['errors'].append(error)
+
+    if body.get('data') is None:
+        for result in results:
+            result['data'] = None
+
+    return results
+
+
+def merge_operations(operations: list) -> dict:
+    """
+    Merges single-operation GraphQL documents into one request payload.
+    All operations must be of the same type (query or mutation).
+
+    :param operations: A list of (query, variables) tuples, with
+        variables as for send_query().
+    :return: A dict with 'query' and 'variables' keys.
+    """
+    merged_types = set()
+    merged_defs = []
+    merged_selections = []
+    merged_variables = {}
+
+    for n, (query, variables) in enumerate(operations):
+        op_type, var_defs, selection = _split_operation(query)
+        merged_types.add(op_type)
+
+        suffix = f"__op{n}"
+        if var_defs.strip():
+            merged_defs.append(_rename_variables(var_defs, suffix))
+        merged_selections.append(
+            _alias_top_level_fields(_rename_variables(selection, suffix), f"op{n}__"))
+
+        payload = build_payload(query, variables)
+        for name, value in payload.get('variables', {}).items():
+            merged_variables[f"{name}{suffix}"] = value
+
+    if len(merged_types) > 1:
+        log("ERROR", __name__, "Can't merge queries and mutations in one batch.")
+
+    var_defs = f"({', '.join(merged_defs)})" if merged_defs else ''
+    selections = '\n'.join(merged_selections)
+    merged = {'query': f"{merged_types.pop()} Batch{var_defs} {{\n{selections}\n}}"}
+    if merged_variables:
+        merged['variables'] = merged_variables
+
+    return merged
+
+
+def _get_path(data: dict, path: str):
+    """
+    Follows a dot-separated path of keys into a dict,
+    returning None if any key is missing.
+    """
+    for key in path.split('.'):
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+class EscholApi:
+
+    def __init__(self,
+                 env: str = None,
+                 creds: dict = None,
+                 pool_size: int = 10,
+                 retries: int = 3,
+                 backoff_factor: float = 0.5,
+                 transport: http_transport.HttpTransport = None,
+                 quiet: bool = False,
+                 verbose: bool = False):
+        """
+        A client for the eSchol API, for sending many queries.
+        Creds are resolved once, and requests share a pooled
+        keep-alive session. The creds' header and cookie are sent
+        with each request, not set on the session, so a transport
+        can be shared with other clients. 429 and 5XX responses
+        to queries are retried with exponential backoff;
+        mutations aren't retried, so they can't run twice.
+        Must provide either an env string or a creds dict.
+
+        :param env: specify 'prod' or 'qa'
+        :param creds: Must include endpoint, cookie, and priv-key
+        :param pool_size: Max open connections to the API.
+        :param retries: Max retries for a failed request.
+        :param backoff_factor: Base delay (seconds) for retry backoff.
+        :param transport: An http_transport.HttpTransport to send requests
+            with, instead of one built from pool_size, retries, and
+            backoff_factor (with TRANSPORT_SETTINGS['eschol'] applied).
+        :param quiet: Suppresses non-error logging output.
+        :param verbose: Prints extra debug info.
+        """
+
+        # Check for env or creds
+        if not (env or creds):
+            log("ERROR", __name__, "Must provide either env or creds.")
+
+        # If creds supplied, validate
+        elif creds:
+            validation_keys = ['endpoint', 'priv-key', 'cookie']
+            validate_creds(creds=creds, validation_keys=validation_keys)
+
+        # If env supplied, connect to lambda for creds
+        else:
+            creds = get_creds(env, quiet=quiet)
+
+        self.creds = creds
+        self.quiet = quiet
+        self.verbose = verbose
+
+        self.transport = transport if transport else http_transport.HttpTransport.for_upstream(
+            'eschol',
+            pool_size=pool_size,
+            retry_policy=http_transport.RetryPolicy(
+                retries=retries, backoff_factor=backoff_factor),
+            quiet=quiet)
+        self.stats = self.transport.stats
+        self.session = self.transport.session
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Closes the pooled connections.
+        """
+        self.transport.close()
+
+    @property
+    def last_latency(self) -> float:
+        """
+        :return: Seconds taken by the most recent request, including retries.
+        """
+        return self.stats.last_seconds
+
+    def send_query(self,
+                   query: str,
+                   variables: dict = None) -> requests.Response:
+        """
+        Sends a request to the eSchol API.
+
+        :param query: A json string
+        :param variables: Python dicts is expected here, but stick to
+            int and str, as it's likely more complex data types
+            may cause problems.
+        :return: A Response object from requests.
+            See here: https://requests.readthedocs.io/en/latest/api/#requests.Response
+        """
+
+        check_query(query, variables)
+
+        response = self.transport.request(
+            'POST', self.creds['endpoint'],
+            endpoint='graphql',
+            idempotent=not _has_mutation(query),
+            **_auth_kwargs(self.creds),
+            json=build_payload(query, variables))
+
+        if self.verbose:
+            log("DEBUG", __name__,
+                f"eSchol API response: {response.status_code} {response.reason} "
+                f"({self.last_latency:.3f}s)")
+
+        return response
+
+    def send_batch(self,
+                   operations: list,
+                   max_batch_size: int = 50,
+                   mode: str = "alias") -> list:
+        """
+        Sends many operations in as few requests as possible.
+
+        In "alias" mode (default), the operations in each batch are merged
+        into one GraphQL document, see merge_operations(). Each operation
+        must be a single query or mutation without fragments. If a merged
+        batch fails as a whole (e.g. one operation doesn't validate),
+        its operations are resent one at a time so errors stay separate.
+        Mutation batches are only resent if the response shows nothing
+        ran (a parse or validation error), so no mutation runs twice.
+
+        In "array" mode, each batch is sent as a JSON array of payloads.
+        Only use this if the server supports array batching.
+
+        :param operations: A list of (query, variables) tuples, with
+            variables as for send_query().
+        :param max_batch_size: Max operations per request.
+        :param mode: "alias" or "array"
+        :return: A list with one {'data': ..., 'errors': [...]}
+            dict per operation, in the same order as the input.
+        """
+
+        if mode not in ("alias", "array"):
+            log("ERROR", __name__, f"Unknown batch mode: {mode}")
+
+        if not self.quiet:
+            log("INFO", __name__,
+                f"Sending {len(operations)} operations to the eSchol API "
+                f"in batches of up to {max_batch_size}.")
+
+        results = []
+        for start in range(0, len(operations), max_batch_size):
+            batch = operations[start:start + max_batch_size]
+            if mode == "array":
+                results += self._send_array_batch(batch)
+            else:
+                results += self._send_alias_batch(batch)
+
+        return results
+
+    def _post_payload(self, payload) -> requests.Response:
+        payloads = payload if isinstance(payload, list) else [payload]
+        return self.transport.request(
+            'POST', self.creds['endpoint'],
+            endpoint='graphql',
+            idempotent=not any(_has_mutation(p['query']) for p in payloads),
+            **_auth_kwargs(self.creds),
+            json=payload)
+
+    @staticmethod
+    def _http_error(response: requests.Response) -> dict:
+        return {'message': f"HTTP {response.status_code} {response.reason}"}
+
+    def _send_alias_batch(self, batch: list) -> list:
+        import requests
+
+        response = self._post_payload(merge_operations(batch))
+
+        try:
+            body = response.json()
+        except requests.exceptions.JSONDecodeError:
+            body = None
+
+        if not isinstance(body, dict):
+            results = [{'data': None, 'errors': [self._http_error(response)]}
+                       for _ in batch]
+        else:
+            results = _split_batch_result(body, len(batch))
+
+        # A document-level failure affects every operation: retry singly.
+        # Mutations may already have run unless the response has no 'data'
+        # key at all, which GraphQL uses for parse and validation errors.
+        document_failed = all(r['data'] is None for r in results) \
+            and any(r['errors'] for r in results)
+        is_query = _split_operation(batch[0][0])[0] == 'query'
+        nothing_ran = isinstance(body, dict) and 'data' not in body
+        if document_failed and len(batch) > 1 and (is_query or nothing_ran):
+            if self.verbose:
+                log("DEBUG", __name__,
+                    "Merged batch failed, resending its operations one at a time.")
+            results = []
+            for operation in batch:
+                results += self._send_alias_batch([operation])
+
+        return results
+
+    def _send_array_batch(self, batch: list) -> list:
+        import requests
+
+        response = self._post_payload(
+            [build_payload(query, variables) for query, variables in batch])
+
+        try:
+            body = response.json()
+        except requests.exceptions.JSONDecodeError:
+            body = None
+
+        if not (isinstance(body, list) and len(body) == len(batch)):
+            return [{'data': None, 'errors': [self._http_error(response)]}
+                    for _ in batch]
+
+        return [{'data': result.get('data'), 'errors': result.get('errors') or []}
+                for result in body]
+
+    def paginate(self,
+                 query: str,
+                 variables: dict,
+                 nodes_path: str,
+                 cursor_path: str = None,
+                 cursor_variable: str = "more",
+                 offset_variable: str = None,
+                 page_size: int = None,
+                 prefetch: bool = True):
+        """
+        A generator yielding the nodes of a paginated query lazily,
+        page by page. While the current page is being consumed,
+        the next page can be fetched in the background.
+
+        Paths are dot-separated keys within the response 'data',
+        e.g. nodes_path='unit.items.nodes', cursor_path='unit.items.more'.
+
+        Cursor pagination: set cursor_path. The cursor from each page is
+        sent back as variables[cursor_variable] until it comes back empty.
+
+        Offset pagination: set offset_variable (and ideally page_size).
+        variables[offset_variable] is advanced by the number of nodes
+        received until a short or empty page is returned.
+
+        :param query: A json string, using the variable $input
+        :param variables: The input variables dict (see send_query),
+            including any page-size variable. Not modified.
+        :param nodes_path: Path to the list of nodes in each page.
+        :param cursor_path: Path to the next-page cursor.
+        :param cursor_variable: Input variable that takes the cursor.
+        :param offset_variable: Input variable that takes the offset.
+        :param page_size: Expected nodes per page, for offset pagination.
+        :param prefetch: Fetch the next page while the current one is consumed.
+        :return: A generator of node dicts.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        if not (cursor_path or offset_variable):
+            log("ERROR", __name__,
+                "Must provide either cursor_path or offset_variable.")
+
+        variables = dict(variables) if variables else {}
+        if offset_variable:
+            variables.setdefault(offset_variable, 0)
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+
+            def fetch(page_variables):
+                if prefetch:
+                    return executor.submit(self._get_page, query, page_variables,
+                                           nodes_path, cursor_path)
+                return self._get_page(query, page_variables, nodes_path, cursor_path)
+
+            page = fetch(variables)
+            page_num = 1
+            while page is not None:
+                nodes, cursor = page.result() if prefetch else page
+
+                if self.verbose:
+                    log("DEBUG", __name__,
+                        f"Page {page_num}: {len(nodes)} nodes, cursor: {cursor}")
+
+                # Work out the next page and request it before yielding
+                if not nodes:
+                    page = None
+                elif cursor_path:
+                    variables = dict(variables, **{cursor_variable: cursor})
+                    page = fetch(variables) if cursor else None
+                else:
+                    variables = dict(variables, **{
+                        offset_variable: variables[offset_variable] + len(nodes)})
+                    short_page = page_size and len(nodes) < page_size
+                    page = None if short_page else fetch(variables)
+
+                for node in nodes:
+                    yield node
+                page_num += 1
+
+    def _get_page(self,
+                  query: str,
+                  variables: dict,
+                  nodes_path: str,
+                  cursor_path: str = None) -> tuple:
+        """
+        Fetches a single page for paginate().
+
+        :return: (list of nodes, next cursor or None)
+        """
+        response = self.send_query(query, variables)
+        if not response.ok:
+            log("ERROR", __name__,
+                f"Non-2XX response while paginating: "
+                f"{response.status_code} {response.text[:200]}")
+
+        body = response.json()
+        if body.get('errors'):
+            log("ERROR", __name__, f"Errors while paginating: {body['errors']}")
+
+        nodes = _get_path(body.get('data'), nodes_path) or []
+        cursor = _get_path(body.get('data'), cursor_path) if cursor_path else None
+        return nodes, cursor
+
+
+class AsyncEscholApi:
+
+    def __init__(self,
+                 env: str = None,
+                 creds: dict = None,
+                 concurrency: int = 10,
+                 requests_per_second: float = None,
+                 retries: int = 3,
+                 backoff_factor: float = 0.5,
+                 quiet: bool = False,
+                 verbose: bool = False):
+        """
+        An asyncio client for the eSchol API, for large backfills.
+        Creds, headers and retries are handled as in EscholApi;
+        requests run on a thread pool sharing one pooled session,
+        so no extra HTTP dependency is needed.
+        Must provide either an env string or a creds dict.
+
+        Usage:
+            async with AsyncEscholApi(env='qa', concurrency=20,
+                                      requests_per_second=50) as api:
+                async for n, response in api.map(operations):
+                    ...
+
+        :param env: specify 'prod' or 'qa'
+        :param creds: Must include endpoint, cookie, and priv-key
+        :param concurrency: Max requests in flight at once.
+        :param requests_per_second: Sustained request rate limit
+            (token bucket), applied to every attempt including
+            retries. None for no limit.
+        :param retries: Max retries for a failed request.
+        :param backoff_factor: Base delay (seconds) for retry backoff.
+        :param quiet: Suppresses non-error logging output.
+        :param verbose: Prints extra debug info.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from pub_oapi_tools_common.rate_limit import TokenBucket
+
+        # Retries happen inside the worker threads, so the limiter is
+        # taken by the transport before each attempt, not by send_query()
+        transport = http_transport.HttpTransport.for_upstream(
+            'eschol',
+            pool_size=concurrency,
+            retry_policy=http_transport.RetryPolicy(
+                retries=retries, backoff_factor=backoff_factor),
+            rate_limiter=TokenBucket(requests_per_second) if requests_per_second else None,
+            quiet=quiet)
+        self.api = EscholApi(env=env, creds=creds, transport=transport,
+                             quiet=quiet, verbose=verbose)
+        self.stats = self.api.stats
+        self.rate_limiter = transport.rate_limiter
+        self.quiet = quiet
+        self.verbose = verbose
+
+        self.concurrency = concurrency
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+        # Created on first use, inside the running event loop
+        self.semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    def close(self):
+        """
+        Shuts down the worker threads and closes the pooled connections.
+        Blocks until in-flight requests finish, so from a coroutine
+        use aclose() instead.
+        """
+        self.executor.shutdown(wait=True)
+        self.api.close()
+
+    async def aclose(self):
+        """
+        Like close(), but waits for in-flight requests
+        without blocking the event loop.
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.close)
+
+    async def send_query(self,
+                         query: str,
+                         variables: dict = None) -> requests.Response:
+        """
+        Sends a request to the eSchol API, waiting for a free
+        concurrency slot first. Rate-limit tokens are waited for
+        in the worker thread, before each attempt.
+
+        :param query: A json string
+        :param variables: Python dict, as for EscholApi.send_query()
+        :return: A Response object from requests.
+        """
+        import asyncio
+
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.executor, self.api.send_query, query, variables)
+
+    async def map(self, operations):
+        """
+        Sends many operations concurrently, yielding results as
+        they complete (not in input order). Only `concurrency`
+        operations are scheduled at a time, so the input can be
+        a long or lazy iterable.
+
+        :param operations: An iterable of (query, variables) tuples.
+        :return: An async generator of (index, response) tuples,
+            where index is the operation's position in the input.
+        """
+        import asyncio
+
+        operations = iter(enumerate(operations))
+        pending = {}
+
+        def schedule():
+            for n, (query, variables) in operations:
+                task = asyncio.ensure_future(self.send_query(query, variables))
+                pending[task] = n
+                if len(pending) >= self.concurrency:
+                    break
+
+        schedule()
+        try:
+            while pending:
+                done, _ = await asyncio.wait(
+                    pending.keys(), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    n = pending.pop(task)
+                    yield n, task.result()
+                schedule()
+        finally:
+            for task in pending:
+                task.cancel()
@@ -2,8 +2,13 @@
 Functions for working with the eScholarship MySQL DB
 """
 
-import pymysql
+from __future__ import annotations
+
 from pub_oapi_tools_common.misc import log
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pymysql
 
 
 def get_connection(creds: dict = None,
@@ -28,6 +33,7 @@ def get_connection(creds: dict = None,
     :param quiet: Suppresses non-error logging output
     :return: An open PyMySQL connection.
     """
+    import pymysql
 
     if not quiet:
         log("INFO", __name__,
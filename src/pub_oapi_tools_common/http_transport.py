@@ -0,0 +1,443 @@
+"""
+Shared HTTP helpers for the API client modules:
+pooled requests sessions, retries with backoff, and request stats.
+
+HttpTransport bundles these, and is what the API clients send
+requests through. Per-upstream settings in TRANSPORT_SETTINGS
+override the clients' defaults, e.g. to tune the ROR client:
+
+    http_transport.TRANSPORT_SETTINGS['ror'] = {'pool_size': 32,
+                                                'timeout': (5, 30)}
+"""
+
+from __future__ import annotations
+
+from pub_oapi_tools_common.misc import log
+from threading import Lock
+from time import perf_counter, sleep
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import requests
+
+# HttpTransport settings per upstream ('eschol', 'elink', 'osti_gov',
+# 'pdf_cache', 'ror'), applied by HttpTransport.for_upstream() over
+# the client's defaults.
+TRANSPORT_SETTINGS = {}
+
+
+def get_session(pool_size: int = 10) -> requests.Session:
+    """
+    Creates a requests Session with a keep-alive connection pool.
+    Retries are handled by send_request(), not by the adapter.
+
+    :param pool_size: Max connections kept open per host.
+        Set this to at least the number of threads sharing the session.
+    :return: A requests.Session
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size,
+                          pool_maxsize=pool_size,
+                          max_retries=0)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class RetryPolicy:
+
+    def __init__(self,
+                 retries: int = 3,
+                 backoff_factor: float = 0.5,
+                 max_backoff: float = 60.0,
+                 retry_statuses: tuple = (429, 500, 502, 503, 504)):
+        """
+        Decides which failed requests are retried, and how long to wait.
+
+        :param retries: Max number of retries after the first attempt.
+        :param backoff_factor: Delay before retry n is
+            backoff_factor * 2 ** (n - 1) seconds.
+        :param max_backoff: Upper limit for any single delay,
+            including delays requested by a Retry-After header.
+        :param retry_statuses: HTTP status codes which are retried.
+        """
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.retry_statuses = retry_statuses
+
+    def is_retryable(self,
+                     response: requests.Response = None,
+                     exception: Exception = None,
+                     idempotent: bool = True) -> bool:
+        """
+        Non-idempotent requests (e.g. POSTs creating records) are only
+        retried when the server can't have processed them:
+        connect timeouts and 429 responses.
+
+        :param response: The response, if one was received.
+        :param exception: The exception raised, if no response was received.
+        :param idempotent: Whether the request is safe to send twice.
+        :return: True if the request should be retried.
+        """
+        import requests
+
+        if exception is not None:
+            if isinstance(exception, requests.exceptions.ConnectTimeout):
+                return True
+            return idempotent and isinstance(
+                exception, (requests.exceptions.ConnectionError,
+                            requests.exceptions.Timeout))
+
+        if response.status_code == 429:
+            return True
+        return idempotent and response.status_code in self.retry_statuses
+
+    def get_delay(self,
+                  attempt: int,
+                  response: requests.Response = None) -> float:
+        """
+        Honours the Retry-After header (seconds or HTTP-date)
+        if present, otherwise uses exponential backoff.
+
+        :param attempt: The retry number, starting at 1.
+        :param response: The failed response, if any.
+        :return: Seconds to wait before the retry.
+        """
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after:
+            delay = parse_retry_after(retry_after)
+            if delay is not None:
+                return min(delay, self.max_backoff)
+
+        return min(self.backoff_factor * 2 ** (attempt - 1), self.max_backoff)
+
+
+def parse_retry_after(value: str):
+    """
+    :param value: A Retry-After header value, either
+        delay-seconds or an HTTP-date.
+    :return: Seconds to wait, or None if the value can't be parsed.
+    """
+    from datetime import datetime, timezone
+    from email.utils import parsedate_to_datetime
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class RequestStats:
+
+    def __init__(self):
+        """
+        Thread-safe latency, retry and error counters, kept per endpoint.
+        """
+        self.lock = Lock()
+        self.endpoints = {}
+        self.last_seconds = None
+
+    def record(self,
+               endpoint: str,
+               seconds: float,
+               retries: int = 0,
+               error: bool = False):
+        """
+        :param endpoint: A short name for the endpoint, e.g. "records".
+        :param seconds: Wall time of the request, including retries.
+        :param retries: Number of retries the request needed.
+        :param error: True if the request ultimately failed.
+        """
+        with self.lock:
+            ep = self._endpoint(endpoint)
+            ep['requests'] += 1
+            ep['retries'] += retries
+            ep['errors'] += 1 if error else 0
+            ep['total_seconds'] += seconds
+            ep['max_seconds'] = max(ep['max_seconds'], seconds)
+            self.last_seconds = seconds
+
+    def _endpoint(self, endpoint: str) -> dict:
+        return self.endpoints.setdefault(endpoint, {
+            'requests': 0, 'retries': 0, 'errors': 0,
+            'total_seconds': 0.0, 'max_seconds': 0.0,
+            'bytes_sent': 0, 'bytes_received': 0})
+
+    def record_bytes(self,
+                     endpoint: str,
+                     sent: int = 0,
+                     received: int = 0):
+        """
+        :param endpoint: A short name for the endpoint, e.g. "records".
+        :param sent: Request body bytes.
+        :param received: Response body bytes.
+        """
+        with self.lock:
+            ep = self._endpoint(endpoint)
+            ep['bytes_sent'] += sent
+            ep['bytes_received'] += received
+
+    def summary(self) -> dict:
+        """
+        :return: A dict of {endpoint: {requests, retries, errors,
+            total_seconds, mean_seconds, max_seconds,
+            bytes_sent, bytes_received}}
+        """
+        with self.lock:
+            summary = {}
+            for endpoint, ep in self.endpoints.items():
+                summary[endpoint] = dict(ep)
+                summary[endpoint]['mean_seconds'] = \
+                    ep['total_seconds'] / ep['requests'] if ep['requests'] else 0.0
+            return summary
+
+
+def send_request(session: requests.Session,
+                 method: str,
+                 url: str,
+                 retry_policy: RetryPolicy = None,
+                 stats: RequestStats = None,
+                 endpoint: str = None,
+                 idempotent: bool = True,
+                 kwargs_factory=None,
+                 rate_limiter=None,
+                 quiet: bool = False,
+                 **kwargs) -> requests.Response:
+    """
+    Sends a request through a session, retrying failures
+    according to the retry policy and recording stats.
+
+    :param session: A requests.Session, see get_session().
+    :param method: HTTP method, e.g. "GET"
+    :param url: The request URL.
+    :param retry_policy: A RetryPolicy. If None, no retries are made.
+    :param stats: A RequestStats to record latency and retries in.
+    :param endpoint: Name the request is recorded under. Defaults to the URL.
+    :param idempotent: Whether the request is safe to send twice.
+    :param kwargs_factory: A callable returning a dict of extra kwargs
+        for session.request(), called before every attempt. Use this
+        for request bodies that can only be read once (e.g. streams).
+        If it raises a retryable requests exception, the attempt is
+        retried like a failed request.
+    :param rate_limiter: A rate_limit.TokenBucket or AdaptiveRateLimiter,
+        acquired before and released after every attempt.
+    :param quiet: Suppresses non-error logging output.
+    :param kwargs: Passed to session.request()
+    :return: The last response received. If retries are exhausted,
+        this may be a non-2XX response.
+    """
+    import requests
+
+    retries = retry_policy.retries if retry_policy else 0
+    endpoint = endpoint if endpoint else url
+    start = perf_counter()
+    attempt = 0
+
+    while True:
+        response = None
+        try:
+            attempt_kwargs = dict(kwargs, **kwargs_factory()) if kwargs_factory else kwargs
+        except requests.exceptions.RequestException as e:
+            # The request body couldn't be built (e.g. the download feeding
+            # a streamed upload failed). Nothing was sent, so this is
+            # retried as if idempotent.
+            if isinstance(e, requests.exceptions.HTTPError) and e.response is not None:
+                response = e.response
+                response.close()
+                retryable = retry_policy and retry_policy.is_retryable(response=response)
+            else:
+                retryable = retry_policy and isinstance(
+                    e, (requests.exceptions.ChunkedEncodingError,
+                        requests.exceptions.ConnectionError,
+                        requests.exceptions.Timeout))
+            if attempt >= retries or not retryable:
+                if stats:
+                    stats.record(endpoint, perf_counter() - start,
+                                 retries=attempt, error=True)
+                raise
+            attempt += 1
+            delay = retry_policy.get_delay(attempt, response)
+            if not quiet:
+                log("WARN", __name__,
+                    f"{method} {endpoint} failed to build the request ({e}), "
+                    f"retry {attempt}/{retries} in {delay:.1f}s")
+            sleep(delay)
+            continue
+
+        if rate_limiter:
+            rate_limiter.acquire()
+        exception = None
+        try:
+            response = session.request(method, url, **attempt_kwargs)
+        except requests.exceptions.RequestException as e:
+            exception = e
+        finally:
+            # Free the limiter's slot whatever happened, or it leaks
+            if rate_limiter:
+                rate_limiter.release(response)
+
+        if exception is not None:
+            if attempt >= retries or not retry_policy.is_retryable(
+                    exception=exception, idempotent=idempotent):
+                if stats:
+                    stats.record(endpoint, perf_counter() - start,
+                                 retries=attempt, error=True)
+                raise exception
+        else:
+            if attempt >= retries or not retry_policy.is_retryable(
+                    response=response, idempotent=idempotent):
+                if stats:
+                    stats.record(endpoint, perf_counter() - start,
+                                 retries=attempt, error=not response.ok)
+                return response
+            # Release the connection back to the pool before retrying
+            response.close()
+
+        attempt += 1
+        delay = retry_policy.get_delay(attempt, response)
+        if not quiet:
+            reason = exception if exception else f"HTTP {response.status_code}"
+            log("WARN", __name__,
+                f"{method} {endpoint} failed ({reason}), "
+                f"retry {attempt}/{retries} in {delay:.1f}s")
+        sleep(delay)
+
+
+def _body_size(body) -> int:
+    """
+    :return: The size of a request body, or 0 if it's a stream
+        of unknown length.
+    """
+    if isinstance(body, (bytes, str)):
+        return len(body)
+    length = getattr(body, 'len', None)
+    return length if isinstance(length, int) else 0
+
+
+class HttpTransport:
+
+    def __init__(self,
+                 pool_size: int = 10,
+                 timeout: tuple = (10, 60),
+                 retry_policy: RetryPolicy = None,
+                 rate_limiter=None,
+                 headers: dict = None,
+                 request_hooks: list = None,
+                 response_hooks: list = None,
+                 quiet: bool = False):
+        """
+        Sends an API client's requests: a pooled session (requests keeps
+        a separate keep-alive pool per host), default timeouts, gzip and
+        deflate compression, retries, rate limiting, and stats (latency,
+        retries, errors and bytes, per endpoint).
+
+        Clients create their transport with for_upstream(), so any
+        setting can be changed for one upstream in TRANSPORT_SETTINGS.
+
+        :param pool_size: Max connections kept open per host.
+            Set this to at least the number of threads sharing the transport.
+        :param timeout: Default (connect, read) timeout in seconds,
+            used when a request doesn't set its own.
+        :param retry_policy: A RetryPolicy. Defaults to RetryPolicy().
+            Use RetryPolicy(retries=0) for no retries.
+        :param rate_limiter: A rate_limit.TokenBucket or AdaptiveRateLimiter
+            applied to every attempt, or None.
+        :param headers: Headers sent with every request.
+        :param request_hooks: Callables run before each request as
+            hook(method, url, kwargs). They may modify kwargs.
+        :param response_hooks: Callables run after each request as
+            hook(endpoint, response, seconds). Seconds include retries.
+        :param quiet: Suppresses non-error logging output.
+        """
+        self.session = get_session(pool_size=pool_size)
+        self.session.headers['Accept-Encoding'] = 'gzip, deflate'
+        if headers:
+            self.session.headers.update(headers)
+
+        self.timeout = timeout
+        self.retry_policy = retry_policy if retry_policy else RetryPolicy()
+        self.rate_limiter = rate_limiter
+        self.request_hooks = list(request_hooks) if request_hooks else []
+        self.response_hooks = list(response_hooks) if response_hooks else []
+        self.stats = RequestStats()
+        self.quiet = quiet
+
+    @classmethod
+    def for_upstream(cls, upstream: str, **defaults):
+        """
+        :param upstream: e.g. "ror". Its TRANSPORT_SETTINGS entry
+            overrides the defaults.
+        :param defaults: The client's HttpTransport settings.
+        :return: An HttpTransport
+        """
+        return cls(**dict(defaults, **TRANSPORT_SETTINGS.get(upstream, {})))
+
+    def close(self):
+        """
+        Closes the pooled connections.
+        """
+        self.session.close()
+
+    def request(self,
+                method: str,
+                url: str,
+                endpoint: str = None,
+                idempotent: bool = True,
+                kwargs_factory=None,
+                **kwargs) -> requests.Response:
+        """
+        Sends a request with retries, see send_request().
+
+        :param method: HTTP method, e.g. "GET"
+        :param url: The request URL.
+        :param endpoint: Name the request is recorded under in the stats.
+            Defaults to the URL.
+        :param idempotent: Whether the request is safe to send twice.
+        :param kwargs_factory: See send_request().
+        :param kwargs: Passed to session.request(), e.g. params, json, stream.
+        :return: The last response received.
+        """
+        endpoint = endpoint if endpoint else url
+        kwargs.setdefault('timeout', self.timeout)
+        for hook in self.request_hooks:
+            hook(method, url, kwargs)
+
+        start = perf_counter()
+        response = send_request(
+            self.session, method, url,
+            retry_policy=self.retry_policy,
+            stats=self.stats,
+            endpoint=endpoint,
+            idempotent=idempotent,
+            kwargs_factory=kwargs_factory,
+            rate_limiter=self.rate_limiter,
+            quiet=self.quiet,
+            **kwargs)
+        seconds = perf_counter() - start
+
+        # Wire size if known, without reading streamed bodies
+        length = response.headers.get('Content-Length')
+        if length and length.isdigit():
+            received = int(length)
+        else:
+            received = 0 if kwargs.get('stream') else len(response.content)
+        self.stats.record_bytes(endpoint,
+                                sent=_body_size(response.request.body),
+                                received=received)
+
+        for hook in self.response_hooks:
+            hook(endpoint, response, seconds)
+
+        return response
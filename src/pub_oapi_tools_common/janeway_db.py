@@ -2,8 +2,13 @@
 Functions for working with the Janeway MySQL DB
 """
 
+from __future__ import annotations
+
 from pub_oapi_tools_common.misc import log
-import pymysql
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pymysql
 
 
 def get_connection(creds: dict = None,
@@ -26,6 +31,7 @@ def get_connection(creds: dict = None,
         https://pymysql.readthedocs.io/en/latest/modules/cursors.html#
     :return: An open PyMySQL connection.
     """
+    import pymysql
 
     log("INFO", __name__,
         (f"Connecting to Janeway database. "
@@ -73,3 +79,265 @@ def get_connection(creds: dict = None,
             password=creds['janeway-db']['password'],
             database=creds['janeway-db']['database'],
             cursorclass=cursor_class)
+
+
+# ----------------------------------------
+# Incremental extraction
+# Each table is read in keyset order on a watermark column
+# (a last-modified timestamp or an auto-increment id), and the
+# high-water mark is saved after every batch, so the next run
+# only sees rows that are new or changed since the last one.
+
+def _check_identifier(identifier: str) -> str:
+    """
+    Ensures a table or column name is a plain SQL identifier
+    and returns it backtick-quoted.
+    """
+    import re
+
+    if not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", identifier):
+        log("ERROR", __name__, f"Invalid table or column name: {identifier}")
+
+    return f"`{identifier}`"
+
+
+def _to_watermark_value(value):
+    """
+    Converts a column value to something JSON-serializable
+    that MySQL will still compare correctly when sent back.
+    """
+    from datetime import date, datetime
+    from decimal import Decimal
+
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    elif isinstance(value, date):
+        return value.isoformat()
+    elif isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+class WatermarkFileStore:
+
+    def __init__(self, path: str):
+        """
+        Keeps incremental-extraction watermarks in a local JSON file.
+        The file is rewritten atomically on every update.
+
+        :param path: Path to the JSON state file. Created if missing.
+        """
+        self.path = path
+
+    def _read(self) -> dict:
+        import json
+        import os
+
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as f:
+            return json.load(f)
+
+    def get(self, key: str) -> dict:
+        """
+        :param key: The state key, typically "<table>.<column>"
+        :return: The saved watermark dict, or None.
+        """
+        return self._read().get(key)
+
+    def set(self, key: str, watermark: dict):
+        """
+        Saves the watermark for a state key.
+
+        :param key: The state key, typically "<table>.<column>"
+        :param watermark: A dict with "value" and "id" keys.
+        """
+        import json
+        import os
+
+        state = self._read()
+        state[key] = watermark
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+class WatermarkDbStore:
+
+    def __init__(self,
+                 connection: pymysql.connections.Connection,
+                 table: str = "janeway_watermarks"):
+        """
+        Keeps incremental-extraction watermarks in a MySQL table,
+        typically in the pub-oapi-tools RDS. The table is created
+        if it doesn't exist.
+
+        :param connection: An open PyMySQL connection,
+            e.g. from pub_oapi_tools_db.get_connection()
+        :param table: Name of the watermarks table.
+        """
+        self.connection = connection
+        self.table = _check_identifier(table)
+
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                f"state_key VARCHAR(255) NOT NULL PRIMARY KEY, "
+                f"watermark TEXT NOT NULL, "
+                f"updated_at TIMESTAMP NOT NULL "
+                f"DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP)")
+        self.connection.commit()
+
+    def get(self, key: str) -> dict:
+        """
+        :param key: The state key, typically "<table>.<column>"
+        :return: The saved watermark dict, or None.
+        """
+        import json
+        import pymysql
+
+        with self.connection.cursor(pymysql.cursors.Cursor) as cursor:
+            cursor.execute(
+                f"SELECT watermark FROM {self.table} WHERE state_key = %s",
+                (key,))
+            row = cursor.fetchone()
+
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, watermark: dict):
+        """
+        Saves the watermark for a state key.
+
+        :param key: The state key, typically "<table>.<column>"
+        :param watermark: A dict with "value" and "id" keys.
+        """
+        import json
+
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {self.table} (state_key, watermark) VALUES (%s, %s) "
+                f"ON DUPLICATE KEY UPDATE watermark = VALUES(watermark)",
+                (key, json.dumps(watermark)))
+        self.connection.commit()
+
+
+def extract_incremental(connection: pymysql.connections.Connection,
+                        table: str,
+                        watermark_column: str,
+                        state_store,
+                        id_column: str = "id",
+                        columns: list = None,
+                        batch_size: int = 1000,
+                        state_key: str = None,
+                        quiet: bool = False,
+                        verbose: bool = False):
+    """
+    A generator yielding the rows of a Janeway table which are
+    new or changed since the last run, as dicts.
+
+    Rows are read in batches ordered by (watermark_column, id_column),
+    and the watermark is saved to the state store once a batch has
+    been fully consumed. If the consumer stops part-way through a
+    batch, that batch is yielded again on the next run.
+
+    Usage:
+        store = WatermarkFileStore("janeway_state.json")
+        for row in extract_incremental(conn, "submission_article",
+                                       "last_modified", store):
+            ...
+
+    For insert-only tables, use the auto-increment column as the
+    watermark (watermark_column="id"). Rows with a NULL watermark
+    value are never returned.
+
+    :param connection: An open PyMySQL connection, see get_connection().
+    :param table: Name of the table to extract from.
+    :param watermark_column: A last-modified timestamp or auto-increment column.
+    :param state_store: A WatermarkFileStore, WatermarkDbStore, or any
+        object with get(key) and set(key, watermark) methods.
+    :param id_column: Unique column used to break ties between rows
+        sharing a watermark value.
+    :param columns: Columns to select. Defaults to all columns.
+    :param batch_size: Number of rows fetched per query.
+    :param state_key: Key for the saved watermark.
+        Defaults to "<table>.<watermark_column>".
+    :param quiet: Suppresses non-error logging output.
+    :param verbose: Prints extra debug info.
+    :return: A generator of row dicts.
+    """
+    import pymysql
+
+    state_key = state_key if state_key else f"{table}.{watermark_column}"
+    q_table = _check_identifier(table)
+    q_watermark = _check_identifier(watermark_column)
+    q_id = _check_identifier(id_column)
+
+    if columns:
+        select_cols = ", ".join(_check_identifier(c) for c in columns)
+        # The watermark and id columns are needed to advance the state.
+        for extra in {watermark_column, id_column} - set(columns):
+            select_cols += f", {_check_identifier(extra)}"
+    else:
+        select_cols = "*"
+
+    watermark = state_store.get(state_key)
+
+    if not quiet:
+        log("INFO", __name__,
+            f"Extracting {table} rows changed since watermark: {watermark}")
+
+    rows_total = 0
+    while True:
+        # Keyset pagination on (watermark, id)
+        if watermark is None:
+            where_sql = f"{q_watermark} IS NOT NULL"
+            args = ()
+        elif watermark_column == id_column:
+            where_sql = f"{q_watermark} > %s"
+            args = (watermark['value'],)
+        else:
+            where_sql = (f"({q_watermark} > %s "
+                         f"OR ({q_watermark} = %s AND {q_id} > %s))")
+            args = (watermark['value'], watermark['value'], watermark['id'])
+
+        if watermark_column == id_column:
+            order_sql = q_id
+        else:
+            order_sql = f"{q_watermark}, {q_id}"
+
+        sql = (f"SELECT {select_cols} FROM {q_table} WHERE {where_sql} "
+               f"ORDER BY {order_sql} LIMIT %s")
+
+        if verbose:
+            log("DEBUG", __name__, f"{sql} {args}")
+
+        with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+            cursor.execute(sql, args + (batch_size,))
+            rows = cursor.fetchall()
+
+        if not rows:
+            break
+
+        for row in rows:
+            yield row
+
+        # The whole batch was consumed, advance the watermark
+        last_row = rows[-1]
+        watermark = {'value': _to_watermark_value(last_row[watermark_column]),
+                     'id': _to_watermark_value(last_row[id_column])}
+        state_store.set(state_key, watermark)
+        rows_total += len(rows)
+
+        if verbose:
+            log("DEBUG", __name__, f"Saved watermark {state_key}: {watermark}")
+
+        if len(rows) < batch_size:
+            break
+
+    if not quiet:
+        log("INFO", __name__,
+            f"Extracted {rows_total} new or changed rows from {table}.")
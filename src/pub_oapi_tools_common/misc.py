@@ -92,3 +92,107 @@ def validate_creds(creds: dict,
                 f"(To skip value checks during validation, run with check_values=False).")
 
     return True
+
+
+def windowed_map(fn,
+                 items,
+                 max_workers: int,
+                 window: int = None,
+                 key=None):
+    """
+    A generator calling fn(item) for each item on a thread pool,
+    yielding the results in input order. At most `window` items
+    are in flight or waiting to be yielded, so items can be a
+    long (or lazy) iterable without piling up results in memory.
+
+    If fn raises, the exception is raised when its result is
+    reached; the calls still queued are then cancelled.
+
+    :param fn: The function to call on each item.
+    :param items: An iterable of items.
+    :param max_workers: Max calls running at once.
+    :param window: Max items submitted ahead of the one being
+        yielded. Defaults to max_workers * 2.
+    :param key: Optional function. Items with the same key(item)
+        share the first such item's call, rather than calling fn again.
+    :return: A generator of fn(item) results.
+    """
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+
+    window = window or max_workers * 2
+    shared = {}
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            for item in items:
+                if key is None:
+                    pending.append(executor.submit(fn, item))
+                else:
+                    item_key = key(item)
+                    if item_key not in shared:
+                        shared[item_key] = executor.submit(fn, item)
+                    pending.append(shared[item_key])
+
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def iter_json_array(text: str,
+                    field: str = None):
+    """
+    A generator decoding a JSON array one element at a time, yielding
+    each element with its exact JSON text. Callers can then keep the
+    original JSON of an element, without re-serializing the decoded value.
+
+    :param text: A JSON array, e.g. a response body. With field,
+        a JSON object containing the array.
+    :param field: The top-level object field holding the array, e.g. "items".
+    :return: A generator of (decoded element, element JSON text) tuples.
+        Empty if field is missing or null.
+    """
+    import json
+    import re
+
+    decoder = json.JSONDecoder()
+    whitespace = re.compile(r'[ \t\n\r]*')
+
+    def skip(pos: int, past: str = '') -> int:
+        # Skips whitespace, plus one past character (e.g. ",") if it's next
+        pos = whitespace.match(text, pos).end()
+        if past and text.startswith(past, pos):
+            pos = whitespace.match(text, pos + 1).end()
+        if pos >= len(text):
+            raise ValueError("Unexpected end of JSON")
+        return pos
+
+    pos = skip(0)
+    if field is not None:
+        if text[pos] != '{':
+            raise ValueError(f"Expected a JSON object at {pos}")
+        pos = skip(pos + 1)
+        while text[pos] != '}':
+            key, pos = decoder.raw_decode(text, pos)
+            pos = skip(pos, ':')
+            if key == field:
+                break
+            _, pos = decoder.raw_decode(text, pos)
+            pos = skip(pos, ',')
+        else:
+            return
+
+    if text.startswith('null', pos):
+        return
+    if text[pos] != '[':
+        raise ValueError(f"Expected a JSON array at {pos}")
+    pos = skip(pos + 1)
+    while text[pos] != ']':
+        value, end = decoder.raw_decode(text, pos)
+        yield value, text[pos:end]
+        pos = skip(end, ',')
@@ -2,26 +2,65 @@
 Functions for connecting to OSTI's E-Link API.
 OSTI E-Link 2 documentation https://osti.gov/elink2api/
 """
+
+from __future__ import annotations
+
 from pub_oapi_tools_common.misc import log
 from pub_oapi_tools_common.misc import validate_creds
+from pub_oapi_tools_common.misc import windowed_map
+from pub_oapi_tools_common import http_transport
+from pub_oapi_tools_common.single_flight import SingleFlight
+from pub_oapi_tools_common.sqlite_store import SqliteStore
+
+from threading import Lock
+from typing import TYPE_CHECKING, Union
 
-import requests
-from requests_toolbelt.multipart.encoder import MultipartEncoder
-from typing import Union
+if TYPE_CHECKING:
+    import requests
 
 
 class ElinkApi:
     def __init__(self,
                  env: str = None,
                  creds: dict = None,
+                 pool_size: int = 10,
+                 retries: int = 3,
+                 backoff_factor: float = 0.5,
+                 pdf_cache=None,
+                 submission_store_path: str = None,
+                 single_flight: SingleFlight = None,
+                 transport: http_transport.HttpTransport = None,
                  quiet: bool = False,
                  verbose: bool = False):
         """
         An interface for working with OSTI's E-Link API 2.0.
         Must provide either an env string or a creds dict.
 
+        Requests share a pooled keep-alive session. Transient failures
+        are retried with exponential backoff, honouring Retry-After.
+        POSTs (which create records) are only retried if the server
+        can't have processed them (429s and connect timeouts).
+        Per-endpoint latency and retry counts are kept in self.stats.
+
         :param env: Name of the environment to use. (typically 'prod' or 'qa')
         :param creds: A dict containing key/value pairs.
+        :param pool_size: Max open connections per host.
+            Set to at least the number of threads sharing this object.
+        :param retries: Max retries for a failed request.
+        :param backoff_factor: Base delay (seconds) for retry backoff.
+        :param pdf_cache: Optional pdf_cache.PdfCache. If supplied, media
+            uploads read source PDFs from the cache (revalidating them
+            with conditional requests) instead of re-downloading them.
+        :param submission_store_path: Optional path to an SQLite file.
+            If supplied, a hash of each accepted submission is kept per
+            OSTI ID, and put_metadata() skips submissions which haven't
+            changed. See also rebuild_submission_store().
+        :param single_flight: Coalesces concurrent identical lookups
+            (get_single_pub with decode_json). Defaults to one per ElinkApi; only share
+            one between ElinkApis with the same creds.
+        :param transport: An http_transport.HttpTransport to send requests
+            with, instead of one built from pool_size, retries, and
+            backoff_factor (with TRANSPORT_SETTINGS['elink'] applied).
         :param quiet: Suppresses non-error logging output.
         :param verbose: Prints extra debug info.
         """
@@ -50,12 +89,68 @@ class ElinkApi:
         self.quiet = quiet
         self.verbose = verbose
 
+        # The auth header is sent per-request (not set on the session)
+        # so the token isn't sent along with PDF downloads.
+        # Media uploads can take a while to be acknowledged,
+        # hence the longer read timeout.
+        self.transport = transport if transport else http_transport.HttpTransport.for_upstream(
+            'elink',
+            pool_size=pool_size,
+            timeout=(10, 300),
+            retry_policy=http_transport.RetryPolicy(
+                retries=retries, backoff_factor=backoff_factor),
+            quiet=quiet)
+        self.session = self.transport.session
+        self.stats = self.transport.stats
+        self.pdf_cache = pdf_cache
+
+        self.submission_store = SubmissionHashStore(submission_store_path) \
+            if submission_store_path else None
+        self.update_counts_lock = Lock()
+        self.update_counts = {'sent': 0, 'skipped': 0}
+        self.single_flight = single_flight if single_flight else SingleFlight()
+
     def get_auth_header(self):
         """
         :return: Dict with auth and bearer token for Requests
         """
         return {'Authorization': f"Bearer {self.creds['token']}"}
 
+    def close(self):
+        """
+        Closes the pooled connections.
+        """
+        self.transport.close()
+
+    def _request(self,
+                 endpoint: str,
+                 method: str,
+                 url: str,
+                 idempotent: bool = True,
+                 **kwargs) -> requests.Response:
+        """
+        Sends a request through the transport, with retries.
+
+        :param endpoint: Name the request's stats are recorded under.
+        :param method: HTTP method
+        :param url: The request URL
+        :param idempotent: Whether the request is safe to send twice.
+        :param kwargs: Passed to HttpTransport.request()
+        :return: A requests response object
+        """
+        response = self.transport.request(
+            method, url,
+            endpoint=endpoint,
+            idempotent=idempotent,
+            **kwargs)
+
+        if self.verbose:
+            log("DEBUG", __name__,
+                f"{endpoint}: {response.status_code} {response.reason} "
+                f"({self.stats.last_seconds:.3f}s)")
+
+        return response
+
     def post_metadata(self,
                       pub: dict = None,
                       submission_dict: dict = None
@@ -76,102 +171,289 @@ class ElinkApi:
 
         req_url = f"{self.creds['endpoint']}/records/submit"
         headers = self.get_auth_header()
-        response = requests.post(req_url,
+        response = self._request('post_metadata', 'POST', req_url,
+                                 idempotent=False,
                                  json=submission,
                                  headers=headers)
+
+        if self.submission_store and response.ok:
+            osti_id = response.json().get('osti_id')
+            if osti_id:
+                self.submission_store.set(osti_id, submission)
+
         return response
 
-    def put_metadata(self, pub) -> requests.Response:
+    def put_metadata(self,
+                     pub: dict,
+                     force: bool = False) -> Union[requests.Response, None]:
+        """
+        Sends a PUT request to update a record's metadata.
+
+        If the ElinkApi has a submission store, submissions identical
+        to the last accepted one for the OSTI ID are skipped.
+        self.update_counts tracks how many updates were sent and skipped.
+
+        :param pub: Python dict of a pub object, with osti_id and submission_json.
+        :param force: Send the update even if it hasn't changed.
+        :return: A requests response object, or None if the update was skipped.
+        """
+        if self.submission_store and not force \
+                and self.submission_store.matches(pub['osti_id'], pub['submission_json']):
+            if self.verbose:
+                log("DEBUG", __name__,
+                    f"Skipping unchanged metadata update, OSTI ID {pub['osti_id']}")
+            self._count_update('skipped')
+            return None
+
         req_url = f"{self.creds['endpoint']}/records/{pub['osti_id']}/submit"
         headers = self.get_auth_header()
-        response = requests.put(
-            req_url, json=pub['submission_json'], headers=headers)
+        response = self._request(
+            'put_metadata', 'PUT', req_url,
+            json=pub['submission_json'], headers=headers)
+        self._count_update('sent')
+
+        if self.submission_store and response.ok:
+            self.submission_store.set(pub['osti_id'], pub['submission_json'])
+
         return response
 
-    def post_media(self, pub) -> requests.Response:
-        req_url = f"{self.creds['endpoint']}/media/{pub['osti_id']}"
+    def _count_update(self, outcome: str):
+        with self.update_counts_lock:
+            self.update_counts[outcome] += 1
 
-        # Get the PDF file data from url
-        pdf_filename = pub['File URL'].split('/')[-1]
-        pdf_headers = {'user-agent': self.creds['pdf-user-agent']}
+    def rebuild_submission_store(self,
+                                 pubs: list,
+                                 max_workers: int = 4) -> dict:
+        """
+        Rebuilds the submission store from E-Link's live records.
+        Each pub's submission_json is compared with its record from
+        get_single_pub(): if every submitted field matches, its hash is
+        stored, so put_metadata() will skip it. Otherwise any stored
+        hash is dropped, so the next update is sent.
+
+        :param pubs: Pub dicts, each with osti_id and submission_json.
+        :param max_workers: Max records fetched at once.
+        :return: A dict with counts of matched, changed, and failed pubs.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        import requests
 
-        pdf_response = requests.get(
-            pub['File URL'], headers=pdf_headers, stream=True)
-        pdf_response.raw.decode_content = True
+        if not self.submission_store:
+            log("ERROR", __name__,
+                "ElinkApi was created without a submission_store_path.")
 
-        mp_encoder = MultipartEncoder(
-            fields={'file': (pdf_filename, pdf_response.content, 'application/pdf')})
+        def check(pub):
+            try:
+                record = self.get_single_pub(pub['osti_id'], decode_json=True)
+            except requests.exceptions.RequestException:
+                return 'failed'
+            if _submission_matches(pub['submission_json'], record):
+                self.submission_store.set(pub['osti_id'], pub['submission_json'])
+                return 'matched'
+            self.submission_store.delete(pub['osti_id'])
+            return 'changed'
+
+        counts = {'matched': 0, 'changed': 0, 'failed': 0}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for outcome in executor.map(check, pubs):
+                counts[outcome] += 1
 
-        headers = self.get_auth_header()
-        headers['Content-Type'] = mp_encoder.content_type
-        params = {'title': pub['title']}
+        if not self.quiet:
+            log("INFO", __name__, f"Rebuilt submission store: {counts}")
 
-        # Send the post with the PDF data
-        media_response = requests.post(
-            req_url, headers=headers, params=params, data=mp_encoder)
+        return counts
 
-        return media_response
+    def get_pdf(self,
+                pub: dict,
+                stream: bool = False) -> requests.Response:
+        """
+        Downloads the PDF at pub['File URL'].
 
-    def put_media(self, pub) -> requests.Response:
-        req_url = f"{self.creds['endpoint']}/media/{pub['osti_id']}/{pub['media_id']}"
+        :param pub: Python dict of a pub object.
+        :param stream: If True, the body isn't read yet and is requested
+            without content-encoding, so it can be streamed as-is.
+        :return: A requests response object
+        """
+        pdf_headers = {'user-agent': self.creds['pdf-user-agent']}
+        if stream:
+            pdf_headers['Accept-Encoding'] = 'identity'
+
+        pdf_response = self._request(
+            'pdf_download', 'GET', pub['File URL'],
+            headers=pdf_headers, stream=stream)
+        return pdf_response
+
+    def _media_upload(self,
+                      endpoint: str,
+                      method: str,
+                      req_url: str,
+                      pub: dict,
+                      checksum: str = None) -> requests.Response:
+        """
+        Streams the PDF at pub['File URL'] into a multipart upload.
+        Each attempt re-opens the download, as a stream can only be read once.
+        """
+        from requests_toolbelt.multipart.encoder import MultipartEncoder
 
-        # Get the PDF file data from url
         pdf_filename = pub['File URL'].split('/')[-1]
-        pdf_headers = {'user-agent': self.creds['pdf-user-agent']}
+        params = {'title': pub['title']}
+        current = {}
+
+        def build_upload():
+            if current.get('pdf'):
+                current['pdf'].close()
+
+            if self.pdf_cache:
+                pdf_file = self.pdf_cache.open(
+                    pub['File URL'],
+                    headers={'user-agent': self.creds['pdf-user-agent']})
+                current['pdf'] = StreamingPdf.from_file(
+                    pdf_file, pub['File URL'], checksum=checksum)
+            else:
+                pdf_response = self.get_pdf(pub, stream=True)
+                pdf_response.raise_for_status()
+                current['pdf'] = StreamingPdf.from_response(
+                    pdf_response, checksum=checksum)
+
+            mp_encoder = MultipartEncoder(
+                fields={'file': (pdf_filename, current['pdf'], 'application/pdf')})
+            headers = self.get_auth_header()
+            headers['Content-Type'] = mp_encoder.content_type
+            return {'data': mp_encoder, 'headers': headers}
+
+        try:
+            media_response = self._request(
+                endpoint, method, req_url,
+                idempotent=(method != 'POST'),
+                params=params,
+                kwargs_factory=build_upload)
+        finally:
+            if current.get('pdf'):
+                current['pdf'].close()
+
+        media_response.pdf_transfer = current['pdf'].summary()
+        if self.verbose:
+            log("DEBUG", __name__, f"PDF transfer: {media_response.pdf_transfer}")
 
-        pdf_response = requests.get(
-            pub['File URL'],
-            headers=pdf_headers,
-            stream=True)
-        pdf_response.raw.decode_content = True
+        return media_response
 
-        mp_encoder = MultipartEncoder(
-            fields={'file': (pdf_filename, pdf_response.content, 'application/pdf')})
+    def post_media(self,
+                   pub: dict,
+                   checksum: str = None) -> requests.Response:
+        """
+        Uploads the PDF at pub['File URL'] to a record's media.
+        The PDF is streamed from the download into the upload in chunks.
+        If the download has no Content-Length, it's spooled to a temp
+        file first.
 
-        headers = {'Authorization': 'Bearer ' + self.creds['token'],
-                   'Content-Type': mp_encoder.content_type}
-        params = {'title': pub['title']}
+        :param pub: Python dict of a pub object.
+        :param checksum: Optional hashlib algorithm name (e.g. 'md5'
+            or 'sha256') to calculate on the fly during the transfer.
+        :return: A requests response object. Its pdf_transfer attribute
+            holds a dict with the url, bytes, expected_bytes, streamed,
+            and (if requested) checksum of the transferred PDF.
+        """
+        req_url = f"{self.creds['endpoint']}/media/{pub['osti_id']}"
+        return self._media_upload('post_media', 'POST', req_url, pub, checksum)
 
-        # Send the post with the PDF data
-        media_response = requests.put(
-            req_url, headers=headers, params=params, data=mp_encoder)
+    def put_media(self,
+                  pub: dict,
+                  checksum: str = None) -> requests.Response:
+        """
+        Replaces a record's media with the PDF at pub['File URL'].
+        See post_media() for streaming and checksum details.
 
-        return media_response
+        :param pub: Python dict of a pub object.
+        :param checksum: Optional hashlib algorithm name.
+        :return: A requests response object, with a pdf_transfer dict.
+        """
+        req_url = f"{self.creds['endpoint']}/media/{pub['osti_id']}/{pub['media_id']}"
+        return self._media_upload('put_media', 'PUT', req_url, pub, checksum)
 
     # ----------------------------------------
     # Functions for analytics work
     # E-Link API params documentation:
     # https://www.osti.gov/elink2api/#tag/records/operation/getRecords
-    def get_pubs_by_workflow_status(self, workflow_status) -> requests.Response:
+    def get_pubs_by_workflow_status(self,
+                                    workflow_status: str,
+                                    site_ownership_code: str = 'LBNLSCH',
+                                    date_first_submitted_from: str = '10/01/2024'
+                                    ) -> requests.Response:
+        """
+        Gets the first page of records with a workflow status.
+        See iter_records() for all pages.
+
+        :param workflow_status: E-Link workflow status code
+        :param site_ownership_code: The submitting site's code.
+        :param date_first_submitted_from: MM/DD/YYYY
+        :return: A requests response object
+        """
         req_url = f"{self.creds['endpoint']}/records"
         headers = self.get_auth_header()
         params = {
-            'site_ownership_code': 'LBNLSCH',
-            'date_first_submitted_from': '10/01/2024',
+            'site_ownership_code': site_ownership_code,
+            'date_first_submitted_from': date_first_submitted_from,
             'workflow_status': workflow_status}
 
-        response = requests.get(
-            req_url, params=params, headers=headers)
+        response = self._request(
+            'get_records', 'GET', req_url, params=params, headers=headers)
         return response
 
-    def get_hidden_pubs(self) -> requests.Response:
+    def get_hidden_pubs(self,
+                        site_ownership_code: str = 'LBNLSCH',
+                        date_first_submitted_from: str = '10/01/2024'
+                        ) -> requests.Response:
+        """
+        Gets the first page of hidden records.
+        See iter_records() for all pages.
+
+        :param site_ownership_code: The submitting site's code.
+        :param date_first_submitted_from: MM/DD/YYYY
+        :return: A requests response object
+        """
         req_url = f"{self.creds['endpoint']}/records"
         headers = self.get_auth_header()
         params = {
-            'site_ownership_code': 'LBNLSCH',
-            'date_first_submitted_from': '10/01/2024',
+            'site_ownership_code': site_ownership_code,
+            'date_first_submitted_from': date_first_submitted_from,
             'hidden_flag': 'true'}
 
-        response = requests.get(
-            req_url, params=params, headers=headers)
+        response = self._request(
+            'get_records', 'GET', req_url, params=params, headers=headers)
         return response
 
-    def get_single_pub(self, osti_id) -> requests.Response:
+    def get_single_pub(self,
+                       osti_id,
+                       decode_json: bool = False
+                       ) -> Union[requests.Response, dict]:
+        """
+        Gets the E-Link record for a single pub.
+
+        With decode_json, concurrent calls for the same OSTI ID share one
+        request and its decoded record, see single_flight.SingleFlight.
+        Response objects aren't shared, so without it each call sends
+        its own request.
+
+        :param osti_id: OSTI ID of the pub
+        :param decode_json: If True, returns the result of response.json().
+        :return: A requests response object, or with decode_json,
+            the decoded record.
+        :raises requests.HTTPError: With decode_json, for non-2XX responses.
+        """
         req_url = f"{self.creds['endpoint']}/records/{osti_id}"
         headers = self.get_auth_header()
-        response = requests.get(req_url, headers=headers)
+        if decode_json:
+            return self.single_flight.do(
+                ('get_single_pub', req_url), self._get_json, 'get_single_pub', req_url, headers)
+
+        response = self._request('get_single_pub', 'GET', req_url, headers=headers)
         return response
 
+    def _get_json(self, endpoint: str, req_url: str, headers: dict):
+        response = self._request(endpoint, 'GET', req_url, headers=headers)
+        response.raise_for_status()
+        return response.json()
+
     # Generic search function
     def search_metadata(self,
                         query_params: dict
@@ -191,10 +473,75 @@ class ElinkApi:
 
         req_url = f"{self.creds['endpoint']}/records"
         headers = self.get_auth_header()
-        response = requests.get(
-            req_url, params=query_params, headers=headers)
+        response = self._request(
+            'get_records', 'GET', req_url, params=query_params, headers=headers)
         return response
 
+    def iter_records(self,
+                     query_params: dict,
+                     max_workers: int = 4):
+        """
+        A generator yielding every record matching a search, across all pages.
+
+        The first page gives the total record count (X-Total-Count),
+        and the remaining pages are then fetched concurrently.
+        Records are decoded and yielded lazily, in page order.
+        If the total isn't returned, "next" Link headers are
+        followed one page at a time instead.
+
+        Usage:
+            for record in elink.iter_records({'site_ownership_code': 'LBNLSCH',
+                                              'workflow_status': 'R'}):
+                ...
+
+        :param query_params: A dict containing the key/values for searching records.
+            See the OSTI documentation here for a full list of params:
+            https://www.osti.gov/elink2api/#tag/records/operation/getRecords
+        :param max_workers: Max pages fetched at once.
+        :return: A generator of record dicts.
+        """
+        from math import ceil
+
+        req_url = f"{self.creds['endpoint']}/records"
+        headers = self.get_auth_header()
+
+        def get_page(page_params, page_url=req_url):
+            response = self._request(
+                'get_records', 'GET', page_url, params=page_params, headers=headers)
+            if not response.ok:
+                log("ERROR", __name__,
+                    f"E-Link records search failed: "
+                    f"{response.status_code} {response.text[:200]}")
+            return response
+
+        first_response = get_page(dict(query_params))
+        first_page = first_response.json()
+        for record in first_page:
+            yield record
+
+        total_count = first_response.headers.get('X-Total-Count')
+        if not first_page:
+            return
+
+        # Without a total, follow the Link headers sequentially
+        if not (total_count and total_count.isdigit()):
+            response = first_response
+            while response.links.get('next'):
+                response = get_page(None, response.links['next']['url'])
+                for record in response.json():
+                    yield record
+            return
+
+        num_pages = ceil(int(total_count) / len(first_page))
+        if not self.quiet:
+            log("INFO", __name__,
+                f"{total_count} E-Link records found in {num_pages} pages.")
+
+        pages = (dict(query_params, page=page) for page in range(2, num_pages + 1))
+        for response in windowed_map(get_page, pages, max_workers):
+            for record in response.json():
+                yield record
+
     def get_comments(self,
                      osti_id: Union[int, str],
                      decode_json: bool = False
@@ -212,6 +559,7 @@ class ElinkApi:
             See here for details:
             https://requests.readthedocs.io/en/latest/api/#requests.Response
         """
+        import requests
 
         if not self.quiet:
             log("INFO", __name__,
@@ -219,7 +567,7 @@ class ElinkApi:
 
         req_url = f"{self.creds['endpoint']}/comments/{osti_id}"
         headers = self.get_auth_header()
-        response = requests.get(req_url, headers=headers)
+        response = self._request('get_comments', 'GET', req_url, headers=headers)
         if decode_json:
             try:
                 return_json = response.json()
@@ -230,3 +578,258 @@ class ElinkApi:
                 return None
         else:
             return response
+
+    def get_comments_bulk(self,
+                          osti_ids: list,
+                          max_workers: int = 8,
+                          stream: bool = False):
+        """
+        Gets the OSTI comments for many pubs concurrently.
+        Bodies are decoded as with get_comments(decode_json=True):
+        undecodable bodies give None rather than halting. Failed
+        requests are reported per-ID without stopping the batch.
+
+        :param osti_ids: An iterable of OSTI IDs.
+        :param max_workers: Max requests in flight at once. The ElinkApi
+            pool_size should be at least this.
+        :param stream: If True, returns a generator of
+            (osti_id, comments, error) tuples as requests complete,
+            where error is None on success.
+        :return: If stream is False, a dict with 'comments'
+            ({osti_id: comments}) and 'failures' ({osti_id: error}).
+        """
+        if stream:
+            return self._iter_comments(osti_ids, max_workers)
+
+        results = {'comments': {}, 'failures': {}}
+        for osti_id, comments, error in self._iter_comments(osti_ids, max_workers):
+            if error:
+                results['failures'][osti_id] = error
+            else:
+                results['comments'][osti_id] = comments
+
+        if not self.quiet:
+            log("INFO", __name__,
+                f"Retrieved comments for {len(results['comments'])} pubs, "
+                f"{len(results['failures'])} failures.")
+
+        return results
+
+    def _iter_comments(self, osti_ids, max_workers: int):
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        import requests
+
+        headers = self.get_auth_header()
+
+        def fetch(osti_id):
+            req_url = f"{self.creds['endpoint']}/comments/{osti_id}"
+            try:
+                response = self._request('get_comments', 'GET', req_url, headers=headers)
+            except requests.exceptions.RequestException as e:
+                return None, repr(e)
+            if not response.ok:
+                return None, f"HTTP {response.status_code}: {response.text[:200]}"
+            try:
+                return response.json(), None
+            except requests.exceptions.JSONDecodeError:
+                if self.verbose:
+                    log("DEBUG", __name__,
+                        f"JSONDecodeError decoding comments for OSTI ID {osti_id}")
+                return None, None
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(fetch, osti_id): osti_id for osti_id in osti_ids}
+            try:
+                for future in as_completed(futures):
+                    comments, error = future.result()
+                    yield futures[future], comments, error
+            finally:
+                for future in futures:
+                    future.cancel()
+
+
+class StreamingPdf:
+
+    def __init__(self,
+                 source,
+                 length: int,
+                 url: str,
+                 checksum: str = None,
+                 streamed: bool = True,
+                 on_close=None):
+        """
+        A read-once, file-like view of a PDF for MultipartEncoder,
+        which reads it in chunks, e.g. straight from an open download.
+        Size and (optionally) a checksum are calculated as it's read.
+        Use from_response() or from_file() to create one.
+
+        :param source: A file-like object to read from.
+        :param length: Number of bytes expected from the source.
+        :param url: The PDF's URL, for logging.
+        :param checksum: Optional hashlib algorithm name, e.g. 'sha256'
+        :param streamed: Whether the source is read without buffering.
+        :param on_close: Called on close() instead of source.close(),
+            e.g. to release a download's connection.
+        """
+        import hashlib
+
+        self.source = source
+        self.url = url
+        self.hash = hashlib.new(checksum) if checksum else None
+        self.streamed = streamed
+        self.on_close = on_close
+        self.bytes_read = 0
+        self.expected_bytes = length
+
+        # MultipartEncoder reads this as the number of bytes left
+        self.len = length
+
+    @classmethod
+    def from_response(cls,
+                      pdf_response: requests.Response,
+                      checksum: str = None):
+        """
+        If the download has no Content-Length, or is content-encoded,
+        the length can't be known up-front, so the body is spooled
+        to a temp file in chunks and read back from there.
+
+        :param pdf_response: A response opened with stream=True.
+        :param checksum: Optional hashlib algorithm name.
+        :return: A StreamingPdf reading from the response.
+        """
+        import tempfile
+
+        content_length = pdf_response.headers.get('Content-Length', '')
+        content_encoding = pdf_response.headers.get('Content-Encoding', 'identity')
+
+        if content_length.isdigit() and content_encoding == 'identity':
+            return cls(pdf_response.raw, int(content_length), pdf_response.url,
+                       checksum, on_close=pdf_response.close)
+
+        log("WARN", __name__,
+            f"PDF download has no usable Content-Length, spooling "
+            f"to a temp file before upload: {pdf_response.url}")
+
+        spool = tempfile.TemporaryFile()
+        try:
+            for chunk in pdf_response.iter_content(chunk_size=1024 * 1024):
+                spool.write(chunk)
+            length = spool.tell()
+            spool.seek(0)
+        except BaseException:
+            spool.close()
+            raise
+        finally:
+            pdf_response.close()
+
+        return cls(spool, length, pdf_response.url, checksum, streamed=False)
+
+    @classmethod
+    def from_file(cls,
+                  pdf_file,
+                  url: str,
+                  checksum: str = None):
+        """
+        :param pdf_file: A local copy of the PDF opened in binary mode,
+            e.g. from PdfCache.open(). It's closed with the StreamingPdf.
+        :param url: The PDF's URL, for logging.
+        :param checksum: Optional hashlib algorithm name.
+        :return: A StreamingPdf reading from the file.
+        """
+        import os
+        return cls(pdf_file, os.fstat(pdf_file.fileno()).st_size, url, checksum)
+
+    def read(self, size: int = -1) -> bytes:
+        size = size if size is not None and size >= 0 else self.len
+        chunk = self.source.read(min(size, self.len))
+
+        if not chunk and self.len > 0:
+            raise IOError(
+                f"PDF download ended after {self.bytes_read} of "
+                f"{self.expected_bytes} bytes: {self.url}")
+
+        self.len -= len(chunk)
+        self.bytes_read += len(chunk)
+        if self.hash:
+            self.hash.update(chunk)
+        return chunk
+
+    def close(self):
+        if self.on_close:
+            self.on_close()
+        else:
+            self.source.close()
+
+    def summary(self) -> dict:
+        """
+        :return: A dict describing the transfer.
+        """
+        summary = {'url': self.url,
+                   'bytes': self.bytes_read,
+                   'expected_bytes': self.expected_bytes,
+                   'streamed': self.streamed}
+        if self.hash:
+            summary[self.hash.name] = self.hash.hexdigest()
+        return summary
+
+
+def _submission_matches(submitted, live) -> bool:
+    """
+    True if every field of a submission has the same value in
+    the live record. Fields E-Link adds to the record are ignored.
+    """
+    if isinstance(submitted, dict):
+        return isinstance(live, dict) and all(
+            key in live and _submission_matches(value, live[key])
+            for key, value in submitted.items())
+    elif isinstance(submitted, list):
+        return isinstance(live, list) and len(submitted) == len(live) and all(
+            _submission_matches(s, l) for s, l in zip(submitted, live))
+    return submitted == live
+
+
+class SubmissionHashStore(SqliteStore):
+
+    def __init__(self, path: str):
+        """
+        Keeps a canonical hash of the last accepted submission
+        per OSTI ID, in an SQLite file.
+
+        :param path: Path to the SQLite file. Created if missing.
+        """
+        super().__init__(path, schema=[
+            "CREATE TABLE IF NOT EXISTS submissions ("
+            "osti_id TEXT PRIMARY KEY, sha256 TEXT NOT NULL, updated_at TEXT NOT NULL)"])
+
+    @staticmethod
+    def hash_submission(submission: dict) -> str:
+        """
+        :param submission: A submission dict.
+        :return: SHA-256 of the submission's canonical JSON
+            (sorted keys, no whitespace), so key order doesn't matter.
+        """
+        import hashlib
+        import json
+
+        canonical = json.dumps(submission, sort_keys=True,
+                               separators=(',', ':'), ensure_ascii=False)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def matches(self, osti_id, submission: dict) -> bool:
+        """
+        :return: True if the submission is identical to the stored one.
+        """
+        row = self.fetch_one("SELECT sha256 FROM submissions WHERE osti_id = ?",
+                             (str(osti_id),))
+        return bool(row) and row[0] == self.hash_submission(submission)
+
+    def set(self, osti_id, submission: dict):
+        from datetime import datetime
+
+        self.write("INSERT OR REPLACE INTO submissions (osti_id, sha256, updated_at) "
+                   "VALUES (?, ?, ?)",
+                   (str(osti_id), self.hash_submission(submission),
+                    datetime.now().isoformat()))
+
+    def delete(self, osti_id):
+        self.write("DELETE FROM submissions WHERE osti_id = ?", (str(osti_id),))
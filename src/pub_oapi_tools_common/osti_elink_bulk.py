@@ -0,0 +1,283 @@
+"""
+Concurrent bulk submission of pubs to OSTI's E-Link API,
+with a local journal so interrupted runs can resume.
+"""
+
+from pub_oapi_tools_common.misc import log
+from pub_oapi_tools_common.osti_elink_api import ElinkApi
+from threading import Lock
+
+
+class SubmissionJournal:
+
+    def __init__(self, path: str):
+        """
+        A durable record of each pub's submission state, kept as
+        an append-only JSON Lines file. Every update is flushed and
+        fsync'd before the submission moves on, and the latest line
+        for each pub wins when the journal is re-opened.
+
+        States: metadata_pending, metadata_submitted,
+        media_pending, complete, error
+
+        :param path: Path to the journal file. Created if missing.
+        """
+        import json
+        import os
+
+        self.path = path
+        self.lock = Lock()
+        self.entries = {}
+
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    # A crash can leave a partial last line
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.entries[entry['key']] = entry
+
+        self.file = open(path, 'a')
+
+    def close(self):
+        self.file.close()
+
+    def get(self, key: str) -> dict:
+        """
+        :param key: The pub's key.
+        :return: The pub's latest journal entry, or None.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            return dict(entry) if entry else None
+
+    def update(self, key: str, **fields) -> dict:
+        """
+        Merges fields into the pub's entry and appends it to the journal.
+
+        :param key: The pub's key.
+        :param fields: e.g. state, osti_id, media_id, error
+        :return: The updated entry.
+        """
+        import json
+        import os
+        from datetime import datetime
+
+        with self.lock:
+            entry = dict(self.entries.get(key, {'key': key}))
+            entry.update(fields)
+            entry['time'] = datetime.now().isoformat()
+            self.entries[key] = entry
+
+            self.file.write(json.dumps(entry) + '\n')
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            return dict(entry)
+
+
+class ElinkBulkSubmitter:
+
+    def __init__(self,
+                 elink_api: ElinkApi,
+                 journal_path: str,
+                 metadata_workers: int = 4,
+                 media_workers: int = 2,
+                 requests_per_second: float = None,
+                 key_field: str = 'id',
+                 submit_media: bool = True,
+                 retry_errors: bool = False,
+                 quiet: bool = False,
+                 verbose: bool = False):
+        """
+        Runs pubs through post_metadata() and post_media() on two
+        worker pools, with a shared rate limit across both.
+
+        Each pub's progress is written to a SubmissionJournal, so a
+        re-run with the same journal skips completed pubs and resumes
+        pubs at the media stage if their metadata went through.
+
+        Pubs interrupted mid-request (metadata_pending, media_pending)
+        may or may not have been received by E-Link. They're treated
+        as errors rather than resubmitted: check E-Link, then re-run
+        with retry_errors=True if needed.
+
+        :param elink_api: An ElinkApi. Its pool_size should be at least
+            metadata_workers + media_workers.
+        :param journal_path: Path to the JSON Lines journal.
+        :param metadata_workers: Max concurrent metadata submissions.
+        :param media_workers: Max concurrent media uploads.
+        :param requests_per_second: Shared rate limit for E-Link requests.
+            A media upload counts as two: the PDF download and the upload.
+            None for no limit.
+        :param key_field: Pub dict field which uniquely identifies each pub.
+        :param submit_media: Upload pub['File URL'] after the metadata.
+        :param retry_errors: Retry pubs whose journal state is error or pending.
+        :param quiet: Suppresses non-error logging output.
+        :param verbose: Prints extra debug info.
+        """
+        from pub_oapi_tools_common.rate_limit import TokenBucket
+
+        self.elink_api = elink_api
+        self.journal_path = journal_path
+        self.metadata_workers = metadata_workers
+        self.media_workers = media_workers
+        self.rate_limiter = TokenBucket(requests_per_second) \
+            if requests_per_second else None
+        self.key_field = key_field
+        self.submit_media = submit_media
+        self.retry_errors = retry_errors
+        self.quiet = quiet
+        self.verbose = verbose
+
+        self.journal = None
+        self.media_pool = None
+        self.counts_lock = Lock()
+        self.counts = {}
+        self.errors = []
+
+    def _count(self, outcome: str):
+        with self.counts_lock:
+            self.counts[outcome] = self.counts.get(outcome, 0) + 1
+
+    def _fail(self, key: str, stage: str, error: str):
+        self.journal.update(key, state='error', stage=stage, error=error)
+        with self.counts_lock:
+            self.errors.append({'key': key, 'stage': stage, 'error': error})
+        self._count('errors')
+        if not self.quiet:
+            log("WARN", __name__, f"{key} failed at {stage}: {error}")
+
+    def _throttle(self, num_requests: int = 1):
+        if self.rate_limiter:
+            for _ in range(num_requests):
+                self.rate_limiter.acquire()
+
+    @staticmethod
+    def _response_error(response) -> str:
+        return f"HTTP {response.status_code}: {response.text[:500]}"
+
+    def _submit_metadata(self, key: str, pub: dict):
+        try:
+            self.journal.update(key, state='metadata_pending', error=None)
+            self._throttle()
+            response = self.elink_api.post_metadata(pub=pub)
+
+            if not response.ok:
+                return self._fail(key, 'metadata', self._response_error(response))
+
+            osti_id = response.json().get('osti_id')
+            self.journal.update(key, state='metadata_submitted', osti_id=osti_id)
+            self._count('metadata_submitted')
+
+            if self.verbose:
+                log("DEBUG", __name__, f"{key} metadata submitted, OSTI ID {osti_id}")
+
+        except Exception as e:
+            return self._fail(key, 'metadata', repr(e))
+
+        self._schedule_media(key, pub, osti_id)
+
+    def _schedule_media(self, key: str, pub: dict, osti_id):
+        if self.submit_media and pub.get('File URL'):
+            if not osti_id:
+                return self._fail(key, 'media', "No OSTI ID to upload the media to.")
+            self.media_pool.submit(self._submit_media, key, dict(pub, osti_id=osti_id))
+        else:
+            self.journal.update(key, state='complete')
+            self._count('complete')
+
+    def _submit_media(self, key: str, pub: dict):
+        try:
+            self.journal.update(key, state='media_pending', error=None)
+            # The PDF download and the upload
+            self._throttle(num_requests=2)
+            response = self.elink_api.post_media(pub)
+
+            if not response.ok:
+                return self._fail(key, 'media', self._response_error(response))
+
+            try:
+                media_id = response.json().get('media_id')
+            except ValueError:
+                media_id = None
+            self.journal.update(key, state='complete', media_id=media_id)
+            self._count('media_submitted')
+            self._count('complete')
+
+            if self.verbose:
+                log("DEBUG", __name__, f"{key} media submitted, media ID {media_id}")
+
+        except Exception as e:
+            self._fail(key, 'media', repr(e))
+
+    def run(self, pubs) -> dict:
+        """
+        Submits the pubs, resuming from the journal if it exists.
+
+        :param pubs: An iterable of pub dicts, each with the key_field,
+            'submission_json', and for media, 'File URL' and 'title'.
+        :return: A summary dict with counts per outcome, elapsed
+            seconds, pubs per second, the errors list, and the
+            ElinkApi request stats.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from time import perf_counter
+
+        start = perf_counter()
+        self.counts = {}
+        self.errors = []
+        self.journal = SubmissionJournal(self.journal_path)
+        metadata_pool = ThreadPoolExecutor(max_workers=self.metadata_workers)
+        self.media_pool = ThreadPoolExecutor(max_workers=self.media_workers)
+
+        if not self.quiet:
+            log("INFO", __name__,
+                f"Starting bulk E-Link submission. Journal: {self.journal_path}")
+
+        total = 0
+        try:
+            for pub in pubs:
+                total += 1
+                key = str(pub[self.key_field])
+                entry = self.journal.get(key) or {}
+                state = entry.get('state')
+
+                if state == 'complete':
+                    self._count('skipped')
+                elif state in ('error', 'metadata_pending', 'media_pending') \
+                        and not self.retry_errors:
+                    self._count('skipped_errors')
+                elif entry.get('osti_id'):
+                    # Metadata went through on a previous run
+                    self._schedule_media(key, pub, entry['osti_id'])
+                else:
+                    metadata_pool.submit(self._submit_metadata, key, pub)
+
+            # Metadata tasks schedule media tasks, so wait on them first
+            metadata_pool.shutdown(wait=True)
+            self.media_pool.shutdown(wait=True)
+
+        finally:
+            metadata_pool.shutdown(wait=True)
+            self.media_pool.shutdown(wait=True)
+            self.journal.close()
+
+        elapsed = perf_counter() - start
+        processed = total - self.counts.get('skipped', 0) \
+            - self.counts.get('skipped_errors', 0)
+        summary = {'total': total,
+                   'counts': dict(self.counts),
+                   'elapsed_seconds': elapsed,
+                   'pubs_per_second': processed / elapsed if elapsed else 0.0,
+                   'errors': list(self.errors),
+                   'request_stats': self.elink_api.stats.summary()}
+
+        if not self.quiet:
+            log("INFO", __name__,
+                f"Bulk submission finished: {total} pubs in {elapsed:.1f}s "
+                f"({summary['pubs_per_second']:.2f} pubs/s). "
+                f"Outcomes: {summary['counts']}")
+
+        return summary
@@ -1,11 +1,52 @@
-from pub_oapi_tools_common.misc import log
-import requests
+from __future__ import annotations
+
+from pub_oapi_tools_common.misc import log, iter_json_array, windowed_map
+from pub_oapi_tools_common import http_transport
+from pub_oapi_tools_common.rate_limit import AdaptiveRateLimiter
+from pub_oapi_tools_common.single_flight import SingleFlight
+from pub_oapi_tools_common.sqlite_store import TtlCache
 from math import ceil
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import requests
+
+
+# Shared by all OstiGovApi objects in a process, as they share one quota.
+SHARED_RATE_LIMITER = AdaptiveRateLimiter()
+
+
+def strip_doi(doi: str) -> str:
+    """
+    Removes whitespace and any URL or "doi:" prefix from a DOI.
+
+    :param doi: e.g. " https://doi.org/10.1103/PhysRevLett.127.050501"
+    :return: e.g. "10.1103/PhysRevLett.127.050501"
+    """
+    import re
+    return re.sub(r"^(https?://(dx\.)?doi\.org/|doi:)", "", doi.strip(),
+                  flags=re.IGNORECASE).strip()
+
+
+def normalize_doi(doi: str) -> str:
+    """
+    DOIs are case-insensitive, so the canonical form is
+    the stripped DOI in lowercase.
+
+    :param doi: A DOI, with or without "https://doi.org/".
+    :return: e.g. "10.1103/physrevlett.127.050501"
+    """
+    return strip_doi(doi).lower()
 
 
 class OstiGovApi:
 
     def __init__(self,
+                 pool_size: int = 10,
+                 retries: int = 3,
+                 rate_limiter: AdaptiveRateLimiter = None,
+                 single_flight: SingleFlight = None,
+                 transport: http_transport.HttpTransport = None,
                  quiet: bool = False,
                  verbose: bool = False):
         """
@@ -14,6 +55,21 @@ class OstiGovApi:
         This is a public API that doesn't require authentication,
         however the headers indicate rate limiting may be applied.
 
+        All requests pass through an AdaptiveRateLimiter, which follows
+        the API's rate-limit headers, pauses on 429s and Retry-After,
+        and raises concurrency while there's headroom.
+
+        :param pool_size: Max open connections to the API.
+            Set to at least the max_workers used for queries.
+        :param retries: Max retries for a failed request.
+        :param rate_limiter: Defaults to SHARED_RATE_LIMITER, which is
+            shared by every OstiGovApi in the process.
+        :param single_flight: Coalesces concurrent identical lookups
+            (lookup_doi, get_record, and get_doi with decode_json),
+            including those made by get_dois(). Defaults to one per OstiGovApi.
+        :param transport: An http_transport.HttpTransport to send requests
+            with, instead of one built from pool_size, retries, and
+            rate_limiter (with TRANSPORT_SETTINGS['osti_gov'] applied).
         :param quiet: Suppresses non-error logging output.
         :param verbose: Prints extra debug info.
         """
@@ -22,69 +78,228 @@ class OstiGovApi:
         self.quiet = quiet
         self.verbose = verbose
 
+        # Session() is recommended for multi-req. pagination
+        self.transport = transport if transport else http_transport.HttpTransport.for_upstream(
+            'osti_gov',
+            pool_size=pool_size,
+            retry_policy=http_transport.RetryPolicy(retries=retries),
+            rate_limiter=rate_limiter if rate_limiter else SHARED_RATE_LIMITER,
+            quiet=quiet)
+        self.session = self.transport.session
+        self.stats = self.transport.stats
+        self.rate_limiter = self.transport.rate_limiter
+        self.single_flight = single_flight if single_flight else SingleFlight()
+
+    def _request(self,
+                 endpoint: str,
+                 method: str,
+                 url: str,
+                 **kwargs) -> requests.Response:
+        """
+        Sends a request through the transport, with retries.
+        """
+        return self.transport.request(method, url, endpoint=endpoint, **kwargs)
+
+    def _get_records_page(self, params: dict, page: int) -> requests.Response:
+        req_url = f"{self.osti_gov_api}/records"
+        response = self._request('records', 'GET', req_url,
+                                 params=dict(params, page=page))
+        if not response.ok:
+            log("ERROR", __name__,
+                f"OSTI.GOV API returned {response.status_code} for page {page}: "
+                f"{response.text[:200]}")
+        return response
+
+    def iter_records_pages(self,
+                           params: dict,
+                           rows: int = 100,
+                           max_workers: int = 1,
+                           decode=None):
+        """
+        A generator yielding each page of a /records search
+        as a list of records dicts, in page order.
+
+        The first page gives the total page count (X-Total-Count).
+        With max_workers > 1, the remaining pages are fetched
+        concurrently, keeping a bounded number of pages in memory.
+
+        :param params: Search params for the records enpoint
+        :param rows: Number of rows per page
+        :param max_workers: Max pages fetched at once.
+        :param decode: A function turning each page's response into
+            what's yielded, in place of response.json().
+            With max_workers > 1, it's called in the worker threads.
+        :return: A generator of lists of records dicts.
+        """
+        params = dict(params, rows=rows)
+        decode = decode or (lambda response: response.json())
+
+        if not self.quiet:
+            log("INFO", __name__,
+                f"Quering OSTI.GOV API for pagination data and first page.")
+
+        # Calculate the number of pages from total records found and row count
+        first_response = self._get_records_page(params, 1)
+        total_rows = int(first_response.headers['X-Total-Count'])
+        num_pages = ceil(total_rows / rows)
+
+        if not self.quiet:
+            log("INFO", __name__,
+                f"{total_rows} total rows found / {rows} rows per page = "
+                f"{num_pages} total pages for this query.")
+
+        # Yield the first page body json
+        yield decode(first_response)
+
+        def get_page(page):
+            if not self.quiet:
+                log("INFO", __name__,
+                    f"Querying OSTI.GOV API, page: {page} / {num_pages}")
+            return decode(self._get_records_page(params, page))
+
+        if max_workers <= 1:
+            for page in range(2, num_pages + 1):
+                yield get_page(page)
+            return
+
+        yield from windowed_map(get_page, range(2, num_pages + 1), max_workers)
+
     def query_records(self,
                       params: dict,
-                      rows: int = 100) -> list:
+                      rows: int = 100,
+                      max_workers: int = 1,
+                      stream: bool = False,
+                      compact: bool = False):
         """
         Sends a search query to the /records endpoint.
         This function handles pagination and merging data from pages.
 
         :param params: Search params for the records enpoint
         :param rows: Number of rows per page
+        :param max_workers: Max pages fetched at once. With the default of 1,
+            pages are fetched one after another.
+        :param stream: If True, returns a generator yielding records as
+            pages arrive, rather than building one list in memory.
+        :param compact: Return OstiRecord objects instead of records dicts,
+            to save memory when holding many records. Each keeps its
+            record's JSON as sliced from the response body.
         :return: A list of records dicts, merged from
-            all pages in the records search
+            all pages in the records search (or a generator, if stream=True)
         """
 
-        # Session() is recommended for multi-req. pagination
-        with requests.Session() as session:
-
-            # A generator function that yields all pages sequentially
-            def get_records_pages():
-                params['rows'] = rows
-                req_url = f"{self.osti_gov_api}/records"
-
-                if not self.quiet:
-                    log("INFO", __name__,
-                        f"Quering OSTI.GOV API for pagination data and first page.")
-
-                # Calculate the number of pages from total records found and row count
-                first_response = session.get(req_url, params=params)
-                total_rows = int(first_response.headers['X-Total-Count'])
-                num_pages = ceil(total_rows / rows)
-
-                if not self.quiet:
-                    log("INFO", __name__,
-                        f"{total_rows} total rows found / {rows} rows per page = "
-                        f"{num_pages} total pages for this query.")
-
-                # Yield the first page body json
-                first_page = first_response.json()
-                yield first_page
-
-                # Loop through the pages, yielding page body jsons
-                for page in range(2, num_pages + 1):
-                    if not self.quiet:
-                        log("INFO", __name__,
-                            f"Querying OSTI.GOV API, page: {page} / {num_pages}")
-                    params['page'] = page
-                    next_page = session.get(req_url, params=params).json()
-                    yield next_page
-
-            # Use the generator to get response pages and merge them
-            merged_pages = []
-            for records_page in get_records_pages():
-                merged_pages += records_page
+        def compact_page(response):
+            return [OstiRecord.from_json(raw, record=record)
+                    for record, raw in iter_json_array(response.content.decode('utf-8'))]
+
+        pages = self.iter_records_pages(params, rows=rows, max_workers=max_workers,
+                                        decode=compact_page if compact else None)
+
+        if stream:
+            return (record for records_page in pages for record in records_page)
+
+        # Use the generator to get response pages and merge them
+        merged_pages = []
+        for records_page in pages:
+            merged_pages += records_page
 
         return merged_pages
 
-    def get_doi(self, doi: str) -> dict:
+    def spool_records(self,
+                      params: dict,
+                      spool_dir: str,
+                      rows: int = 100,
+                      max_workers: int = 1,
+                      compress: bool = True):
+        """
+        Runs a /records search, writing each page to disk as JSON Lines,
+        so huge queries use constant memory and survive failures.
+
+        Completed pages are listed in <spool_dir>/manifest.json.
+        Calling this again with the same params and spool_dir resumes
+        from the manifest, only fetching the missing pages. The page
+        count from the original run is kept so page numbers stay stable.
+
+        Unless params set a sort, records are sorted by entry_date
+        ascending, so records added between runs land after the
+        spooled ones instead of shifting them across page boundaries.
+
+        :param params: Search params for the records enpoint
+        :param spool_dir: Directory for the page files and manifest.
+        :param rows: Number of rows per page
+        :param max_workers: Max pages fetched at once.
+        :param compress: gzip the page files.
+        :return: A SpooledRecords, a lazy iterable over the spooled records.
+        """
+        import os
+        from threading import Lock
+
+        os.makedirs(spool_dir, exist_ok=True)
+        spool = SpooledRecords(spool_dir)
+        params = dict(params, rows=rows)
+        if 'sort' not in params:
+            params.update(sort='entry_date', order='asc')
+
+        if spool.manifest:
+            if spool.manifest['params'] != params:
+                log("ERROR", __name__,
+                    f"{spool_dir} contains a spool for different params: "
+                    f"{spool.manifest['params']}")
+            if not self.quiet:
+                log("INFO", __name__,
+                    f"Resuming spool: {len(spool.manifest['completed_pages'])} / "
+                    f"{spool.manifest['num_pages']} pages already complete.")
+        else:
+            first_response = self._get_records_page(params, 1)
+            total_rows = int(first_response.headers['X-Total-Count'])
+            spool.manifest = {'params': params,
+                              'total_rows': total_rows,
+                              'num_pages': max(1, ceil(total_rows / rows)),
+                              'compress': compress,
+                              'completed_pages': {}}
+            spool.write_page(1, first_response.json())
+
+            if not self.quiet:
+                log("INFO", __name__,
+                    f"Spooling {total_rows} records in "
+                    f"{spool.manifest['num_pages']} pages to {spool_dir}")
+
+        remaining = [page for page in range(1, spool.manifest['num_pages'] + 1)
+                     if str(page) not in spool.manifest['completed_pages']]
+        manifest_lock = Lock()
+
+        def spool_page(page):
+            records = self._get_records_page(params, page).json()
+            with manifest_lock:
+                spool.write_page(page, records)
+            if self.verbose:
+                log("DEBUG", __name__, f"Spooled page {page}: {len(records)} records")
+
+        for _ in windowed_map(spool_page, remaining, max_workers):
+            pass
+
+        if not self.quiet:
+            log("INFO", __name__,
+                f"Spool complete: {spool.manifest['num_pages']} pages in {spool_dir}")
+
+        return spool
+
+    def get_doi(self, doi: str, decode_json: bool = False):
         """
         Returns the OSTI record for a single DOI.
         NOTE! This is current case-sensitive, but they're
         working on making it insensitive.
 
+        With decode_json, concurrent calls for the same DOI share one
+        request and its decoded records, see single_flight.SingleFlight.
+        Response objects aren't shared, so without it each call sends
+        its own request.
+
         :param doi: A DOI, the "https://doi.org/" can be excluded.
-        :return: A request response object
+        :param decode_json: If True, returns the decoded records list.
+        :return: A request response object, or with decode_json, the
+            list of records found (empty if none).
+        :raises requests.HTTPError: With decode_json, for non-2XX
+            responses other than 404.
         """
 
         if not self.quiet:
@@ -93,19 +308,546 @@ class OstiGovApi:
 
         req_url = f"{self.osti_gov_api}/records"
         params = {'doi': doi}
-        response = requests.get(req_url, params=params)
+        if decode_json:
+            return self.single_flight.do(
+                ('doi', req_url, doi), self._search_dois, params)
+
+        response = self._request('doi', 'GET', req_url, params=params)
 
         return response
 
-    def download_fulltext(self, fulltext_url: str, output_dir: str = "./"):
+    def get_dois(self,
+                 dois: list,
+                 cache_path: str = None,
+                 ttl_days: float = 30,
+                 negative_ttl_days: float = 1,
+                 dois_per_query: int = 1,
+                 max_workers: int = 4) -> dict:
+        """
+        Looks up the OSTI records for many DOIs.
+
+        DOIs are normalized (see normalize_doi) and de-duplicated.
+        As the API is case-sensitive, each DOI is tried as given, then
+        lowercased if that's different. Lookups run concurrently, and
+        with a cache_path, results (including not-found results) are
+        kept in an SQLite cache between runs.
+
+        A failed packed search falls back to single lookups. A failed
+        single lookup is logged, returned as None and not cached,
+        so the next run tries it again.
+
+        :param dois: An iterable of DOIs, with or without "https://doi.org/".
+        :param cache_path: Optional path to the SQLite cache file.
+        :param ttl_days: How long found records are cached.
+        :param negative_ttl_days: How long not-found results are cached.
+        :param dois_per_query: DOIs packed into each search using the
+            q param (doi:"a" OR doi:"b"). DOIs missing from a packed
+            search are retried individually. 1 disables packing.
+        :param max_workers: Max lookups in flight at once.
+        :return: A dict of {normalized DOI: record dict, or None if not found}
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        import requests
+
+        # Keep the first form of each DOI, for its original case
+        wanted = {}
+        for doi in dois:
+            if doi and normalize_doi(doi) not in wanted:
+                wanted[normalize_doi(doi)] = strip_doi(doi)
+
+        cache = DoiCache(cache_path, ttl_days, negative_ttl_days) if cache_path else None
+        results = cache.get_many(wanted.keys()) if cache else {}
+        missing = [key for key in wanted if key not in results]
+
+        if not self.quiet:
+            log("INFO", __name__,
+                f"Looking up {len(wanted)} unique DOIs: {len(results)} cached, "
+                f"{len(missing)} to query.")
+
+        def lookup_batch(keys):
+            found = {}
+            if len(keys) > 1:
+                try:
+                    found = self._query_dois([wanted[key] for key in keys])
+                except requests.exceptions.RequestException as e:
+                    log("WARN", __name__,
+                        f"Packed DOI search failed ({e}), looking up "
+                        f"its {len(keys)} DOIs one at a time.")
+
+            failed = set()
+            for key in keys:
+                if key not in found:
+                    try:
+                        found[key] = self.lookup_doi(wanted[key])
+                    except requests.exceptions.RequestException as e:
+                        log("WARN", __name__, f"DOI lookup failed ({e}): {wanted[key]}")
+                        found[key] = None
+                        failed.add(key)
+
+            if cache:
+                cache.set_many({key: found[key] for key in keys if key not in failed})
+            return found
+
+        batches = [missing[i:i + dois_per_query]
+                   for i in range(0, len(missing), dois_per_query)]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for found in executor.map(lookup_batch, batches):
+                results.update(found)
+
+        if cache:
+            cache.close()
+
+        return {key: results[key] for key in wanted}
+
+    def _search_dois(self, params: dict) -> list:
+        """
+        :return: The records found.
+        :raises requests.HTTPError: For non-2XX responses other than 404.
+        """
+        req_url = f"{self.osti_gov_api}/records"
+        response = self._request('doi', 'GET', req_url, params=params)
+        if response.status_code == 404:
+            return []
+        response.raise_for_status()
+        return response.json()
+
+    def _query_dois(self, dois: list) -> dict:
+        """
+        Searches for several DOIs at once.
+
+        :return: A dict of {normalized DOI: record} for the DOIs found.
+        """
+        query = ' OR '.join(f'doi:"{doi}"' for doi in dois)
+        found = {}
+        for record in self._search_dois({'q': query, 'rows': len(dois) * 2}):
+            if record.get('doi'):
+                found.setdefault(normalize_doi(record['doi']), record)
+        return {key: record for key, record in found.items()
+                if key in {normalize_doi(doi) for doi in dois}}
+
+    def lookup_doi(self, doi: str):
+        """
+        Looks up a single DOI as given, then lowercased if that's different.
+        Unlike get_doi(), returns the record itself.
+
+        Concurrent lookups of the same (normalized) DOI share one lookup
+        and its record, see single_flight.SingleFlight.
+
+        :param doi: A DOI, without "https://doi.org/".
+        :return: The record dict, or None if not found.
+        :raises requests.RequestException: If a request fails.
+        """
+        key = normalize_doi(doi)
+        return self.single_flight.do(
+            ('lookup_doi', self.osti_gov_api, key), self._lookup_doi, doi, key)
+
+    def _lookup_doi(self, doi: str, key: str):
+        for variant in dict.fromkeys([doi, doi.lower()]):
+            for record in self._search_dois({'doi': variant}):
+                if normalize_doi(record.get('doi') or '') == key:
+                    return record
+        return None
+
+    def get_record(self, osti_id):
+        """
+        Returns a single record by its OSTI ID.
+
+        Concurrent calls for the same OSTI ID share one request
+        and its record, see single_flight.SingleFlight.
+
+        :param osti_id: e.g. 1963892
+        :return: The record dict, or None if not found.
+        :raises requests.HTTPError: For non-2XX responses other than 404.
+        """
+        req_url = f"{self.osti_gov_api}/records/{osti_id}"
+        return self.single_flight.do(('record', req_url), self._get_record, req_url)
+
+    def _get_record(self, req_url: str):
+        response = self._request('records', 'GET', req_url)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        records = response.json()
+        return records[0] if records else None
+
+    def download_fulltext(self,
+                          fulltext_url: str,
+                          output_dir: str = "./",
+                          chunk_size: int = 1024 * 1024) -> dict:
+        """
+        Downloads a fulltext PDF to <output_dir>/<osti_id>.pdf.
+
+        The body is streamed to a .part file in chunks, then renamed into
+        place, so a <osti_id>.pdf file is always complete. Existing files
+        whose size matches the remote file's are skipped (as are files
+        whose remote size can't be found), and an existing .part file is
+        resumed with an HTTP Range request. Non-PDF responses are not saved.
+
+        :param fulltext_url: e.g. https://www.osti.gov/servlets/purl/1963892
+        :param output_dir: Destination directory. Created if missing.
+        :param chunk_size: Bytes read and written at a time.
+        :return: A dict with url, path, status (downloaded, resumed,
+            skipped, not_pdf, incomplete), bytes (transferred), seconds,
+            and bytes_per_second.
+        """
+        import os
+        from time import perf_counter
+
+        start = perf_counter()
+        osti_id = fulltext_url.split('/')[-1]
+        os.makedirs(output_dir, exist_ok=True)
+        path = os.path.join(output_dir, f"{osti_id}.pdf")
+        part_path = f"{path}.part"
+        result = {'url': fulltext_url, 'path': path, 'bytes': 0}
+
+        def done(status):
+            result['status'] = status
+            result['seconds'] = perf_counter() - start
+            result['bytes_per_second'] = \
+                result['bytes'] / result['seconds'] if result['seconds'] else 0.0
+            if self.verbose:
+                log("DEBUG", __name__, f"Fulltext {status}: {result}")
+            return result
+
+        if os.path.exists(path):
+            remote_size = self._remote_size(fulltext_url)
+            if remote_size is None or remote_size == os.path.getsize(path):
+                return done('skipped')
+
         if not self.quiet:
             log("INFO", __name__, f"Downloading PDF from: {fulltext_url}")
 
-        with requests.session() as session:
-            response = session.get(fulltext_url, headers=headers)
-            file_type = response.headers['content-Type']
-            osti_id = fulltext_url.split('/')[-1]
+        # Resume a partial download, if there is one
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {'Accept-Encoding': 'identity'}
+        if offset:
+            headers['Range'] = f"bytes={offset}-"
+
+        response = self._request('fulltext', 'GET', fulltext_url,
+                                 headers=headers, stream=True)
+        try:
+            if response.status_code == 416:
+                # The range starts past the end. The part file is only
+                # complete if it's exactly the size of the remote file.
+                if _content_range_total(response) == offset:
+                    os.replace(part_path, path)
+                    return done('resumed')
+                log("WARN", __name__,
+                    f"{part_path} doesn't match the remote file, "
+                    f"starting over: {fulltext_url}")
+                os.remove(part_path)
+                return self.download_fulltext(fulltext_url, output_dir, chunk_size)
+
+            response.raise_for_status()
+            file_type = response.headers.get('Content-Type', '')
+            if not file_type.startswith('application/pdf'):
+                log("WARN", __name__,
+                    f"Not a PDF ({file_type}), skipping: {fulltext_url}")
+                return done('not_pdf')
+
+            # 200 means the server ignored the Range header: start over
+            resumed = offset and response.status_code == 206
+            with open(part_path, 'ab' if resumed else 'wb') as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+                    result['bytes'] += len(chunk)
+
+            expected = response.headers.get('Content-Length')
+            if expected and expected.isdigit() and int(expected) != result['bytes']:
+                log("WARN", __name__,
+                    f"Incomplete download ({result['bytes']} of {expected} bytes), "
+                    f"keeping {part_path} to resume: {fulltext_url}")
+                return done('incomplete')
+
+            os.replace(part_path, path)
+        finally:
+            response.close()
+
+        return done('resumed' if resumed else 'downloaded')
+
+    def _remote_size(self, fulltext_url: str):
+        """
+        :return: The size in bytes of the file at a URL, from a HEAD
+            request or, if that fails or has no Content-Length, a
+            one-byte Range request. None if neither gives a size.
+        """
+        headers = {'Accept-Encoding': 'identity'}
+        head = self._request('fulltext', 'HEAD', fulltext_url,
+                             headers=headers, allow_redirects=True)
+        length = head.headers.get('Content-Length')
+        if head.ok and length and length.isdigit():
+            return int(length)
+
+        response = self._request('fulltext', 'GET', fulltext_url,
+                                 headers=dict(headers, Range='bytes=0-0'), stream=True)
+        try:
+            if response.status_code == 206:
+                return _content_range_total(response)
+            length = response.headers.get('Content-Length')
+            if response.status_code == 200 and length and length.isdigit():
+                return int(length)
+            return None
+        finally:
+            response.close()
+
+    def download_fulltexts(self,
+                           fulltext_urls: list,
+                           output_dir: str = "./",
+                           max_workers: int = 4) -> list:
+        """
+        Downloads many fulltext PDFs with a bounded worker pool.
+        See download_fulltext().
+
+        :param fulltext_urls: An iterable of fulltext URLs.
+        :param output_dir: Destination directory.
+        :param max_workers: Max downloads at once.
+        :return: A dict with results (a list of download_fulltext()
+            result dicts, where failed downloads have status 'error' and
+            an error message), statuses (counts per status), bytes,
+            seconds, and bytes_per_second across all downloads.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from time import perf_counter
+        import requests
+
+        start = perf_counter()
+
+        def download(url):
+            try:
+                return self.download_fulltext(url, output_dir)
+            except (requests.exceptions.RequestException, OSError) as e:
+                log("WARN", __name__, f"Download failed: {url}: {e}")
+                return {'url': url, 'status': 'error', 'error': repr(e), 'bytes': 0}
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(download, fulltext_urls))
+
+        elapsed = perf_counter() - start
+        summary = {'results': results,
+                   'statuses': {},
+                   'bytes': sum(r['bytes'] for r in results),
+                   'seconds': elapsed}
+        summary['bytes_per_second'] = summary['bytes'] / elapsed if elapsed else 0.0
+        for r in results:
+            summary['statuses'][r['status']] = summary['statuses'].get(r['status'], 0) + 1
+
+        if not self.quiet:
+            log("INFO", __name__,
+                f"Downloaded {summary['bytes']} bytes in {elapsed:.1f}s "
+                f"({summary['bytes_per_second']:.0f} bytes/s). {summary['statuses']}")
+
+        return summary
+
+
+def _content_range_total(response: requests.Response):
+    """
+    :return: The complete length from a Content-Range header
+        (e.g. "bytes 0-0/1234" or "bytes */1234"), or None.
+    """
+    total = response.headers.get('Content-Range', '').rpartition('/')[2].strip()
+    return int(total) if total.isdigit() else None
+
+
+class OstiRecord:
+    __slots__ = ('osti_id', 'doi', 'title', 'publication_date',
+                 'fulltext_url', '_raw')
+
+    def __init__(self,
+                 osti_id: str,
+                 doi: str = None,
+                 title: str = None,
+                 publication_date: str = None,
+                 fulltext_url: str = None,
+                 raw: bytes = None):
+        """
+        A compact OSTI.GOV record: the fields used for reconciliation,
+        plus optionally the record's JSON as bytes, parsed only when
+        to_dict() or get() need it. Much smaller than the record dict.
+
+        :param osti_id: e.g. "1963892"
+        :param doi: The DOI as given by OSTI.GOV.
+        :param title: The record title.
+        :param publication_date: e.g. "2023-01-01T00:00:00Z"
+        :param fulltext_url: The "fulltext" link, if any.
+        :param raw: The full record as UTF-8 JSON.
+        """
+        self.osti_id = osti_id
+        self.doi = doi
+        self.title = title
+        self.publication_date = publication_date
+        self.fulltext_url = fulltext_url
+        self._raw = raw
+
+    @classmethod
+    def from_json(cls,
+                  raw,
+                  record: dict = None,
+                  keep_raw: bool = True):
+        """
+        Builds a record from its JSON, keeping that JSON as it is,
+        rather than re-serializing a decoded dict.
+
+        :param raw: The record's JSON, as bytes or str,
+            e.g. from misc.iter_json_array().
+        :param record: raw, already decoded, to avoid decoding it again.
+        :param keep_raw: Keep the full record, for to_dict() and get().
+        :return: An OstiRecord
+        """
+        import json
+
+        if record is None:
+            record = json.loads(raw)
+        if isinstance(raw, str):
+            raw = raw.encode('utf-8')
+
+        fulltext = [link['href'] for link in record.get('links', [])
+                    if link.get('rel') == 'fulltext']
+        return cls(str(record['osti_id']),
+                   doi=record.get('doi'),
+                   title=record.get('title'),
+                   publication_date=record.get('publication_date'),
+                   fulltext_url=fulltext[0] if fulltext else None,
+                   raw=raw if keep_raw else None)
+
+    @classmethod
+    def from_dict(cls,
+                  record: dict,
+                  keep_raw: bool = True):
+        """
+        Builds a record from a decoded dict. Keeping the raw JSON
+        means re-serializing the dict: use from_json() if the JSON
+        is at hand. Either way, only the retained memory is reduced.
+
+        :param record: A records dict from the /records endpoint.
+        :param keep_raw: Keep the full record, for to_dict() and get().
+        :return: An OstiRecord
+        """
+        import json
+
+        raw = json.dumps(record, separators=(',', ':')) if keep_raw else None
+        return cls.from_json(raw, record=record, keep_raw=keep_raw)
+
+    def to_dict(self) -> dict:
+        """
+        :return: The full record dict if it was kept,
+            otherwise a dict of the compact fields.
+        """
+        import json
+
+        if self._raw is not None:
+            return json.loads(self._raw)
+        record = {'osti_id': self.osti_id,
+                  'doi': self.doi,
+                  'title': self.title,
+                  'publication_date': self.publication_date}
+        if self.fulltext_url:
+            record['links'] = [{'rel': 'fulltext', 'href': self.fulltext_url}]
+        return record
+
+    def get(self, field: str, default=None):
+        """
+        Reads any field of the record, parsing the raw JSON if needed.
+
+        :param field: A records field, e.g. "authors"
+        :param default: Returned if the field is missing.
+        """
+        if field in self.__slots__ and not field.startswith('_'):
+            value = getattr(self, field)
+            return default if value is None else value
+        return self.to_dict().get(field, default)
+
+    def __repr__(self):
+        return f"OstiRecord({self.osti_id!r}, doi={self.doi!r})"
+
+
+class SpooledRecords:
+
+    def __init__(self, spool_dir: str):
+        """
+        A lazy, re-iterable reader over records spooled to disk
+        by OstiGovApi.spool_records(), in page order. Only one page
+        file is open at a time, and records are decoded line by line.
 
-            if file_type == 'application/pdf':
-                with open(f'{output_dir}/{osti_id}.pdf', 'wb') as f:
-                    f.write(response.content)
+        :param spool_dir: Directory containing manifest.json and page files.
+        """
+        import json
+        import os
+
+        self.spool_dir = spool_dir
+        self.manifest_path = os.path.join(spool_dir, 'manifest.json')
+        self.manifest = None
+
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+
+    def page_path(self, page: int) -> str:
+        import os
+        suffix = '.jsonl.gz' if self.manifest['compress'] else '.jsonl'
+        return os.path.join(self.spool_dir, f"page-{page:06d}{suffix}")
+
+    def _open(self, path: str, mode: str):
+        import gzip
+        if self.manifest['compress']:
+            return gzip.open(path, mode, encoding='utf-8')
+        return open(path, mode, encoding='utf-8')
+
+    def write_page(self, page: int, records: list):
+        """
+        Atomically writes a page file, then records
+        the page as complete in the manifest.
+        """
+        import json
+        import os
+
+        tmp_path = f"{self.page_path(page)}.tmp"
+        with self._open(tmp_path, 'wt') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+        os.replace(tmp_path, self.page_path(page))
+
+        self.manifest['completed_pages'][str(page)] = len(records)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    @property
+    def complete(self) -> bool:
+        """
+        :return: True if every page has been spooled.
+        """
+        return bool(self.manifest) and \
+            len(self.manifest['completed_pages']) == self.manifest['num_pages']
+
+    def __len__(self) -> int:
+        return sum(self.manifest['completed_pages'].values()) if self.manifest else 0
+
+    def __iter__(self):
+        import json
+
+        if not self.manifest:
+            return
+        for page in sorted(int(p) for p in self.manifest['completed_pages']):
+            with self._open(self.page_path(page), 'rt') as f:
+                for line in f:
+                    yield json.loads(line)
+
+
+class DoiCache(TtlCache):
+
+    def __init__(self,
+                 path: str,
+                 ttl_days: float = 30,
+                 negative_ttl_days: float = 1):
+        """
+        A persistent DOI-to-record cache in an SQLite file, keyed by
+        normalized DOI. Not-found results are cached too, for a shorter
+        time. See sqlite_store.TtlCache for get_many(), set_many() and stats().
+
+        :param path: Path to the SQLite file. Created if missing.
+        :param ttl_days: How long found records are kept.
+        :param negative_ttl_days: How long not-found results are kept.
+        """
+        super().__init__(path, 'dois', 'doi', 'record',
+                         ttl_days=ttl_days, negative_ttl_days=negative_ttl_days)
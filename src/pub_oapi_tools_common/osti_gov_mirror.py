@@ -0,0 +1,260 @@
+"""
+A local, indexed mirror of OSTI.GOV records, harvested
+with OstiGovApi and kept in an SQLite file.
+"""
+
+from pub_oapi_tools_common.misc import log
+from pub_oapi_tools_common.osti_gov_api import OstiGovApi, normalize_doi, strip_doi
+from pub_oapi_tools_common.sqlite_store import SqliteStore
+
+
+class OstiGovMirror(SqliteStore):
+
+    def __init__(self,
+                 path: str,
+                 osti_gov_api: OstiGovApi = None,
+                 quiet: bool = False,
+                 verbose: bool = False):
+        """
+        Records are stored as JSON, indexed on osti_id, lowercased DOI
+        and publication date. harvest() refreshes the mirror one date
+        window at a time, saving its progress after each window, so
+        repeated runs only fetch records entered since the last one.
+
+        Lookups are answered from the local file, falling back to the
+        live API on a miss (and storing what it finds).
+
+        :param path: Path to the SQLite file. Created if missing.
+        :param osti_gov_api: An OstiGovApi for harvests and fallback lookups.
+            Defaults to a new one.
+        :param quiet: Suppresses non-error logging output.
+        :param verbose: Prints extra debug info.
+        """
+        super().__init__(path, wal=True, schema=[
+            "CREATE TABLE IF NOT EXISTS records ("
+            "osti_id TEXT PRIMARY KEY, doi TEXT, publication_date TEXT, "
+            "entry_date TEXT, record TEXT NOT NULL, harvested_at REAL NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS records_doi ON records (doi)",
+            "CREATE INDEX IF NOT EXISTS records_publication_date "
+            "ON records (publication_date)",
+            "CREATE TABLE IF NOT EXISTS harvests ("
+            "key TEXT PRIMARY KEY, harvested_through TEXT NOT NULL, updated_at REAL NOT NULL)"])
+
+        self.osti_gov_api = osti_gov_api if osti_gov_api \
+            else OstiGovApi(quiet=quiet, verbose=verbose)
+        self.quiet = quiet
+        self.verbose = verbose
+
+        self.counts = {'hits': 0, 'misses': 0, 'api_found': 0, 'api_not_found': 0}
+
+    def __len__(self) -> int:
+        return self.fetch_one("SELECT COUNT(*) FROM records")[0]
+
+    def _count(self, name: str):
+        with self.lock:
+            self.counts[name] += 1
+
+    def upsert(self, records: list) -> int:
+        """
+        Adds or replaces records in the mirror.
+
+        :param records: OSTI.GOV records dicts, each with an osti_id.
+        :return: The number of records stored.
+        """
+        import json
+        from time import time
+
+        rows = [(str(record['osti_id']),
+                 normalize_doi(record['doi']) if record.get('doi') else None,
+                 record.get('publication_date'),
+                 record.get('entry_date'),
+                 json.dumps(record),
+                 time())
+                for record in records if record.get('osti_id')]
+
+        self.write_many("INSERT OR REPLACE INTO records (osti_id, doi, publication_date, "
+                        "entry_date, record, harvested_at) VALUES (?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def harvest(self,
+                params: dict,
+                date_field: str = 'entry_date',
+                start=None,
+                end=None,
+                window_days: int = 30,
+                rows: int = 100,
+                max_workers: int = 1) -> dict:
+        """
+        Harvests a /records search into the mirror, one date window
+        at a time. After each window, the last date harvested is saved
+        for these params, and the next call resumes from that date
+        (inclusive, as records may have been added later that day).
+
+        e.g. harvest({'research_org': 'LBNL'}, start='2024-10-01')
+
+        :param params: Search params for the records endpoint,
+            without the date range.
+        :param date_field: Date param prefix for the windows:
+            entry_date (new and updated records) or publication_date.
+        :param start: First date (a datetime.date or "YYYY-MM-DD").
+            Defaults to where the last harvest of these params stopped.
+        :param end: Last date. Defaults to today.
+        :param window_days: Days per search window.
+        :param rows: Number of rows per page.
+        :param max_workers: Max pages fetched at once.
+        :return: A summary dict: windows, records, seconds, harvested_through.
+        """
+        import json
+        from datetime import date, timedelta
+        from time import perf_counter, time
+
+        key = json.dumps([params, date_field], sort_keys=True)
+        if start is None:
+            row = self.fetch_one("SELECT harvested_through FROM harvests WHERE key = ?",
+                                 (key,))
+            if not row:
+                log("ERROR", __name__,
+                    f"No previous harvest of {params}, a start date is required.")
+            start = row[0]
+
+        start = _to_date(start)
+        end = _to_date(end) if end else date.today()
+        summary = {'windows': 0, 'records': 0, 'harvested_through': None}
+        timer = perf_counter()
+
+        if not self.quiet:
+            log("INFO", __name__, f"Harvesting {params} by {date_field} "
+                                  f"from {start} to {end} into {self.path}")
+
+        window_start = start
+        while window_start <= end:
+            window_end = min(end, window_start + timedelta(days=window_days - 1))
+            window_params = dict(params, **{
+                f"{date_field}_start": window_start.strftime('%m/%d/%Y'),
+                f"{date_field}_end": window_end.strftime('%m/%d/%Y')})
+
+            for records_page in self.osti_gov_api.iter_records_pages(
+                    window_params, rows=rows, max_workers=max_workers):
+                summary['records'] += self.upsert(records_page)
+
+            self.write("INSERT OR REPLACE INTO harvests (key, harvested_through, updated_at) "
+                       "VALUES (?, ?, ?)", (key, window_end.isoformat(), time()))
+
+            summary['windows'] += 1
+            summary['harvested_through'] = window_end.isoformat()
+            if self.verbose:
+                log("DEBUG", __name__,
+                    f"Harvested {window_start} to {window_end}: "
+                    f"{summary['records']} records so far.")
+            window_start = window_end + timedelta(days=1)
+
+        summary['seconds'] = perf_counter() - timer
+        if not self.quiet:
+            log("INFO", __name__,
+                f"Harvested {summary['records']} records in {summary['windows']} "
+                f"windows ({summary['seconds']:.1f}s). Mirror size: {len(self)}")
+
+        return summary
+
+    def _get_local(self, column: str, value: str):
+        import json
+
+        row = self.fetch_one(f"SELECT record FROM records WHERE {column} = ?", (value,))
+        return json.loads(row[0]) if row else None
+
+    def get_doi(self,
+                doi: str,
+                fallback: bool = True):
+        """
+        Returns the record for a DOI from the mirror. Case-insensitive.
+
+        :param doi: A DOI, the "https://doi.org/" can be excluded.
+        :param fallback: On a miss, look the DOI up with the live API
+            (trying its case variants) and store the record if found.
+        :return: The record dict, or None if not found.
+        """
+        record = self._get_local('doi', normalize_doi(doi))
+        if record is not None or not fallback:
+            self._count('hits' if record is not None else 'misses')
+            return record
+
+        self._count('misses')
+        record = self.osti_gov_api.lookup_doi(strip_doi(doi))
+        self._store_fallback(record, doi)
+        return record
+
+    def get_osti_id(self,
+                    osti_id,
+                    fallback: bool = True):
+        """
+        Returns the record for an OSTI ID from the mirror.
+
+        :param osti_id: e.g. 1963892
+        :param fallback: On a miss, fetch the record from the live API
+            and store it if found.
+        :return: The record dict, or None if not found.
+        """
+        record = self._get_local('osti_id', str(osti_id))
+        if record is not None or not fallback:
+            self._count('hits' if record is not None else 'misses')
+            return record
+
+        self._count('misses')
+        record = self.osti_gov_api.get_record(osti_id)
+        self._store_fallback(record, osti_id)
+        return record
+
+    def _store_fallback(self, record, lookup):
+        if record is None:
+            self._count('api_not_found')
+            if self.verbose:
+                log("DEBUG", __name__, f"Not found in mirror or API: {lookup}")
+            return
+        self._count('api_found')
+        self.upsert([record])
+
+    def records_published(self, start, end):
+        """
+        A generator yielding the mirrored records published
+        between two dates (inclusive), in publication date order.
+        Rows are read as they're consumed, through a separate
+        read-only connection, so the mirror isn't locked meanwhile.
+
+        :param start: A datetime.date or "YYYY-MM-DD".
+        :param end: A datetime.date or "YYYY-MM-DD".
+        :return: A generator of records dicts.
+        """
+        import json
+        import sqlite3
+        from pathlib import Path
+
+        db = sqlite3.connect(f"{Path(self.path).resolve().as_uri()}?mode=ro", uri=True)
+        try:
+            # publication_date is ISO 8601, e.g. 2024-10-01T00:00:00Z
+            cursor = db.execute(
+                "SELECT record FROM records WHERE publication_date >= ? "
+                "AND publication_date < ? ORDER BY publication_date",
+                (_to_date(start).isoformat(), _next_day(_to_date(end))))
+            for row in cursor:
+                yield json.loads(row[0])
+        finally:
+            db.close()
+
+
+def _to_date(value):
+    """
+    :param value: A datetime.date, datetime.datetime, or "YYYY-MM-DD" string.
+    :return: A datetime.date
+    """
+    from datetime import date, datetime
+
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(value[:10])
+
+
+def _next_day(value) -> str:
+    from datetime import timedelta
+    return (value + timedelta(days=1)).isoformat()
@@ -0,0 +1,258 @@
+"""
+A content-addressed, on-disk cache for downloaded PDFs.
+
+Files are stored once per SHA-256 under <cache_dir>/objects, and an
+SQLite index maps each URL to its file along with the ETag and
+Last-Modified validators. Cached URLs are revalidated with conditional
+requests, and the least recently used files are evicted when the
+cache grows past its size limit.
+"""
+
+from __future__ import annotations
+
+from pub_oapi_tools_common.misc import log
+from pub_oapi_tools_common import http_transport
+from pub_oapi_tools_common.sqlite_store import SqliteStore
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import requests
+
+
+class PdfCache(SqliteStore):
+
+    def __init__(self,
+                 cache_dir: str,
+                 max_bytes: int = 5 * 1024 ** 3,
+                 revalidate_after: float = 0,
+                 retries: int = 3,
+                 transport: http_transport.HttpTransport = None,
+                 quiet: bool = False,
+                 verbose: bool = False):
+        """
+        :param cache_dir: Directory for the index and cached files. Created if missing.
+        :param max_bytes: Total size of cached files to keep.
+        :param revalidate_after: Seconds after a download or revalidation
+            during which the cached file is used without contacting the
+            server, e.g. for upload retries. 0 always revalidates.
+        :param retries: Max retries for failed downloads.
+        :param transport: An http_transport.HttpTransport to download
+            with, instead of one built from retries (with
+            TRANSPORT_SETTINGS['pdf_cache'] applied). Its default
+            timeout applies to every download.
+        :param quiet: Suppresses non-error logging output.
+        :param verbose: Prints extra debug info.
+        """
+        import os
+
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, 'objects')
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+        self.max_bytes = max_bytes
+        self.revalidate_after = revalidate_after
+        self.transport = transport if transport else http_transport.HttpTransport.for_upstream(
+            'pdf_cache',
+            retry_policy=http_transport.RetryPolicy(retries=retries),
+            quiet=quiet)
+        self.stats = self.transport.stats
+        self.quiet = quiet
+        self.verbose = verbose
+
+        super().__init__(os.path.join(cache_dir, 'index.db'), wal=True, schema=[
+            "CREATE TABLE IF NOT EXISTS urls ("
+            "url TEXT PRIMARY KEY, sha256 TEXT NOT NULL, size INTEGER NOT NULL, "
+            "etag TEXT, last_modified TEXT, "
+            "validated_at REAL NOT NULL, last_used REAL NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS urls_last_used ON urls (last_used)"])
+
+        self.counts = {'hits': 0, 'revalidated': 0, 'downloads': 0, 'evicted_files': 0}
+
+    def close(self):
+        self.transport.close()
+        super().close()
+
+    def object_path(self, sha256: str) -> str:
+        """
+        :param sha256: Hex digest of the file's contents.
+        :return: Path of the cached file.
+        """
+        import os
+        return os.path.join(self.objects_dir, sha256[:2], f"{sha256}.pdf")
+
+    def _lookup(self, url: str):
+        import os
+
+        row = self.fetch_one("SELECT sha256, size, etag, last_modified, validated_at "
+                             "FROM urls WHERE url = ?", (url,))
+
+        # Ignore index rows whose file has gone missing
+        if row and os.path.exists(self.object_path(row[0])):
+            return row
+        return None
+
+    def _count(self, name: str):
+        with self.lock:
+            self.counts[name] += 1
+
+    def _touch(self, url: str, validated: bool = False):
+        from time import time
+
+        if validated:
+            self.write("UPDATE urls SET last_used = ?, validated_at = ? "
+                       "WHERE url = ?", (time(), time(), url))
+        else:
+            self.write("UPDATE urls SET last_used = ? WHERE url = ?", (time(), url))
+
+    def fetch(self,
+              url: str,
+              headers: dict = None) -> str:
+        """
+        Returns the path to a local copy of the file at a URL,
+        downloading it only if it isn't cached or has changed.
+
+        :param url: The file's URL.
+        :param headers: Extra request headers (e.g. user-agent).
+        :return: Path to the cached file. Don't modify it: files are
+            shared by every URL with the same contents.
+        """
+        import os
+        from time import time
+
+        cached = self._lookup(url)
+        request_headers = dict(headers) if headers else {}
+
+        if cached:
+            sha256, size, etag, last_modified, validated_at = cached
+            if time() - validated_at < self.revalidate_after:
+                self._touch(url)
+                self._count('hits')
+                return self.object_path(sha256)
+
+            if etag:
+                request_headers['If-None-Match'] = etag
+            if last_modified:
+                request_headers['If-Modified-Since'] = last_modified
+
+        response = self.transport.request(
+            'GET', url,
+            endpoint='pdf_download',
+            headers=request_headers,
+            stream=True)
+
+        try:
+            if cached and response.status_code == 304:
+                self._touch(url, validated=True)
+                self._count('revalidated')
+                if self.verbose:
+                    log("DEBUG", __name__, f"Not modified, using cached file: {url}")
+                return self.object_path(cached[0])
+
+            response.raise_for_status()
+            path = self._store(url, response)
+        finally:
+            response.close()
+
+        self.evict(keep=os.path.basename(path)[:-len('.pdf')])
+        return path
+
+    def open(self,
+             url: str,
+             headers: dict = None,
+             attempts: int = 3):
+        """
+        Like fetch(), but returns the cached file already open for reading.
+        Another thread's eviction can delete a file between fetch()
+        returning its path and opening it, so that re-fetches. Once
+        open, the file stays readable even if it's evicted.
+
+        :param url: The file's URL.
+        :param headers: Extra request headers (e.g. user-agent).
+        :param attempts: Max fetches if the file keeps being evicted.
+        :return: The cached file, opened in binary mode.
+        """
+        for attempt in range(1, attempts + 1):
+            path = self.fetch(url, headers=headers)
+            try:
+                return open(path, 'rb')
+            except FileNotFoundError:
+                if attempt == attempts:
+                    raise
+                if self.verbose:
+                    log("DEBUG", __name__, f"Evicted before it was opened, re-fetching: {url}")
+
+    def _store(self, url: str, response: requests.Response) -> str:
+        """
+        Streams a download to a temp file, then moves it into
+        place under its SHA-256 and updates the index.
+        """
+        import hashlib
+        import os
+        import tempfile
+        from time import time
+
+        sha = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.objects_dir, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=1024 * 1024):
+                    f.write(chunk)
+                    sha.update(chunk)
+                    size += len(chunk)
+
+            sha256 = sha.hexdigest()
+            path = self.object_path(sha256)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.exists(path):
+                # Same contents already cached under another URL (or version)
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self.write("INSERT OR REPLACE INTO urls (url, sha256, size, etag, last_modified, "
+                   "validated_at, last_used) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                   (url, sha256, size,
+                    response.headers.get('ETag'),
+                    response.headers.get('Last-Modified'),
+                    time(), time()))
+
+        self._count('downloads')
+        if self.verbose:
+            log("DEBUG", __name__, f"Cached {size} bytes from {url} as {sha256}")
+
+        return path
+
+    def evict(self, keep: str = None):
+        """
+        Deletes the least recently used files until
+        the cache is within max_bytes.
+
+        :param keep: SHA-256 of a file not to evict, e.g. one just fetched.
+        """
+        import os
+
+        with self.lock:
+            # Distinct files, each with its most recent use across URLs
+            files = self.db.execute(
+                "SELECT sha256, MAX(size), MAX(last_used) FROM urls "
+                "GROUP BY sha256 ORDER BY MAX(last_used)").fetchall()
+            total = sum(size for _, size, _ in files)
+
+            for sha256, size, _ in files:
+                if total <= self.max_bytes:
+                    break
+                if sha256 == keep:
+                    continue
+                self.db.execute("DELETE FROM urls WHERE sha256 = ?", (sha256,))
+                path = self.object_path(sha256)
+                if os.path.exists(path):
+                    os.remove(path)
+                total -= size
+                self.counts['evicted_files'] += 1
+
+            self.db.commit()
@@ -2,8 +2,13 @@
 Functions for working with the pub-oapi-tools MySQL DB
 """
 
+from __future__ import annotations
+
 from pub_oapi_tools_common.misc import log
-import pymysql
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pymysql
 
 
 def get_connection(creds: dict = None,
@@ -26,6 +31,7 @@ def get_connection(creds: dict = None,
         https://pymysql.readthedocs.io/en/latest/modules/cursors.html#
     :return: An open PyMySQL connection.
     """
+    import pymysql
 
     log("INFO", __name__,
         (f"Connecting to pub-oapi-tools RDS. "
@@ -2,9 +2,14 @@
 Functions for working with the pub-oapi-tools MySQL DB
 """
 
+from __future__ import annotations
+
 from pub_oapi_tools_common.misc import log
 from pub_oapi_tools_common.misc import validate_creds
-import pymysql
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pymysql
 
 
 class PubOapiToolsDb:
@@ -29,6 +34,7 @@ class PubOapiToolsDb:
         :param quiet: Suppresses non-error logging output.
         :param verbose: Prints extra debug info.
         """
+        import pymysql
 
         # Set logging tags
         self.quiet = quiet
@@ -93,6 +99,8 @@ class PubOapiToolsDb:
         Establishes and returns a connection to the pub-oapi-tools RDS instance
         :return: a pymysql connection object
         """
+        import pymysql
+
         return pymysql.connect(
             host=self.creds['server'],
             user=self.creds['user'],
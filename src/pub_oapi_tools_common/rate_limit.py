@@ -0,0 +1,220 @@
+"""
+Rate limiters shared by the API client modules.
+"""
+
+from pub_oapi_tools_common.misc import log
+from threading import Lock
+from time import monotonic, sleep
+
+
+class TokenBucket:
+
+    def __init__(self,
+                 rate: float,
+                 capacity: float = None):
+        """
+        A thread-safe token bucket. Each request takes one token;
+        tokens refill at a steady rate up to the bucket capacity,
+        which allows short bursts.
+
+        Callers reserve their token immediately and then wait for it,
+        so waiting callers are served in order.
+
+        :param rate: Tokens added per second (i.e. sustained requests/sec).
+        :param capacity: Max burst size. Defaults to one second of tokens.
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = monotonic()
+        self.lock = Lock()
+
+    def reserve(self) -> float:
+        """
+        Takes a token, possibly one that hasn't been added yet.
+
+        :return: Seconds to wait before the token is available.
+        """
+        with self.lock:
+            now = monotonic()
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self):
+        """
+        Blocks until a token is available.
+        """
+        wait = self.reserve()
+        if wait:
+            sleep(wait)
+
+    async def acquire_async(self):
+        """
+        Waits (without blocking the event loop) until a token is available.
+        """
+        import asyncio
+
+        wait = self.reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+    def release(self, response=None):
+        """
+        No-op, so a TokenBucket can be used wherever
+        an AdaptiveRateLimiter can.
+        """
+        pass
+
+
+class AdaptiveRateLimiter:
+
+    def __init__(self,
+                 initial_rate: float = 10.0,
+                 min_rate: float = 0.2,
+                 max_rate: float = 50.0,
+                 initial_concurrency: int = 4,
+                 max_concurrency: int = 16,
+                 increase_every: int = 10,
+                 quiet: bool = False):
+        """
+        A thread-safe limiter which adapts to an API's rate-limit
+        response headers, for maximum throughput without being blocked.
+
+        Call acquire() before each request and release(response) after.
+
+        - X-RateLimit-Remaining / X-RateLimit-Reset (or the unprefixed
+          RateLimit-* headers) set the request rate to spread the
+          remaining quota evenly until the reset.
+        - A remaining quota of 0 pauses all requests until the reset.
+        - A 429 or a Retry-After header also pauses all requests,
+          and halves the rate and concurrency.
+        - Otherwise, rate and concurrency are raised a step after
+          every `increase_every` successful requests.
+
+        :param initial_rate: Starting requests per second.
+        :param min_rate: Lowest requests per second.
+        :param max_rate: Highest requests per second.
+        :param initial_concurrency: Starting max requests in flight.
+        :param max_concurrency: Highest max requests in flight.
+        :param increase_every: Successes needed before each increase.
+        :param quiet: Suppresses non-error logging output.
+        """
+        from threading import Condition
+
+        self.rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.increase_every = increase_every
+        self.quiet = quiet
+
+        self.condition = Condition()
+        self.in_flight = 0
+        self.next_slot = monotonic()
+        self.paused_until = 0.0
+        self.backed_off_until = 0.0
+        self.successes = 0
+        self.counts = {'requests': 0, 'throttled': 0, 'waited_seconds': 0.0}
+
+    def acquire(self):
+        """
+        Blocks until a request may be sent: a concurrency slot is free,
+        any pause has ended, and the request's turn at the current rate has come.
+        """
+        with self.condition:
+            while self.in_flight >= self.concurrency:
+                self.condition.wait()
+            self.in_flight += 1
+
+            # Reserve the next send time at the current rate
+            now = monotonic()
+            send_at = max(now, self.next_slot, self.paused_until)
+            self.next_slot = send_at + 1.0 / self.rate
+            self.counts['requests'] += 1
+            self.counts['waited_seconds'] += send_at - now
+
+        if send_at > now:
+            sleep(send_at - now)
+
+    def release(self, response=None):
+        """
+        Frees the request's concurrency slot and adapts to its response.
+
+        :param response: The requests.Response, or None if the request failed.
+        """
+        with self.condition:
+            self.in_flight -= 1
+            if response is not None:
+                self._adapt(response)
+            self.condition.notify_all()
+
+    def _adapt(self, response):
+        from pub_oapi_tools_common.http_transport import parse_retry_after
+
+        headers = response.headers
+        now = monotonic()
+
+        remaining = _header_number(headers, 'X-RateLimit-Remaining', 'RateLimit-Remaining')
+        reset = _header_number(headers, 'X-RateLimit-Reset', 'RateLimit-Reset')
+        retry_after = parse_retry_after(headers['Retry-After']) \
+            if headers.get('Retry-After') else None
+
+        # Reset may be an epoch timestamp or a number of seconds
+        reset_in = None
+        if reset is not None:
+            from time import time
+            reset_in = max(0.0, reset - time()) if reset > 1e9 else reset
+
+        if response.status_code == 429 or retry_after is not None:
+            pause = retry_after if retry_after is not None else reset_in
+            pause = pause if pause is not None else 1.0 / self.rate
+            self.counts['throttled'] += 1
+            self.successes = 0
+            self.paused_until = max(self.paused_until, now + pause)
+
+            # Requests already in flight when the pause began will also
+            # be throttled: only back off once per pause.
+            if now < self.backed_off_until:
+                return
+
+            self.backed_off_until = self.paused_until
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.concurrency = max(1, self.concurrency // 2)
+            if not self.quiet:
+                log("WARN", __name__,
+                    f"Rate limited, pausing {pause:.1f}s. Now {self.rate:.2f} req/s, "
+                    f"{self.concurrency} concurrent.")
+            return
+
+        if remaining == 0 and reset_in is not None:
+            # Quota used up without being blocked: wait for the reset
+            self.paused_until = max(self.paused_until, now + reset_in)
+
+        if remaining and reset_in:
+            # Spread the remaining quota evenly over the reset window
+            self.rate = min(self.max_rate, max(self.min_rate, remaining / reset_in))
+
+        self.successes += 1
+        if self.successes >= self.increase_every:
+            self.successes = 0
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+            if remaining is None:
+                self.rate = min(self.max_rate, self.rate * 1.5)
+
+
+def _header_number(headers, *names):
+    """
+    :return: The first of the named headers parsed as a float, or None.
+    """
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            try:
+                return float(value)
+            except ValueError:
+                pass
+    return None
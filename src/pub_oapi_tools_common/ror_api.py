@@ -1,15 +1,31 @@
+from __future__ import annotations
+
 from pub_oapi_tools_common.misc import log
 from pub_oapi_tools_common.misc import validate_creds
+from pub_oapi_tools_common.misc import iter_json_array, windowed_map
+from pub_oapi_tools_common import http_transport
+from pub_oapi_tools_common.single_flight import SingleFlight
+from pub_oapi_tools_common.sqlite_store import TtlCache
 
 from urllib.parse import quote
-from pprint import pprint
-from time import sleep
-import requests
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import requests
 
 
 class RorApi:
     def __init__(self,
                  creds: dict = None,
+                 cache_path: str = None,
+                 cache_ttl_days: float = 90,
+                 negative_ttl_days: float = 7,
+                 pool_size: int = 10,
+                 retries: int = 3,
+                 requests_per_window: int = None,
+                 window_seconds: float = 300,
+                 single_flight: SingleFlight = None,
+                 transport: http_transport.HttpTransport = None,
                  quiet: bool = False,
                  verbose: bool = False):
         """
@@ -18,6 +34,22 @@ class RorApi:
 
         :param env: Name of the environment to use. (typically 'prod' or 'qa')
         :param creds: A dict containing key/value pairs.
+        :param cache_path: Optional path to an SQLite file caching
+            affiliation_search results between runs. See AffiliationCache.
+        :param cache_ttl_days: How long cached matches are used.
+        :param negative_ttl_days: How long cached empty results are used.
+        :param pool_size: Max open connections to the API.
+            Set to at least the max_workers used for matching.
+        :param retries: Max retries for a failed request.
+        :param requests_per_window: Rate limit for all requests, spread
+            evenly over the window. Defaults to ROR's limits: 2000 per
+            5 minutes with a client-id, 50 without.
+        :param window_seconds: The rate limit window.
+        :param single_flight: Coalesces concurrent identical searches
+            (affiliation_search). Defaults to one per RorApi.
+        :param transport: An http_transport.HttpTransport to send requests
+            with, instead of one built from pool_size, retries, and the
+            rate limit (with TRANSPORT_SETTINGS['ror'] applied).
         :param quiet: Suppresses non-error logging output.
         :param verbose: Prints extra debug info.
         """
@@ -41,24 +73,61 @@ class RorApi:
         self.quiet = quiet
         self.verbose = verbose
 
+        from pub_oapi_tools_common.rate_limit import TokenBucket
+        if not requests_per_window:
+            requests_per_window = 2000 if creds.get('client-id') else 50
+        self.transport = transport if transport else http_transport.HttpTransport.for_upstream(
+            'ror',
+            pool_size=pool_size,
+            retry_policy=http_transport.RetryPolicy(retries=retries),
+            rate_limiter=TokenBucket(requests_per_window / window_seconds),
+            quiet=quiet)
+        self.session = self.transport.session
+        self.stats = self.transport.stats
+        self.rate_limiter = self.transport.rate_limiter
+        self.single_flight = single_flight if single_flight else SingleFlight()
+
+        self.affiliation_cache = AffiliationCache(
+            cache_path, ttl_days=cache_ttl_days,
+            negative_ttl_days=negative_ttl_days) if cache_path else None
+
+    def close(self):
+        self.transport.close()
+        if self.affiliation_cache:
+            self.affiliation_cache.close()
+
     def get_auth_header(self):
         """
         :return: Dict with Client-Id for req header
         """
         return {'Client-Id': self.creds['client-id']}
 
+    def _request(self,
+                 endpoint: str,
+                 method: str,
+                 url: str,
+                 **kwargs) -> requests.Response:
+        """
+        Sends a request through the transport,
+        with retries and the rate limit.
+        """
+        return self.transport.request(method, url, endpoint=endpoint, **kwargs)
+
     def test_req(self):
         headers = self.get_auth_header()
         req_url = f"{self.creds['endpoint']}/organizations"
         params = {'query': 'oxford'}
 
-        response = requests.get(
-            req_url, params=params, headers=headers)
+        response = self._request(
+            'test', 'GET', req_url, params=params, headers=headers)
 
         log("INFO", __name__, f"Req status code: {response.status_code}")
         log("INFO", __name__, f"Req body JSON: {response.json()}")
 
-    def affiliation_search(self, affiliation_string):
+    def affiliation_search(self,
+                           affiliation_string,
+                           compact: bool = False,
+                           raise_errors: bool = False):
         """
         Uses ROR's fuzzy affiliation matching to identify
         organizations from free text.
@@ -70,36 +139,75 @@ class RorApi:
         single search is a little more efficient and provides
         better results.
 
+        With a cache_path, results are looked up in the
+        AffiliationCache first, keyed by normalize_affiliation().
+        Concurrent searches for the same string share one request
+        and its items list, see single_flight.SingleFlight.
+
         :param affiliation_string: The affiliation string on which
             to search. This function handles the URL encoding if
             spaces or special characters appear in the string.
+        :param compact: Return RorMatch objects instead of the item dicts,
+            to save memory when holding many results. Each keeps its
+            item's JSON as sliced from the response body (or cache).
+        :param raise_errors: Raise requests.HTTPError if the request fails
+            (including a 429 still failing after retries), rather than
+            logging it and returning None, or exiting on a 5XX.
+        :return: The list of matched items, or None if
+            there were no matches or the request failed.
         """
 
-        log("INFO", __name__, f"Searching: {affiliation_string}")
+        found = False
+        if self.affiliation_cache:
+            found, items_json = self.affiliation_cache.get(affiliation_string, decode=False)
+            if found and self.verbose:
+                log("INFO", __name__, f"Cached: {affiliation_string}")
+
+        # Items are (item dict, item JSON) tuples
+        if found:
+            items = list(iter_json_array(items_json)) if items_json else None
+        else:
+            items = self.single_flight.do(
+                ('affiliation', self.creds['endpoint'], affiliation_string, raise_errors),
+                self._search_affiliation, affiliation_string, raise_errors)
+
+        if not items:
+            return None
+        if compact:
+            return [RorMatch.from_json(raw, item=item) for item, raw in items]
+        return [item for item, _ in items]
+
+    def _search_affiliation(self, affiliation_string, raise_errors):
+        if not self.quiet:
+            log("INFO", __name__, f"Searching: {affiliation_string}")
 
         headers = self.get_auth_header()
         req_url = f"{self.creds['endpoint']}/organizations"
         params = {'affiliation': quote(affiliation_string),
                   'single_search': None}
 
-        response = requests.get(
-            req_url, params=params, headers=headers)
+        response = self._request(
+            'affiliation', 'GET', req_url, params=params, headers=headers)
 
         if 200 <= response.status_code <= 299:
-            log("INFO", __name__, f"Req status code: {response.status_code}")
+            if not self.quiet:
+                log("INFO", __name__, f"Req status code: {response.status_code}")
+        elif raise_errors and not response.ok:
+            response.raise_for_status()
         elif response.status_code >= 500:
             log("ERROR", __name__, f"5XX response from ROR API")
         else:
             log("WARN", __name__, f"Non-200 status code: {response.status_code}")
             return None
 
-        body = response.json()
+        items = list(iter_json_array(response.content.decode('utf-8'), 'items'))
         if self.verbose:
+            from pprint import pprint
             log("INFO", __name__, f"Response body:")
-            pprint(body)
+            pprint(response.json())
 
         if self.verbose:
-            for item in body['items']:
+            for item, _ in items:
                 org = item['organization']
                 en_name = [i['value'] for i in org['names']
                            if i['lang'] == 'en']
@@ -111,11 +219,259 @@ class RorApi:
                       f"{org['id']} "
                       f"{en_name}")
 
-        if body['items']:
-            return body['items']
+        if self.affiliation_cache and response.ok:
+            self.affiliation_cache.set(affiliation_string, [item for item, _ in items])
+
+        if items:
+            return items
         else:
             return None
 
+    def match_affiliations(self,
+                           affiliations,
+                           max_workers: int = 8):
+        """
+        A generator matching many affiliation strings concurrently,
+        yielding a compact summary for each input, in input order.
+
+        Inputs are de-duplicated by normalize_affiliation(), so each
+        distinct affiliation is searched once (or not at all, if it's
+        in the cache). Searches share the session's rate limit.
+
+        Usage:
+            for affiliation, match in ror.match_affiliations(affils):
+                print(affiliation, match['org_id'], match['score'])
+
+        :param affiliations: An iterable of affiliation strings.
+        :param max_workers: Max searches in flight at once.
+        :return: A generator of (affiliation string, summary dict) tuples.
+            See summarize_match() for the summary fields. A failed search
+            (an error status, including a 429 still failing after retries,
+            or no response) has org_id None and an error message,
+            and doesn't stop the others.
+        """
+        from itertools import tee
+        from time import perf_counter
+        import requests
+
+        def match(affiliation_string):
+            try:
+                return summarize_match(
+                    self.affiliation_search(affiliation_string, raise_errors=True))
+            except (requests.exceptions.RequestException, ValueError) as e:
+                log("WARN", __name__, f"Search failed: {affiliation_string}: {e}")
+                return dict(summarize_match(None), error=repr(e))
+
+        start = perf_counter()
+        searched = set()
+        total = 0
+
+        def key(affiliation_string):
+            normalized = normalize_affiliation(affiliation_string)
+            searched.add(normalized)
+            return normalized
+
+        # Repeats share the first search's result
+        inputs, to_search = tee(affiliations)
+        for affiliation, summary in zip(inputs, windowed_map(
+                match, to_search, max_workers, window=max_workers * 4, key=key)):
+            total += 1
+            yield affiliation, summary
+
+        if not self.quiet:
+            elapsed = perf_counter() - start
+            log("INFO", __name__,
+                f"Matched {total} affiliations ({len(searched)} distinct) "
+                f"in {elapsed:.1f}s.")
+
+
+class RorMatch:
+    __slots__ = ('org_id', 'name', 'score', 'chosen',
+                 'matching_type', 'substring', '_raw')
+
+    def __init__(self,
+                 org_id: str,
+                 name: str = None,
+                 score: float = None,
+                 chosen: bool = False,
+                 matching_type: str = None,
+                 substring: str = None,
+                 raw: bytes = None):
+        """
+        A compact affiliation_search() result: the fields used for
+        matching, plus optionally the item's JSON as bytes, parsed
+        only when to_dict() is called. Much smaller than the item dict.
+
+        :param org_id: e.g. "https://ror.org/02jbv0t02"
+        :param name: The org's English name.
+        :param score: ROR's match score.
+        :param chosen: Whether ROR chose this org.
+        :param matching_type: e.g. "PHRASE", "COMMON TERMS", "FUZZY"
+        :param substring: The part of the affiliation matched.
+        :param raw: The full item as UTF-8 JSON.
+        """
+        self.org_id = org_id
+        self.name = name
+        self.score = score
+        self.chosen = chosen
+        self.matching_type = matching_type
+        self.substring = substring
+        self._raw = raw
+
+    @classmethod
+    def from_json(cls,
+                  raw,
+                  item: dict = None,
+                  keep_raw: bool = True):
+        """
+        Builds a match from its item's JSON, keeping that JSON
+        as it is, rather than re-serializing a decoded dict.
+
+        :param raw: The item's JSON, as bytes or str,
+            e.g. from misc.iter_json_array().
+        :param item: raw, already decoded, to avoid decoding it again.
+        :param keep_raw: Keep the full item, for to_dict().
+        :return: A RorMatch
+        """
+        import json
+
+        if item is None:
+            item = json.loads(raw)
+        if isinstance(raw, str):
+            raw = raw.encode('utf-8')
+
+        org = item['organization']
+        en_names = [name['value'] for name in org.get('names', [])
+                    if name.get('lang') == 'en']
+        return cls(org['id'],
+                   name=en_names[0] if en_names else None,
+                   score=item.get('score'),
+                   chosen=item.get('chosen', False),
+                   matching_type=item.get('matching_type'),
+                   substring=item.get('substring'),
+                   raw=raw if keep_raw else None)
+
+    @classmethod
+    def from_item(cls,
+                  item: dict,
+                  keep_raw: bool = True):
+        """
+        Builds a match from a decoded item. Keeping the raw JSON
+        means re-serializing the item: use from_json() if the JSON
+        is at hand. Either way, only the retained memory is reduced.
+
+        :param item: An item dict from affiliation_search().
+        :param keep_raw: Keep the full item, for to_dict().
+        :return: A RorMatch
+        """
+        import json
+
+        raw = json.dumps(item, separators=(',', ':')) if keep_raw else None
+        return cls.from_json(raw, item=item, keep_raw=keep_raw)
+
+    def to_dict(self) -> dict:
+        """
+        :return: The full item dict if it was kept,
+            otherwise a dict of the compact fields.
+        """
+        import json
+
+        if self._raw is not None:
+            return json.loads(self._raw)
+        return {'substring': self.substring,
+                'score': self.score,
+                'matching_type': self.matching_type,
+                'chosen': self.chosen,
+                'organization': {'id': self.org_id,
+                                 'names': [{'value': self.name, 'lang': 'en'}]
+                                 if self.name else []}}
+
+    def __repr__(self):
+        return (f"RorMatch({self.org_id!r}, name={self.name!r}, "
+                f"score={self.score!r}, chosen={self.chosen!r})")
+
+
+def summarize_match(items) -> dict:
+    """
+    Reduces affiliation_search() items to the chosen organization.
+    If ROR didn't choose one, the top-scoring candidate is given
+    with chosen False.
+
+    :param items: The items list from affiliation_search(), or None.
+    :return: A dict of {chosen, org_id, score, name (English), candidates}.
+        org_id, score and name are None if there were no items.
+    """
+    summary = {'chosen': False, 'org_id': None, 'score': None,
+               'name': None, 'candidates': len(items) if items else 0}
+    if not items:
+        return summary
+
+    chosen = [item for item in items if item.get('chosen')]
+    item = chosen[0] if chosen else max(items, key=lambda i: i.get('score') or 0)
+    org = item['organization']
+    en_names = [name['value'] for name in org.get('names', [])
+                if name.get('lang') == 'en']
+
+    summary.update(chosen=bool(chosen),
+                   org_id=org['id'],
+                   score=item.get('score'),
+                   name=en_names[0] if en_names else None)
+    return summary
+
+
+def normalize_affiliation(affiliation_string: str) -> str:
+    """
+    Folds an affiliation string to a canonical form for cache keys:
+    accents removed, case-folded, punctuation replaced by spaces,
+    and whitespace collapsed.
+
+    :param affiliation_string: e.g. " Université de Paris-Saclay, FRANCE"
+    :return: e.g. "universite de paris saclay france"
+    """
+    import unicodedata
+
+    folded = unicodedata.normalize('NFKD', affiliation_string)
+    folded = ''.join(c for c in folded if not unicodedata.combining(c)).casefold()
+    folded = ''.join(c if c.isalnum() else ' ' for c in folded)
+    return ' '.join(folded.split())
+
+
+class AffiliationCache(TtlCache):
+
+    def __init__(self,
+                 path: str,
+                 ttl_days: float = 90,
+                 negative_ttl_days: float = 7):
+        """
+        A persistent cache of ROR affiliation search results in an
+        SQLite file, keyed by the normalized affiliation string.
+        Empty results are cached too, for a shorter time.
+        See sqlite_store.TtlCache for stats().
+
+        :param path: Path to the SQLite file. Created if missing.
+        :param ttl_days: How long results with matches are kept.
+        :param negative_ttl_days: How long empty results are kept.
+        """
+        super().__init__(path, 'affiliations', 'affiliation', 'items',
+                         ttl_days=ttl_days, negative_ttl_days=negative_ttl_days)
+
+    def get(self, affiliation_string: str, decode: bool = True) -> tuple:
+        """
+        :param affiliation_string: The affiliation, as given.
+        :param decode: If False, items is returned as its JSON text.
+        :return: A tuple of (found, items). items is None for
+            a cached empty result, or if found is False.
+        """
+        return super().get(normalize_affiliation(affiliation_string), decode)
+
+    def set(self, affiliation_string: str, items: list):
+        """
+        :param affiliation_string: The affiliation, as given.
+        :param items: The search result items. Empty or None is cached
+            as a negative result.
+        """
+        super().set(normalize_affiliation(affiliation_string), items)
+
 #
 # ror = RorApi()
 # test_affils = [
@@ -125,6 +481,5 @@ class RorApi:
 #     "Anderson School of Management",
 #     "Research Institute of Pomology and Floriculture"]
 #
-# for affil in test_affils:
-#     ror.affiliation_search(affil)
-#     sleep(2)
+# for affil, match in ror.match_affiliations(test_affils):
+#     print(affil, match)
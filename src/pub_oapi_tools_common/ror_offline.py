@@ -0,0 +1,502 @@
+"""
+Offline ROR affiliation matching against a local index
+built from a ROR data dump (https://ror.readme.io/docs/data-dump).
+
+build_index() reads the dump once and writes a compact index of
+normalized names and character trigrams to a directory. OfflineRorMatcher
+memory-maps that index, so it starts quickly, shares pages between
+processes, and matches affiliations with no network requests.
+
+Index files (native byte order, see meta.json):
+    orgs.jsonl, orgs.idx     Organization records and their byte offsets.
+    names.txt, names.idx     Normalized names and their byte offsets.
+    names.org, names.type    Each name's org number and name type.
+    exact.*, grams.*         Sorted CRC32 keys of whole names and of
+                             trigrams, with offsets into postings lists
+                             of name numbers.
+"""
+
+from pub_oapi_tools_common.misc import log
+from pub_oapi_tools_common.ror_api import normalize_affiliation, summarize_match
+
+INDEX_VERSION = 1
+
+# Name types, in v2 schema terms, stored as one byte per name
+NAME_TYPES = ['ror_display', 'label', 'alias', 'acronym']
+
+# Longest run of adjacent comma/semicolon-separated parts matched as one
+# name, e.g. "University of California, Los Angeles" (the whole string
+# is always tried too)
+MAX_RUN_PARTS = 3
+# Runs matched by trigram similarity are limited to fewer parts,
+# as fuzzy matching costs far more than an exact lookup
+FUZZY_RUN_PARTS = 2
+
+
+def _grams(text: str) -> set:
+    """
+    :param text: A normalized name or affiliation.
+    :return: The set of character trigrams, padded at the ends.
+    """
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _key(text: str) -> int:
+    from zlib import crc32
+    return crc32(text.encode('utf-8'))
+
+
+def _org_names(org: dict) -> list:
+    """
+    Reads an org's names from either schema version.
+
+    :return: A list of (name, type) tuples.
+    """
+    if 'names' in org:
+        names = []
+        for name in org['names']:
+            types = [t for t in NAME_TYPES if t in name.get('types', [])]
+            names.append((name['value'], types[0] if types else 'alias'))
+        return names
+
+    # v1 schema
+    names = [(org['name'], 'ror_display')]
+    names += [(label['label'], 'label') for label in org.get('labels', [])]
+    names += [(alias, 'alias') for alias in org.get('aliases', [])]
+    names += [(acronym, 'acronym') for acronym in org.get('acronyms', [])]
+    return names
+
+
+def _v2_org(org: dict) -> dict:
+    """
+    Converts a v1 org record to the v2 fields used by affiliation_search()
+    callers (id, names, domains, status, types). v2 records are unchanged.
+    """
+    if 'names' in org:
+        return org
+
+    names = [{'value': org['name'], 'types': ['ror_display', 'label'], 'lang': None}]
+    names += [{'value': label['label'], 'types': ['label'], 'lang': label.get('iso639')}
+              for label in org.get('labels', [])]
+    names += [{'value': alias, 'types': ['alias'], 'lang': None}
+              for alias in org.get('aliases', [])]
+    names += [{'value': acronym, 'types': ['acronym'], 'lang': None}
+              for acronym in org.get('acronyms', [])]
+    return {'id': org['id'],
+            'names': names,
+            'domains': [],
+            'status': org.get('status'),
+            'types': [t.lower() for t in org.get('types', [])]}
+
+
+def _load_dump(dump_path: str) -> list:
+    """
+    :param dump_path: A ROR dump .json file, or the .zip it's released in.
+    :return: The list of org records.
+    """
+    import json
+    import zipfile
+
+    if not zipfile.is_zipfile(dump_path):
+        with open(dump_path, encoding='utf-8') as f:
+            return json.load(f)
+
+    with zipfile.ZipFile(dump_path) as archive:
+        members = [name for name in archive.namelist() if name.endswith('.json')]
+        if not members:
+            raise ValueError(f"No JSON file found in {dump_path}")
+        # Older dumps contain both schemas: prefer v2
+        v2 = [name for name in members if 'v2' in name]
+        with archive.open(v2[0] if v2 else members[0]) as f:
+            return json.load(f)
+
+
+def _write_postings(index_dir: str, prefix: str, postings: dict):
+    """
+    Writes a {key: [name numbers]} dict as sorted keys,
+    offsets (one more than the keys), and postings.
+    """
+    import os
+    from array import array
+
+    keys = array('I', sorted(postings))
+    offsets = array('I', [0])
+    flat = array('I')
+    for key in keys:
+        flat.extend(postings[key])
+        offsets.append(len(flat))
+
+    for suffix, values in (('key', keys), ('off', offsets), ('post', flat)):
+        with open(os.path.join(index_dir, f"{prefix}.{suffix}"), 'wb') as f:
+            values.tofile(f)
+
+
+def build_index(dump_path: str,
+                index_dir: str,
+                include_inactive: bool = False,
+                quiet: bool = False) -> dict:
+    """
+    Builds an offline matching index from a ROR data dump.
+
+    :param dump_path: A ROR dump .json file, or the .zip it's released in.
+    :param index_dir: Directory for the index files. Created if missing;
+        existing index files are replaced.
+    :param include_inactive: Also index withdrawn and inactive orgs.
+    :param quiet: Suppresses non-error logging output.
+    :return: The index metadata (also written to meta.json).
+    """
+    import json
+    import os
+    import sys
+    from array import array
+    from datetime import datetime
+    from time import perf_counter
+
+    start = perf_counter()
+    os.makedirs(index_dir, exist_ok=True)
+
+    if not quiet:
+        log("INFO", __name__, f"Loading ROR dump: {dump_path}")
+    orgs = _load_dump(dump_path)
+
+    name_offsets = array('Q', [0])
+    name_orgs = array('I')
+    name_types = array('B')
+    org_offsets = array('Q', [0])
+    exact = {}
+    grams = {}
+
+    with open(os.path.join(index_dir, 'orgs.jsonl'), 'wb') as orgs_file, \
+            open(os.path.join(index_dir, 'names.txt'), 'wb') as names_file:
+
+        org_number = 0
+        for org in orgs:
+            if not include_inactive and org.get('status', 'active') != 'active':
+                continue
+
+            line = (json.dumps(_v2_org(org), ensure_ascii=False) + '\n').encode('utf-8')
+            orgs_file.write(line)
+            org_offsets.append(org_offsets[-1] + len(line))
+
+            seen = set()
+            for name, name_type in _org_names(org):
+                normalized = normalize_affiliation(name)
+                if not normalized or normalized in seen:
+                    continue
+                seen.add(normalized)
+
+                name_number = len(name_orgs)
+                encoded = normalized.encode('utf-8')
+                names_file.write(encoded)
+                name_offsets.append(name_offsets[-1] + len(encoded))
+                name_orgs.append(org_number)
+                name_types.append(NAME_TYPES.index(name_type))
+
+                exact.setdefault(_key(normalized), array('I')).append(name_number)
+                # Acronyms only match exactly, as their trigrams
+                # are too short to be meaningful
+                if name_type != 'acronym':
+                    for gram in _grams(normalized):
+                        grams.setdefault(_key(gram), array('I')).append(name_number)
+
+            org_number += 1
+
+    if not org_number:
+        raise ValueError(f"No organizations found in {dump_path}")
+
+    for filename, values in (('orgs.idx', org_offsets), ('names.idx', name_offsets),
+                             ('names.org', name_orgs), ('names.type', name_types)):
+        with open(os.path.join(index_dir, filename), 'wb') as f:
+            values.tofile(f)
+    _write_postings(index_dir, 'exact', exact)
+    _write_postings(index_dir, 'grams', grams)
+
+    meta = {'version': INDEX_VERSION,
+            'byteorder': sys.byteorder,
+            'dump': os.path.basename(dump_path),
+            'built_at': datetime.now().isoformat(),
+            'orgs': org_number,
+            'names': len(name_orgs),
+            'grams': len(grams)}
+    with open(os.path.join(index_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=4)
+
+    if not quiet:
+        log("INFO", __name__,
+            f"Indexed {meta['orgs']} orgs, {meta['names']} names and "
+            f"{meta['grams']} trigrams in {perf_counter() - start:.1f}s: {index_dir}")
+
+    return meta
+
+
+class OfflineRorMatcher:
+
+    def __init__(self,
+                 index_dir: str,
+                 min_score: float = 0.5,
+                 chosen_score: float = 0.9,
+                 max_candidates: int = 20,
+                 max_postings: int = 5000,
+                 quiet: bool = False,
+                 verbose: bool = False):
+        """
+        Matches affiliations against an index from build_index(),
+        returning candidates in the same form as RorApi.affiliation_search().
+
+        The affiliation is split on commas and semicolons, and
+        each part is matched against every org name:
+        exactly (score 1.0, including acronyms), then by trigram
+        similarity (the Dice coefficient of the two trigram sets).
+        Each org keeps its best-scoring match.
+
+        :param index_dir: Directory containing the index files.
+        :param min_score: Lowest similarity returned as a candidate.
+        :param chosen_score: The top candidate is marked chosen if it
+            scores at least this, and no other org ties with it.
+        :param max_candidates: Names rescored per part, picked by
+            the number of shared trigrams.
+        :param max_postings: Trigrams found in more names than this
+            (e.g. " un") are too common to pick candidates with.
+        :param quiet: Suppresses non-error logging output.
+        :param verbose: Prints extra debug info.
+        """
+        import json
+        import os
+        import sys
+
+        with open(os.path.join(index_dir, 'meta.json')) as f:
+            self.meta = json.load(f)
+        if self.meta['version'] != INDEX_VERSION or self.meta['byteorder'] != sys.byteorder:
+            raise ValueError(f"Incompatible ROR index, rebuild it: {index_dir}")
+
+        self.index_dir = index_dir
+        self.min_score = min_score
+        self.chosen_score = chosen_score
+        self.max_candidates = max_candidates
+        self.max_postings = max_postings
+        self.quiet = quiet
+        self.verbose = verbose
+
+        self.maps = []
+        self.orgs_text = self._map('orgs.jsonl')
+        self.org_offsets = self._map('orgs.idx', 'Q')
+        self.names_text = self._map('names.txt')
+        self.name_offsets = self._map('names.idx', 'Q')
+        self.name_orgs = self._map('names.org', 'I')
+        self.name_types = self._map('names.type', 'B')
+        self.exact = tuple(self._map(f"exact.{s}", 'I') for s in ('key', 'off', 'post'))
+        self.grams = tuple(self._map(f"grams.{s}", 'I') for s in ('key', 'off', 'post'))
+
+        if not quiet:
+            log("INFO", __name__,
+                f"Loaded ROR index of {self.meta['orgs']} orgs "
+                f"(dump {self.meta['dump']}, built {self.meta['built_at']})")
+
+    def _map(self, filename: str, type_code: str = None):
+        """
+        Memory-maps an index file, read-only.
+
+        :return: A memoryview, cast to type_code if given.
+        """
+        import mmap
+        import os
+
+        with open(os.path.join(self.index_dir, filename), 'rb') as f:
+            if not os.fstat(f.fileno()).st_size:
+                return memoryview(b'').cast(type_code) if type_code else memoryview(b'')
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.maps.append(mapped)
+        view = memoryview(mapped)
+        return view.cast(type_code) if type_code else view
+
+    def close(self):
+        """
+        Releases the memory maps. The matcher can't be used afterwards.
+        """
+        for name in ('orgs_text', 'org_offsets', 'names_text', 'name_offsets',
+                     'name_orgs', 'name_types'):
+            getattr(self, name).release()
+        for view in self.exact + self.grams:
+            view.release()
+        for mapped in self.maps:
+            mapped.close()
+        self.maps = []
+
+    @staticmethod
+    def _postings(postings: tuple, key: int):
+        """
+        :return: The name numbers for a key, as a memoryview slice.
+        """
+        from bisect import bisect_left
+
+        keys, offsets, flat = postings
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            return flat[offsets[i]:offsets[i + 1]]
+        return flat[0:0]
+
+    def _name(self, name_number: int) -> str:
+        return bytes(self.names_text[self.name_offsets[name_number]:
+                                     self.name_offsets[name_number + 1]]).decode('utf-8')
+
+    def get_org(self, org_number: int) -> dict:
+        """
+        :param org_number: An org's position in the index.
+        :return: The org record.
+        """
+        import json
+        return json.loads(bytes(self.orgs_text[self.org_offsets[org_number]:
+                                               self.org_offsets[org_number + 1]]))
+
+    def _match_exact(self, part: str) -> dict:
+        """
+        :param part: A normalized affiliation, or part of one.
+        :return: A dict of {org number: (score, matching type)}
+        """
+        matches = {}
+        for name_number in self._postings(self.exact, _key(part)):
+            # CRC32 keys can collide: check the name itself
+            if self._name(name_number) == part:
+                name_type = NAME_TYPES[self.name_types[name_number]]
+                matches[self.name_orgs[name_number]] = (
+                    1.0, 'ACRONYM' if name_type == 'acronym' else 'EXACT')
+        return matches
+
+    def _match_fuzzy(self, part: str) -> dict:
+        """
+        :param part: A normalized affiliation, or part of one.
+        :return: A dict of {org number: (score, matching type)}
+        """
+        from collections import Counter
+
+        matches = {}
+
+        # Count shared trigrams per name (Counter counts in C)
+        part_grams = _grams(part)
+        shared = Counter()
+        for gram in part_grams:
+            name_numbers = self._postings(self.grams, _key(gram))
+            if len(name_numbers) <= self.max_postings:
+                shared.update(name_numbers)
+
+        for name_number, _ in shared.most_common(self.max_candidates):
+            name_grams = _grams(self._name(name_number))
+            score = 2 * len(part_grams & name_grams) / (len(part_grams) + len(name_grams))
+            org_number = self.name_orgs[name_number]
+            if score >= self.min_score and score > matches.get(org_number, (0,))[0]:
+                matches[org_number] = (score, 'FUZZY')
+
+        return matches
+
+    def affiliation_search(self, affiliation_string: str):
+        """
+        Matches an affiliation string against the local index.
+
+        The whole string, each comma/semicolon-separated part, and runs
+        of adjacent parts (joined back with their separators, as names
+        like "University of California, Berkeley" contain commas) are
+        matched exactly, longest first. The parts of an exact match
+        aren't matched again, so the longest exact match wins. The
+        remaining parts, and pairs of adjacent parts, are then matched
+        by trigram similarity.
+
+        :param affiliation_string: Free text, e.g.
+            "Dept. of Physics, University of Bonn, Germany"
+        :return: A list of items like the ROR API's, best first:
+            {substring, score, matching_type, chosen, organization}.
+            None if there are no candidates.
+        """
+        import re
+
+        # Parts at even positions, separators at odd ones
+        pieces = re.split(r"([,;])", affiliation_string)
+        num_parts = (len(pieces) + 1) // 2
+        runs = {(0, num_parts)}
+        runs.update((start, end) for start in range(num_parts)
+                    for end in range(start + 1, min(start + MAX_RUN_PARTS, num_parts) + 1))
+
+        best = {}
+        covered = set()
+        substrings = {}
+        for fuzzy in (False, True):
+            for start, end in sorted(runs, key=lambda run: (run[0] - run[1], run[0])):
+                if covered.intersection(range(start, end)) or \
+                        (fuzzy and end - start > FUZZY_RUN_PARTS):
+                    continue
+                if (start, end) not in substrings:
+                    substring = ''.join(pieces[2 * start:2 * end - 1]).strip()
+                    substrings[(start, end)] = (substring, normalize_affiliation(substring))
+                substring, normalized = substrings[(start, end)]
+                if not normalized:
+                    continue
+
+                matches = self._match_fuzzy(normalized) if fuzzy else self._match_exact(normalized)
+                if matches and not fuzzy:
+                    covered.update(range(start, end))
+                for org_number, (score, matching_type) in matches.items():
+                    if score > best.get(org_number, (0,))[0]:
+                        best[org_number] = (score, matching_type, substring)
+
+        if not best:
+            if self.verbose:
+                log("DEBUG", __name__, f"No match: {affiliation_string}")
+            return None
+
+        # Best score first, then the longest matched substring
+        def rank_key(item):
+            score, _, substring = item[1]
+            return score, len(substring)
+
+        ranked = sorted(best.items(), key=rank_key, reverse=True)
+        tied = len(ranked) > 1 and rank_key(ranked[1]) == rank_key(ranked[0])
+
+        items = []
+        for rank, (org_number, (score, matching_type, substring)) in enumerate(ranked):
+            items.append({'substring': substring,
+                          'score': round(score, 2),
+                          'matching_type': matching_type,
+                          'chosen': rank == 0 and not tied and score >= self.chosen_score,
+                          'organization': self.get_org(org_number)})
+        return items
+
+    def match_affiliations(self,
+                           affiliations,
+                           memo_size: int = 100000):
+        """
+        A generator matching many affiliation strings, yielding a compact
+        summary for each input, in input order. Repeated inputs
+        (by normalize_affiliation()) are matched once while they're
+        among the memo_size most recently seen, so memory stays
+        bounded however many inputs there are.
+
+        :param affiliations: An iterable of affiliation strings.
+        :param memo_size: Max summaries remembered (least recently used
+            are dropped first).
+        :return: A generator of (affiliation string, summary dict) tuples.
+            See ror_api.summarize_match().
+        """
+        from collections import OrderedDict
+        from time import perf_counter
+
+        start = perf_counter()
+        matched = OrderedDict()
+        searched = 0
+        total = 0
+        for affiliation_string in affiliations:
+            key = normalize_affiliation(affiliation_string)
+            if key in matched:
+                matched.move_to_end(key)
+            else:
+                matched[key] = summarize_match(self.affiliation_search(affiliation_string))
+                searched += 1
+                if len(matched) > memo_size:
+                    matched.popitem(last=False)
+            total += 1
+            yield affiliation_string, matched[key]
+
+        if not self.quiet:
+            elapsed = perf_counter() - start
+            log("INFO", __name__,
+                f"Matched {total} affiliations ({searched} searched) "
+                f"in {elapsed:.1f}s.")
@@ -0,0 +1,80 @@
+"""
+Coalesces identical in-flight calls, so concurrent threads asking
+for the same thing share one request and its result.
+"""
+
+from threading import Event, Lock
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+
+    def __init__(self):
+        """
+        Runs at most one call per key at a time. Threads calling do()
+        with a key that's already in flight wait for that call and get
+        its result (or its exception) instead of making their own.
+
+        Nothing is cached: once a call finishes, the next do() with
+        its key makes a new call. Results are shared, not copied,
+        so callers shouldn't modify them.
+
+        Keys are tuples whose first item names the group the
+        call is counted under in stats(), e.g. ('doi', url, doi).
+        """
+        self.lock = Lock()
+        self.calls = {}
+        self.counts = {}
+
+    def do(self, key: tuple, fn, *args, **kwargs):
+        """
+        Calls fn(*args, **kwargs), unless a call with the same key is
+        already in flight, in which case waits for it and shares its result.
+
+        :param key: A hashable tuple identifying the call.
+            Include everything that affects the result (e.g. the URL).
+        :param fn: The function making the call.
+        :return: fn's return value.
+        """
+        with self.lock:
+            counts = self.counts.setdefault(key[0], {'calls': 0, 'collapsed': 0})
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                counts['calls'] += 1
+                call = self.calls[key] = _Call()
+            else:
+                counts['collapsed'] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+    def stats(self) -> dict:
+        """
+        :return: A dict of {group: {calls, collapsed}}, where calls were
+            sent and collapsed calls shared another call's result.
+        """
+        with self.lock:
+            return {group: dict(counts) for group, counts in self.counts.items()}
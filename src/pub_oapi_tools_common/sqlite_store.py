@@ -0,0 +1,176 @@
+"""
+SQLite helpers for the modules which keep local state:
+caches, submission stores and mirrors.
+"""
+
+from threading import Lock
+
+
+class SqliteStore:
+
+    def __init__(self,
+                 path: str,
+                 schema: list = (),
+                 wal: bool = False):
+        """
+        An SQLite connection shared by all threads, with a lock
+        serializing its use. Subclasses use self.db under self.lock
+        for anything the helper methods don't cover.
+
+        :param path: Path to the SQLite file. Created if missing.
+        :param schema: Statements run on connecting,
+            e.g. "CREATE TABLE IF NOT EXISTS ...".
+        :param wal: Use write-ahead logging, so separate
+            connections can read while this one writes.
+        """
+        import sqlite3
+
+        self.path = path
+        self.lock = Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        if wal:
+            self.db.execute("PRAGMA journal_mode=WAL")
+        for statement in schema:
+            self.db.execute(statement)
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def fetch_one(self, sql: str, params: tuple = ()):
+        """
+        :return: The first row, or None.
+        """
+        with self.lock:
+            return self.db.execute(sql, params).fetchone()
+
+    def fetch_all(self, sql: str, params: tuple = ()) -> list:
+        with self.lock:
+            return self.db.execute(sql, params).fetchall()
+
+    def write(self, sql: str, params: tuple = ()):
+        """
+        Runs one statement and commits it.
+        """
+        with self.lock:
+            self.db.execute(sql, params)
+            self.db.commit()
+
+    def write_many(self, sql: str, rows: list):
+        """
+        Runs one statement per row and commits them together.
+        """
+        with self.lock:
+            self.db.executemany(sql, rows)
+            self.db.commit()
+
+
+class TtlCache(SqliteStore):
+
+    def __init__(self,
+                 path: str,
+                 table: str,
+                 key_column: str,
+                 value_column: str,
+                 ttl_days: float,
+                 negative_ttl_days: float):
+        """
+        A persistent key-value cache in an SQLite table, with values
+        stored as JSON. Entries expire after a TTL. Empty results (None
+        or empty values) are cached too, with a shorter negative TTL.
+
+        :param path: Path to the SQLite file. Created if missing.
+        :param table: The table name.
+        :param key_column: The key column name.
+        :param value_column: The JSON value column name.
+        :param ttl_days: How long values are kept.
+        :param negative_ttl_days: How long empty results are kept.
+        """
+        super().__init__(path, schema=[
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            f"{key_column} TEXT PRIMARY KEY, {value_column} TEXT, "
+            f"fetched_at REAL NOT NULL)"])
+
+        self.ttl = ttl_days * 86400
+        self.negative_ttl = negative_ttl_days * 86400
+        self.select_sql = f"SELECT {value_column}, fetched_at FROM {table} WHERE {key_column} = ?"
+        self.insert_sql = (f"INSERT OR REPLACE INTO {table} ({key_column}, {value_column}, "
+                           f"fetched_at) VALUES (?, ?, ?)")
+        self.counts = {'hits': 0, 'negative_hits': 0, 'misses': 0, 'expired': 0}
+
+    def _lookup(self, key: str, now: float, decode: bool = True) -> tuple:
+        # Call with the lock held
+        import json
+
+        row = self.db.execute(self.select_sql, (key,)).fetchone()
+        if not row:
+            self.counts['misses'] += 1
+            return False, None
+
+        value, fetched_at = row
+        ttl = self.ttl if value is not None else self.negative_ttl
+        if now - fetched_at >= ttl:
+            self.counts['expired'] += 1
+            return False, None
+
+        self.counts['hits' if value is not None else 'negative_hits'] += 1
+        return True, json.loads(value) if value is not None and decode else value
+
+    def get(self, key: str, decode: bool = True) -> tuple:
+        """
+        :param key: The cache key.
+        :param decode: If False, the value is returned as its JSON text.
+        :return: A tuple of (found, value). value is None for
+            a cached empty result, or if found is False.
+        """
+        from time import time
+
+        with self.lock:
+            return self._lookup(key, time(), decode)
+
+    def get_many(self, keys) -> dict:
+        """
+        :param keys: An iterable of cache keys.
+        :return: A dict of {key: value or None} for the unexpired entries.
+        """
+        from time import time
+
+        now = time()
+        results = {}
+        with self.lock:
+            for key in keys:
+                found, value = self._lookup(key, now)
+                if found:
+                    results[key] = value
+        return results
+
+    def set(self, key: str, value):
+        """
+        :param key: The cache key.
+        :param value: A JSON-serializable value. None or empty
+            is cached as an empty result.
+        """
+        self.set_many({key: value})
+
+    def set_many(self, values: dict):
+        """
+        :param values: A dict of {key: value}, as for set().
+        """
+        import json
+        from time import time
+
+        self.write_many(self.insert_sql,
+                        [(key, json.dumps(value) if value else None, time())
+                         for key, value in values.items()])
+
+    def stats(self) -> dict:
+        """
+        :return: The lookup counts, plus hit_rate: the share
+            of lookups answered from the cache.
+        """
+        with self.lock:
+            stats = dict(self.counts)
+        lookups = sum(stats.values())
+        answered = stats['hits'] + stats['negative_hits']
+        stats['hit_rate'] = answered / lookups if lookups else 0.0
+        return stats
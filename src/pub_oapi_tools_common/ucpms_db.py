@@ -6,8 +6,13 @@ Please note that additional work is required from Symplectic
 to allow this connection to occur (e.g. allow-listing IP CIDRs).
 """
 
+from __future__ import annotations
+
 from pub_oapi_tools_common.misc import log
-import pyodbc
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pyodbc
 
 
 def get_connection(creds: dict = None,
@@ -28,6 +33,7 @@ def get_connection(creds: dict = None,
     :param quiet: Suppresses non-error logging output.
     :return: An open pyodbc connection
     """
+    import pyodbc
 
     if not quiet:
         log("INFO", __name__,
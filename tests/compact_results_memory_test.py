@@ -0,0 +1,153 @@
+"""
+Compares the memory held by OSTI.GOV records and ROR affiliation
+matches as the API's dicts against the compact OstiRecord and RorMatch
+objects, built from the response JSON with and without keeping it.
+
+Run directly to print the comparison, or with pytest to check it.
+No network access is needed: the responses are synthetic but
+shaped like the real ones.
+"""
+
+from pub_oapi_tools_common.misc import iter_json_array
+from pub_oapi_tools_common.osti_gov_api import OstiRecord
+from pub_oapi_tools_common.ror_api import RorMatch
+import json
+import tracemalloc
+
+COUNT = 20000
+
+
+def osti_response(i: int) -> bytes:
+    record = {
+        'osti_id': str(1900000 + i),
+        'title': f"Measurement of the neutrino mixing angle in sample {i}",
+        'doi': f"10.1103/PhysRevD.{100 + i % 50}.0{i:05d}",
+        'publication_date': '2024-05-01T00:00:00Z',
+        'entry_date': '2024-06-12T00:00:00Z',
+        'product_type': 'Journal Article',
+        'language': 'English',
+        'country_publication': 'United States',
+        'description': 'We report a measurement of the mixing angle ' * 12,
+        'authors': [f"Author {n}, A. [Lawrence Berkeley National Laboratory]"
+                    for n in range(12)],
+        'subjects': ['72 PHYSICS OF ELEMENTARY PARTICLES AND FIELDS'],
+        'research_orgs': ['Lawrence Berkeley National Laboratory (LBNL), Berkeley, CA'],
+        'sponsor_orgs': ['USDOE Office of Science (SC), High Energy Physics (HEP)'],
+        'doe_contract_number': 'AC02-05CH11231',
+        'journal_name': 'Physical Review D',
+        'journal_volume': str(100 + i % 50),
+        'journal_issue': '9',
+        'links': [{'rel': 'citation', 'href': f"https://www.osti.gov/biblio/{1900000 + i}"},
+                  {'rel': 'fulltext', 'href': f"https://www.osti.gov/servlets/purl/{1900000 + i}"}],
+    }
+    return json.dumps(record).encode('utf-8')
+
+
+def ror_response(i: int) -> bytes:
+    item = {
+        'substring': f"Department of Physics, University {i}",
+        'score': 0.9,
+        'matching_type': 'PHRASE',
+        'chosen': i % 2 == 0,
+        'organization': {
+            'id': f"https://ror.org/0{i:08d}",
+            'names': [{'value': f"University {i}", 'types': ['ror_display', 'label'], 'lang': 'en'},
+                      {'value': f"U{i}", 'types': ['acronym'], 'lang': None},
+                      {'value': f"Universität {i}", 'types': ['label'], 'lang': 'de'}],
+            'domains': [f"u{i}.edu"],
+            'established': 1868,
+            'status': 'active',
+            'types': ['education', 'funder'],
+            'links': [{'type': 'website', 'value': f"https://u{i}.edu"}],
+            'locations': [{'geonames_id': 5327684,
+                           'geonames_details': {'name': 'Berkeley', 'lat': 37.87, 'lng': -122.27,
+                                                'country_code': 'US', 'country_name': 'United States'}}],
+            'external_ids': [{'type': 'grid', 'all': [f"grid.{i}.1"], 'preferred': f"grid.{i}.1"},
+                             {'type': 'isni', 'all': ['0000 0001 2181 7878'], 'preferred': None}],
+            'relationships': [{'type': 'related', 'label': 'Lab', 'id': 'https://ror.org/02jbv0t02'}],
+        },
+    }
+    return json.dumps(item).encode('utf-8')
+
+
+def measure(build) -> int:
+    """
+    :param build: A callable returning the objects to keep.
+    :return: Bytes still allocated while the objects are held.
+    """
+    tracemalloc.start()
+    kept = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return size
+
+
+def compare(count: int = COUNT) -> dict:
+    osti = [osti_response(i) for i in range(count)]
+    ror = [ror_response(i) for i in range(count)]
+    return {
+        'osti_dicts': measure(lambda: [json.loads(raw) for raw in osti]),
+        # Kept JSON is encoded from the response text, as in query_records()
+        'osti_compact': measure(lambda: [OstiRecord.from_json(raw.decode('utf-8')) for raw in osti]),
+        'osti_compact_no_raw': measure(
+            lambda: [OstiRecord.from_json(raw, keep_raw=False) for raw in osti]),
+        'ror_dicts': measure(lambda: [json.loads(raw) for raw in ror]),
+        'ror_compact': measure(lambda: [RorMatch.from_json(raw.decode('utf-8')) for raw in ror]),
+        'ror_compact_no_raw': measure(
+            lambda: [RorMatch.from_json(raw, keep_raw=False) for raw in ror]),
+    }
+
+
+def test_compact_results_use_less_memory():
+    sizes = compare(2000)
+    assert sizes['osti_compact'] < sizes['osti_dicts'] * 0.6
+    assert sizes['osti_compact_no_raw'] < sizes['osti_dicts'] / 10
+    assert sizes['ror_compact'] < sizes['ror_dicts'] / 2
+    assert sizes['ror_compact_no_raw'] < sizes['ror_dicts'] / 10
+
+
+def test_compact_results_round_trip():
+    record = json.loads(osti_response(1))
+    compact = OstiRecord.from_dict(record)
+    assert compact.to_dict() == record
+    assert compact.get('journal_name') == 'Physical Review D'
+    assert compact.fulltext_url == 'https://www.osti.gov/servlets/purl/1900001'
+    assert OstiRecord.from_dict(record, keep_raw=False).to_dict()['doi'] == record['doi']
+
+    item = json.loads(ror_response(2))
+    match = RorMatch.from_item(item)
+    assert match.to_dict() == item
+    assert (match.org_id, match.name, match.chosen) == ('https://ror.org/000000002', 'University 2', True)
+
+
+def test_compact_results_keep_the_response_json():
+    raw = osti_response(3)
+    assert OstiRecord.from_json(raw)._raw is raw
+
+    # Built from slices of a page, each record keeps its JSON as sent
+    records = [osti_response(i) for i in range(3)]
+    page = b'[\n' + b',\n  '.join(records) + b'\n]'
+    compact = [OstiRecord.from_json(raw, record=record)
+               for record, raw in iter_json_array(page.decode('utf-8'))]
+    assert [record._raw for record in compact] == records
+    assert compact[2].osti_id == '1900002'
+
+    items = [ror_response(i) for i in range(2)]
+    body = '{"number_of_results": 2, "meta": {"x": [1, "]"]}, "items": [%s]}' % \
+        ', '.join(item.decode('utf-8') for item in items)
+    matches = [RorMatch.from_json(raw, item=item) for item, raw in iter_json_array(body, 'items')]
+    assert [match._raw for match in matches] == items
+    assert list(iter_json_array('{"items": null}', 'items')) == []
+    assert list(iter_json_array('{"other": []}', 'items')) == []
+
+
+if __name__ == '__main__':
+    sizes = compare()
+    print(f"Memory held by {COUNT} results:")
+    for kind in ('osti', 'ror'):
+        baseline = sizes[f"{kind}_dicts"]
+        for variant in ('dicts', 'compact', 'compact_no_raw'):
+            size = sizes[f"{kind}_{variant}"]
+            print(f"  {kind}_{variant:<16} {size / 1024 ** 2:8.1f} MiB  "
+                  f"({size / baseline:.0%} of dicts)")
@@ -0,0 +1,158 @@
+"""
+Checks the GraphQL batching helpers in eschol_api: merging operations
+into one aliased document, and splitting the response back out.
+No network access is needed.
+"""
+
+from pub_oapi_tools_common import http_transport
+from pub_oapi_tools_common.eschol_api import EscholApi, merge_operations, _has_mutation, _split_batch_result
+import json
+import requests
+
+CREDS = {'endpoint': 'https://example.org/graphql', 'priv-key': 'key', 'cookie': 'cookie'}
+
+
+def test_aliases_and_unaliased_fields():
+    merged = merge_operations([
+        ('{ item(id: "a") { title } }', None),
+        ('query { first: item(id: "b") { title } __typename }', None)])
+    assert 'op0__item: item(id: "a")' in merged['query']
+    assert 'op1__first: item(id: "b")' in merged['query']
+    assert 'op1____typename: __typename' in merged['query']
+    assert 'variables' not in merged
+
+
+def test_variables_and_defaults_are_renamed():
+    merged = merge_operations([
+        ('query Item($input: ItemInput!, $full: Boolean = false, $s: String = "a$b") '
+         '{ item(input: $input) { title } }', {'id': 'a'}),
+        ('query Item($input: ItemInput!) { item(input: $input) { title } }', {'id': 'b'})])
+    assert merged['query'].startswith(
+        'query Batch($input__op0: ItemInput!, $full__op0: Boolean = false, '
+        '$s__op0: String = "a$b", $input__op1: ItemInput!)')
+    assert 'item(input: $input__op0)' in merged['query']
+    assert merged['variables'] == {'input__op0': {'id': 'a'}, 'input__op1': {'id': 'b'}}
+
+
+def test_directives_and_nested_arguments():
+    merged = merge_operations([
+        ('query ($input: Input, $full: Boolean) '
+         '{ unit(filter: {ids: [1, 2], nested: {x: "}", y: $input}}) @include(if: $full) '
+         '{ name } }', {'id': 'a'})])
+    assert ('op0__unit: unit(filter: {ids: [1, 2], nested: {x: "}", y: $input__op0}}) '
+            '@include(if: $full__op0)') in merged['query']
+    # Neither the directive name nor argument names are aliased
+    assert 'op0__include' not in merged['query']
+    assert 'op0__filter' not in merged['query']
+
+
+def test_mutations_are_merged():
+    merged = merge_operations([
+        ('mutation Update($input: UpdateInput!) { updateItem(input: $input) { id } }', {'id': 'a'}),
+        ('mutation Update($input: UpdateInput!) { updateItem(input: $input) { id } }', {'id': 'b'})])
+    assert merged['query'].startswith('mutation Batch(')
+    assert 'op1__updateItem: updateItem(input: $input__op1)' in merged['query']
+
+
+def test_leading_comments_keep_the_operation_type():
+    update = ('# update titles\nmutation Update($input: UpdateInput!) '
+              '{ updateItem(input: $input) { id } }')
+    merged = merge_operations([(update, {'id': 'a'}),
+                               ('mutation { updateItem(input: {}) { id } }', None)])
+    assert merged['query'].startswith('mutation Batch($input__op0: UpdateInput!)')
+
+    api = batch_api([{'data': {'op0__updateItem': {'id': 'a'}}}])
+    results = api.send_batch([(update, {'id': 'a'})])
+    assert api.transport.sent[0]['query'].startswith('mutation Batch(')
+    assert api.transport.requests[0]['idempotent'] is False
+    assert results[0]['data'] == {'updateItem': {'id': 'a'}}
+
+
+def test_split_result_remaps_data_and_errors():
+    body = {'data': {'op0__item': None, 'op0__first': {'title': 'A'}, 'op1__item': {'title': 'B'}},
+            'errors': [{'message': 'Not found', 'path': ['op0__item', 'title']},
+                       {'message': 'Slow down'}]}
+    results = _split_batch_result(body, 2)
+    assert results[0]['data'] == {'item': None, 'first': {'title': 'A'}}
+    assert results[0]['errors'] == [{'message': 'Not found', 'path': ['item', 'title']},
+                                    {'message': 'Slow down'}]
+    assert results[1] == {'data': {'item': {'title': 'B'}}, 'errors': [{'message': 'Slow down'}]}
+
+
+class FakeTransport(http_transport.HttpTransport):
+    """
+    Answers every request with the next of the given response bodies.
+    """
+
+    def __init__(self, bodies: list):
+        super().__init__(quiet=True)
+        self.bodies = list(bodies)
+        self.sent = []
+        self.requests = []
+
+    def request(self, method, url, endpoint=None, idempotent=True, **kwargs):
+        self.sent.append(kwargs['json'])
+        self.requests.append(dict(kwargs, idempotent=idempotent))
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps(self.bodies.pop(0)).encode('utf-8')
+        return response
+
+
+def batch_api(bodies: list) -> EscholApi:
+    return EscholApi(creds=CREDS, transport=FakeTransport(bodies), quiet=True)
+
+
+def test_failed_query_batch_is_resent_singly():
+    failed = {'data': None, 'errors': [{'message': 'Internal error', 'path': ['op1__item']}]}
+    api = batch_api([failed, {'data': {'op0__item': 1}}, {'data': {'op0__item': 2}}])
+    results = api.send_batch([('{ item { id } }', None), ('{ item { id } }', None)])
+    assert len(api.transport.sent) == 3
+    assert [r['data'] for r in results] == [{'item': 1}, {'item': 2}]
+
+
+def test_executed_mutation_batch_is_not_resent():
+    # data: null means execution started (e.g. a non-null field errored)
+    failed = {'data': None, 'errors': [{'message': 'Internal error', 'path': ['op1__update']}]}
+    api = batch_api([failed])
+    mutation = ('mutation { update { id } }', None)
+    results = api.send_batch([mutation, mutation])
+    assert len(api.transport.sent) == 1
+    assert results[0]['data'] is None and results[1]['errors'][0]['path'] == ['update']
+
+
+def test_invalid_mutation_batch_is_resent_singly():
+    # No data key: a validation error, so nothing ran
+    invalid = {'errors': [{'message': 'Cannot query field "updte"'}]}
+    api = batch_api([invalid, {'data': {'op0__update': 1}}, invalid])
+    results = api.send_batch([('mutation { update { id } }', None),
+                              ('mutation { updte { id } }', None)])
+    assert len(api.transport.sent) == 3
+    assert results[0]['data'] == {'update': 1}
+    assert results[1]['data'] is None and results[1]['errors']
+
+
+def test_only_queries_are_retried():
+    assert not _has_mutation('{ item { id } }')
+    assert not _has_mutation('query Q($s: String = "mutation") { mutation_log { id } }')
+    assert not _has_mutation('# mutation\nfragment F on Mutation { id } query { ...F }')
+    assert _has_mutation('mutation Update { update { id } }')
+    assert _has_mutation('fragment F on Item { id }\nmutation { update { ...F } }')
+
+    api = batch_api([{'data': {}}, {'data': {}}, {'data': {'op0__item': 1}}, {'data': {'op0__update': 1}}])
+    api.send_query('{ item { id } }')
+    api.send_query('mutation { update { id } }')
+    api.send_batch([('{ item { id } }', None), ('mutation { update { id } }', None)],
+                   max_batch_size=1)
+    assert [r['idempotent'] for r in api.transport.requests] == [True, False, True, False]
+
+
+def test_creds_are_sent_per_request():
+    transport = FakeTransport([{'data': {}}])
+    api = EscholApi(creds=CREDS, transport=transport, quiet=True)
+    api.send_query('{ item { id } }')
+    # A shared transport's session isn't given the eSchol creds
+    assert 'PRIVILEGED' not in transport.session.headers
+    assert not transport.session.cookies
+    assert transport.requests[0]['headers'] == {'PRIVILEGED': 'key'}
+    assert transport.requests[0]['cookies'] == {'ACCESS_COOKIE': 'cookie'}
@@ -0,0 +1,96 @@
+"""
+Checks that importing the package and its modules stays cheap:
+no 3rd-party packages are imported until they're used.
+
+Run directly to also print each import's time, measured with
+-X importtime. Times vary by machine, so they aren't checked.
+"""
+
+import subprocess
+import sys
+
+# 3rd-party packages which must only be imported on first use
+HEAVY_PACKAGES = ['boto3', 'botocore', 'pymysql', 'pyodbc', 'requests', 'requests_toolbelt']
+
+MODULES = [
+    'pub_oapi_tools_common.aws_cloudwatch_logs',
+    'pub_oapi_tools_common.aws_cloudwatch_metrics',
+    'pub_oapi_tools_common.aws_lambda',
+    'pub_oapi_tools_common.eschol_analytics_db',
+    'pub_oapi_tools_common.eschol_api',
+    'pub_oapi_tools_common.eschol_db',
+    'pub_oapi_tools_common.http_transport',
+    'pub_oapi_tools_common.janeway_db',
+    'pub_oapi_tools_common.osti_elink_api',
+    'pub_oapi_tools_common.osti_elink_bulk',
+    'pub_oapi_tools_common.osti_gov_api',
+    'pub_oapi_tools_common.osti_gov_mirror',
+    'pub_oapi_tools_common.pdf_cache',
+    'pub_oapi_tools_common.pub_oapi_tools_db',
+    'pub_oapi_tools_common.pub_oapi_tools_db_class',
+    'pub_oapi_tools_common.rate_limit',
+    'pub_oapi_tools_common.ror_api',
+    'pub_oapi_tools_common.ror_offline',
+    'pub_oapi_tools_common.single_flight',
+    'pub_oapi_tools_common.sqlite_store',
+    'pub_oapi_tools_common.ucpms_db',
+]
+
+
+def imported_modules(module: str) -> set:
+    """
+    Imports a module in a fresh interpreter.
+
+    :param module: e.g. "pub_oapi_tools_common.misc"
+    :return: The names in sys.modules after the import.
+    """
+    result = subprocess.run(
+        [sys.executable, '-c', f"import sys, {module}; print('\\n'.join(sys.modules))"],
+        capture_output=True, text=True, check=True)
+    return set(result.stdout.split())
+
+
+def import_time(module: str, runs: int = 3) -> float:
+    """
+    Imports a module in a fresh interpreter with -X importtime.
+
+    :param module: e.g. "pub_oapi_tools_common.misc"
+    :param runs: The fastest of this many runs is used.
+    :return: Cumulative milliseconds
+    """
+    best = None
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+                                capture_output=True, text=True, check=True)
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line[len('import time:'):].split('|')
+            if name.strip() == module:
+                best = min(best, int(cumulative)) if best is not None else int(cumulative)
+    return best / 1000
+
+
+def heavy_imports(imported: set) -> list:
+    return sorted(name for name in imported
+                  if name.split('.')[0] in HEAVY_PACKAGES)
+
+
+def test_package_import_is_lazy():
+    for module in ('pub_oapi_tools_common', 'pub_oapi_tools_common.misc'):
+        imported = imported_modules(module)
+        assert module in imported
+        assert not heavy_imports(imported), f"{module} imports {heavy_imports(imported)}"
+
+
+def test_module_imports_are_lazy():
+    for module in MODULES:
+        imported = imported_modules(module)
+        assert module in imported
+        assert not heavy_imports(imported), f"{module} imports {heavy_imports(imported)}"
+
+
+if __name__ == '__main__':
+    for module in ['pub_oapi_tools_common', 'pub_oapi_tools_common.misc'] + MODULES:
+        print(f"{module:<48} {import_time(module):7.1f}ms  "
+              f"{', '.join(heavy_imports(imported_modules(module)))}")
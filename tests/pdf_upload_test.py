@@ -0,0 +1,65 @@
+"""
+Checks how StreamingPdf and PdfCache hand a PDF to an upload:
+downloads without a Content-Length are spooled to a temp file
+rather than held in memory, and a cached file evicted before
+it's opened is fetched again. No network access is needed.
+"""
+
+from pub_oapi_tools_common.osti_elink_api import StreamingPdf
+from pub_oapi_tools_common.pdf_cache import PdfCache
+import io
+import os
+import requests
+
+PDF = b'%PDF-1.4 ' + b'x' * 5000
+
+
+def pdf_response(headers: dict) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response.url = 'https://example.org/file.pdf'
+    response.raw = io.BytesIO(PDF)
+    response.headers.update(headers)
+    return response
+
+
+def test_known_length_streams_from_the_response():
+    pdf = StreamingPdf.from_response(
+        pdf_response({'Content-Length': str(len(PDF))}), checksum='sha256')
+    assert pdf.len == len(PDF)
+    assert pdf.read() == PDF
+    assert pdf.summary()['streamed']
+
+
+def test_unknown_length_is_spooled_to_a_file():
+    response = pdf_response({})
+    pdf = StreamingPdf.from_response(response, checksum='sha256')
+    assert not isinstance(pdf.source, io.BytesIO)
+    assert response._content is False
+    assert pdf.len == len(PDF)
+    assert b''.join(iter(lambda: pdf.read(1024), b'')) == PDF
+    summary = pdf.summary()
+    assert summary['bytes'] == len(PDF) and not summary['streamed']
+    pdf.close()
+    assert pdf.source.closed
+
+
+def test_evicted_file_is_fetched_again(tmp_path):
+    cache = PdfCache(str(tmp_path), quiet=True)
+    path = tmp_path / 'objects' / 'file.pdf'
+    path.write_bytes(PDF)
+    fetched = []
+
+    def fetch(url, headers=None):
+        # The first path is evicted before it can be opened
+        fetched.append(url)
+        return str(path) if len(fetched) > 1 else str(tmp_path / 'objects' / 'gone.pdf')
+
+    cache.fetch = fetch
+    pdf_file = cache.open('https://example.org/file.pdf')
+    os.remove(path)
+    pdf = StreamingPdf.from_file(pdf_file, 'https://example.org/file.pdf')
+    assert len(fetched) == 2
+    assert pdf.len == len(PDF) and pdf.read() == PDF
+    pdf.close()
+    cache.close()
@@ -0,0 +1,138 @@
+"""
+Checks how AdaptiveRateLimiter and TokenBucket react to responses,
+that send_request() always frees the limiter's slot, and that
+AsyncEscholApi's retries are rate limited too.
+No network access is needed.
+"""
+
+from pub_oapi_tools_common import http_transport
+from pub_oapi_tools_common.rate_limit import AdaptiveRateLimiter, TokenBucket
+from pub_oapi_tools_common.eschol_api import AsyncEscholApi
+from time import monotonic
+import asyncio
+import pytest
+import requests
+
+
+def response(status_code: int = 200, **headers) -> requests.Response:
+    r = requests.Response()
+    r.status_code = status_code
+    r.headers.update({name.replace('_', '-'): str(value) for name, value in headers.items()})
+    return r
+
+
+def limiter(**kwargs) -> AdaptiveRateLimiter:
+    return AdaptiveRateLimiter(initial_rate=10.0, initial_concurrency=4, quiet=True, **kwargs)
+
+
+def test_retry_after_429_backs_off():
+    rl = limiter()
+    rl.acquire()
+    rl.release(response(429, Retry_After=30))
+    assert (rl.rate, rl.concurrency, rl.in_flight) == (5.0, 2, 0)
+    assert rl.paused_until > monotonic() + 29
+    assert rl.counts['throttled'] == 1
+
+
+def test_429_with_exhausted_quota_backs_off():
+    rl = limiter()
+    rl.acquire()
+    rl.release(response(429, X_RateLimit_Remaining=0, X_RateLimit_Reset=30))
+    assert (rl.rate, rl.concurrency) == (5.0, 2)
+    assert rl.paused_until > monotonic() + 29
+
+
+def test_backs_off_once_per_pause():
+    rl = limiter()
+    for _ in range(3):
+        rl.acquire()
+    for _ in range(3):
+        rl.release(response(429, Retry_After=30))
+    assert (rl.rate, rl.concurrency) == (5.0, 2)
+    assert rl.counts['throttled'] == 3
+
+
+def test_exhausted_quota_pauses_without_backing_off():
+    rl = limiter()
+    rl.acquire()
+    rl.release(response(200, X_RateLimit_Remaining=0, X_RateLimit_Reset=30))
+    assert (rl.rate, rl.concurrency) == (10.0, 4)
+    assert rl.paused_until > monotonic() + 29
+
+
+def test_remaining_quota_is_spread_until_reset():
+    rl = limiter()
+    rl.acquire()
+    rl.release(response(200, RateLimit_Remaining=60, RateLimit_Reset=30))
+    assert rl.rate == 2.0
+    assert rl.paused_until == 0.0
+
+
+def test_successes_raise_rate_and_concurrency():
+    rl = limiter(increase_every=5)
+    for _ in range(5):
+        rl.acquire()
+        rl.release(response(200))
+    assert (rl.rate, rl.concurrency) == (15.0, 5)
+
+
+def test_failed_request_frees_slot():
+    rl = limiter()
+    rl.acquire()
+    rl.release()
+    assert rl.in_flight == 0
+    assert (rl.rate, rl.concurrency) == (10.0, 4)
+
+
+def test_token_bucket_reserves_in_order():
+    bucket = TokenBucket(rate=10, capacity=2)
+    waits = [bucket.reserve() for _ in range(4)]
+    assert waits[:2] == [0.0, 0.0]
+    assert waits[2] == pytest.approx(0.1, abs=0.01)
+    assert waits[3] == pytest.approx(0.2, abs=0.01)
+
+
+class BrokenSession:
+    def request(self, method, url, **kwargs):
+        raise ValueError("not a requests error")
+
+
+def test_send_request_releases_on_any_exception():
+    rl = limiter()
+    with pytest.raises(ValueError):
+        http_transport.send_request(BrokenSession(), 'GET', 'https://example.org',
+                                    rate_limiter=rl, quiet=True)
+    assert rl.in_flight == 0
+
+
+class FlakySession:
+    def __init__(self):
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        r = response(503 if self.calls == 1 else 200)
+        r._content, r._content_consumed = b'{"data": {}}', True
+        r.request = requests.PreparedRequest()
+        return r
+
+    def close(self):
+        pass
+
+
+def test_async_eschol_retries_take_tokens():
+    async def main():
+        api = AsyncEscholApi(creds={'endpoint': 'https://example.org/graphql',
+                                    'priv-key': 'key', 'cookie': 'cookie'},
+                             requests_per_second=100, backoff_factor=0, quiet=True)
+        api.api.transport.session = session = FlakySession()
+        reserved = []
+        reserve = api.rate_limiter.reserve
+        api.rate_limiter.reserve = lambda: reserved.append(1) or reserve()
+        async with api:
+            r = await api.send_query('{ a }')
+        assert r.status_code == 200
+        assert session.calls == len(reserved) == 2
+        assert api.executor._shutdown
+
+    asyncio.run(main())
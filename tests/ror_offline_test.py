@@ -0,0 +1,122 @@
+"""
+Checks ror_offline against a small ROR dump: building the index,
+then exact, acronym, fuzzy and no-match lookups.
+No network access is needed.
+"""
+
+from pub_oapi_tools_common.ror_offline import build_index, OfflineRorMatcher
+import json
+import pytest
+
+
+def org(ror_id: str, display: str, aliases=(), acronyms=(), status='active') -> dict:
+    names = [{'value': display, 'types': ['ror_display', 'label'], 'lang': 'en'}]
+    names += [{'value': alias, 'types': ['alias'], 'lang': None} for alias in aliases]
+    names += [{'value': acronym, 'types': ['acronym'], 'lang': None} for acronym in acronyms]
+    return {'id': f"https://ror.org/{ror_id}", 'names': names, 'domains': [],
+            'status': status, 'types': ['education']}
+
+
+DUMP = [
+    org('01an7q238', 'University of California, Berkeley', aliases=['UC Berkeley'],
+        acronyms=['UCB']),
+    org('02jbv0t02', 'Lawrence Berkeley National Laboratory', aliases=['Berkeley Lab'],
+        acronyms=['LBNL']),
+    org('046rm7j60', 'University of California, Los Angeles', acronyms=['UCLA']),
+    org('0168r3w48', 'University of California, San Diego', acronyms=['UCSD']),
+    org('00pjdza24', 'University of California System'),
+    org('041nk4h53', 'Lawrence Livermore National Laboratory', acronyms=['LLNL']),
+    org('00f54p054', 'Stanford University'),
+    org('0000000a1', 'Defunct Institute of Testing', status='withdrawn'),
+    # v1 schema
+    {'id': 'https://ror.org/041kmwe10', 'name': 'Université Paris-Saclay',
+     'labels': [], 'aliases': [], 'acronyms': ['UPSaclay'], 'status': 'active',
+     'types': ['Education']},
+]
+
+
+@pytest.fixture
+def matcher(tmp_path):
+    dump_path = tmp_path / 'ror-data.json'
+    dump_path.write_text(json.dumps(DUMP), encoding='utf-8')
+    meta = build_index(str(dump_path), str(tmp_path / 'index'), quiet=True)
+    assert meta['orgs'] == 8
+
+    offline = OfflineRorMatcher(str(tmp_path / 'index'), quiet=True)
+    yield offline
+    offline.close()
+
+
+def test_exact_match(matcher):
+    items = matcher.affiliation_search("Dept. of Physics, Stanford University, CA")
+    assert items[0]['organization']['id'] == 'https://ror.org/00f54p054'
+    assert items[0]['matching_type'] == 'EXACT'
+    assert items[0]['substring'] == 'Stanford University'
+    assert items[0]['score'] == 1.0 and items[0]['chosen']
+
+
+def test_exact_match_is_normalized(matcher):
+    items = matcher.affiliation_search("UNIVERSITE PARIS SACLAY")
+    assert items[0]['organization']['id'] == 'https://ror.org/041kmwe10'
+    assert items[0]['matching_type'] == 'EXACT'
+    # v1 records are returned in the v2 form
+    assert items[0]['organization']['names'][0]['value'] == 'Université Paris-Saclay'
+
+
+def test_names_with_commas_match_exactly(matcher):
+    items = matcher.affiliation_search("University of California, Berkeley")
+    assert items[0]['organization']['id'] == 'https://ror.org/01an7q238'
+    assert items[0]['matching_type'] == 'EXACT' and items[0]['chosen']
+    assert items[0]['substring'] == 'University of California, Berkeley'
+
+
+def test_longest_exact_match_wins(matcher):
+    items = matcher.affiliation_search(
+        "Dept of Physics, University of California, Los Angeles, CA 90095")
+    assert items[0]['organization']['id'] == 'https://ror.org/046rm7j60'
+    assert items[0]['matching_type'] == 'EXACT' and items[0]['chosen']
+    assert items[0]['substring'] == 'University of California, Los Angeles'
+    # Other campuses only come from fuzzy matches of the longer runs
+    assert all(item['matching_type'] == 'FUZZY' and item['score'] < 1.0 for item in items[1:])
+
+
+def test_acronym_match(matcher):
+    items = matcher.affiliation_search("Physics Division; LBNL")
+    assert items[0]['organization']['id'] == 'https://ror.org/02jbv0t02'
+    assert items[0]['matching_type'] == 'ACRONYM'
+    assert items[0]['chosen']
+
+
+def test_fuzzy_match(matcher):
+    items = matcher.affiliation_search("Lawrence Berkley Natl Laboratory")
+    assert items[0]['organization']['id'] == 'https://ror.org/02jbv0t02'
+    assert items[0]['matching_type'] == 'FUZZY'
+    assert 0.5 <= items[0]['score'] < 1.0
+    # Livermore is a weaker candidate
+    assert all(item['score'] < items[0]['score'] for item in items[1:])
+
+
+def test_no_match(matcher):
+    assert matcher.affiliation_search("Qwxz Zyxv") is None
+    # Inactive orgs aren't indexed by default
+    assert matcher.affiliation_search("Defunct Institute of Testing") is None
+
+
+def test_match_affiliations_summaries(matcher):
+    results = list(matcher.match_affiliations(["LLNL", "llnl", "Qwxz Zyxv"]))
+    assert [affiliation for affiliation, _ in results] == ["LLNL", "llnl", "Qwxz Zyxv"]
+    assert results[0][1]['org_id'] == 'https://ror.org/041nk4h53'
+    assert results[1][1] is results[0][1]
+    assert results[2][1]['org_id'] is None
+
+
+def test_match_affiliations_memo_is_bounded(matcher):
+    searched = []
+    search = matcher.affiliation_search
+    matcher.affiliation_search = lambda s: searched.append(s) or search(s)
+    inputs = ["LLNL", "UCLA", "llnl", "UCSD", "LLNL", "UCLA"]
+    results = list(matcher.match_affiliations(inputs, memo_size=2))
+    assert [summary['org_id'] for _, summary in results][:2] == [
+        'https://ror.org/041nk4h53', 'https://ror.org/046rm7j60']
+    # "UCLA" was dropped as least recently used, "LLNL" was kept
+    assert searched == ["LLNL", "UCLA", "UCSD", "UCLA"]
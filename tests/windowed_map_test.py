@@ -0,0 +1,57 @@
+"""
+Checks misc.windowed_map(): results come back in input order,
+the window bounds how far ahead items are read, and items
+with the same key share one call.
+"""
+
+from pub_oapi_tools_common.misc import windowed_map
+from threading import Lock
+from time import sleep
+import pytest
+
+
+def test_results_are_in_input_order():
+    def slow_for_small(n):
+        sleep(0.01 * (5 - n))
+        return n * 10
+    assert list(windowed_map(slow_for_small, range(5), max_workers=5)) == [0, 10, 20, 30, 40]
+
+
+def test_window_bounds_items_read_ahead():
+    read = []
+
+    def items():
+        for n in range(100):
+            read.append(n)
+            yield n
+
+    results = windowed_map(lambda n: n, items(), max_workers=2, window=4)
+    assert next(results) == 0
+    assert len(read) == 4
+    results.close()
+
+
+def test_same_key_shares_one_call():
+    calls = []
+    lock = Lock()
+
+    def call(s):
+        with lock:
+            calls.append(s)
+        return s.upper()
+
+    results = list(windowed_map(call, ['a', 'A', 'b', 'a'], max_workers=2, key=str.lower))
+    assert results == ['A', 'A', 'B', 'A']
+    assert sorted(calls) == ['a', 'b']
+
+
+def test_exceptions_are_raised_in_order():
+    def fail_on_two(n):
+        if n == 2:
+            raise ValueError(n)
+        return n
+
+    results = windowed_map(fail_on_two, range(5), max_workers=2)
+    assert [next(results), next(results)] == [0, 1]
+    with pytest.raises(ValueError):
+        next(results)